@@ -0,0 +1,148 @@
+'''
+Author: Yunpeng Shi
+Description: 流式规划 + 提前分发 - 在 Planner 的 tool-call 参数流中逐个解析 Task，解析完一个就立刻启动对应 Worker
+'''
+import asyncio
+import json
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from langchain_core.runnables import RunnableConfig, RunnableLambda
+from langchain_core.runnables.config import ensure_config, merge_configs, patch_config
+from state import WorkerState
+from utils import logger
+
+WorkerFn = Callable[[WorkerState], Awaitable[Dict[str, Any]]]
+
+# 未被图节点认领的提前执行结果最多保留多久（秒），防止异常中断的请求泄漏协程
+STALE_RUN_SECONDS = 300
+
+
+class TaskStreamParser:
+    """
+    增量解析 `{"tasks": [{...}, {...}]}` 形式的 JSON 参数流。
+    每次 feed 一段参数片段，返回本次新出现的、已经闭合的完整 task 对象。
+    只追踪括号深度与字符串转义状态，不依赖完整 JSON。
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._pos = 0
+        self._stack: List[str] = []
+        self._in_string = False
+        self._escape = False
+        self._obj_start: Optional[int] = None
+
+    def feed(self, fragment: str) -> List[Dict[str, Any]]:
+        if not fragment:
+            return []
+        self._buffer += fragment
+        completed = []
+        buf = self._buffer
+        for i in range(self._pos, len(buf)):
+            ch = buf[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                continue
+
+            if ch == '"':
+                self._in_string = True
+            elif ch in "{[":
+                # 顶层对象 -> tasks 数组 -> 单个 task 对象
+                if ch == "{" and self._stack == ["{", "["]:
+                    self._obj_start = i
+                self._stack.append(ch)
+            elif ch in "}]":
+                if self._stack:
+                    self._stack.pop()
+                if ch == "}" and self._stack == ["{", "["] and self._obj_start is not None:
+                    raw = buf[self._obj_start:i + 1]
+                    self._obj_start = None
+                    try:
+                        completed.append(json.loads(raw))
+                    except json.JSONDecodeError:
+                        logger.warning(f"[EarlyDispatch] 跳过无法解析的任务片段: {raw[:80]}")
+        self._pos = len(buf)
+        return completed
+
+    @property
+    def buffer(self) -> str:
+        return self._buffer
+
+
+# --- 提前执行注册表 ---
+_workers: Dict[str, WorkerFn] = {}
+_early_runs: Dict[Tuple[str, str], Tuple[float, asyncio.Task]] = {}
+
+
+def _run_key(config: Optional[RunnableConfig], task_id: str) -> Tuple[str, str]:
+    thread_id = ((config or {}).get("configurable") or {}).get("thread_id", "")
+    return str(thread_id), task_id
+
+
+def _purge_stale():
+    now = time.monotonic()
+    for key, (started, run) in list(_early_runs.items()):
+        if now - started > STALE_RUN_SECONDS:
+            _early_runs.pop(key, None)
+            if not run.done():
+                run.cancel()
+            logger.warning(f"[EarlyDispatch] 清理未被认领的提前任务: {key[1]}")
+
+
+def _worker_config(name: str, task_id: str, config: Optional[RunnableConfig]) -> RunnableConfig:
+    """
+    提前执行的运行配置：沿用请求的回调与 thread_id，但 run_name / metadata 标明所属 Worker，
+    否则 Worker 内的模型调用与工具事件会被记在 Supervisor 名下
+    """
+    base = patch_config(ensure_config(config), run_name=f"{name}.early")
+    return merge_configs(base, {"metadata": {"langgraph_node": name, "early_dispatch": True, "task_id": task_id}})
+
+
+def bind_worker(name: str, worker: WorkerFn):
+    """
+    注册 Worker 并返回图节点函数。
+    节点被 Send 调起时，若该任务已被 Supervisor 提前启动，则直接等待已有结果，不重复执行。
+    """
+    _workers[name] = worker
+
+    async def node(state: WorkerState, config: RunnableConfig):
+        task_id = state["task"].get("id")
+        entry = _early_runs.pop(_run_key(config, task_id), None) if task_id else None
+        if entry is None:
+            return await worker(state)
+        return await entry[1]
+
+    node.__name__ = name
+    return node
+
+
+def schedule(task: Dict[str, Any], messages: list, config: Optional[RunnableConfig]) -> bool:
+    """在 Supervisor 节点内提前启动一个 Worker，返回是否成功调度。"""
+    worker = _workers.get(task.get("task_type"))
+    if worker is None or not task.get("id"):
+        return False
+    _purge_stale()
+    key = _run_key(config, task["id"])
+    if key in _early_runs:
+        return False
+    # 传入看板任务的副本，避免 Worker 原地修改影响 Supervisor 返回的看板
+    state: WorkerState = {"task": dict(task), "messages": list(messages)}
+    name = task["task_type"]
+    run = RunnableLambda(worker, name=name).ainvoke(state, config=_worker_config(name, task["id"], config))
+    _early_runs[key] = (time.monotonic(), asyncio.create_task(run))
+    logger.info(f"[EarlyDispatch] 提前启动任务: ID={task['id']} 类型={task['task_type']}")
+    return True
+
+
+def discard(task_ids: List[str], config: Optional[RunnableConfig]):
+    """规划被中断 (如客户端断开导致 Supervisor 被取消) 时取消已经提前启动的任务。"""
+    for task_id in task_ids:
+        entry = _early_runs.pop(_run_key(config, task_id), None)
+        if entry and not entry[1].done():
+            entry[1].cancel()
@@ -3,95 +3,86 @@ Author: Yunpeng Shi
 Description: 规章判定智能体 - 适配 Title/Content 结构化思考流
 '''
 import os
-from typing import Annotated, List, TypedDict
 
+import knowledge_domains
+import prompts
+import regulation_splitter
+import tool_cache
 import utils
-from langchain_core.messages import (AIMessage, BaseMessage, HumanMessage,
-                                     SystemMessage)
+from agents.react_engine import ReactEngine
+from langchain_core.messages import HumanMessage
 from langchain_core.tools import tool
-from langgraph.graph import START, StateGraph
-from langgraph.graph.message import add_messages
-from langgraph.prebuilt import ToolNode, tools_condition
 from state import WorkerState
 
 
 @tool
+@tool_cache.cached_tool("policy_checker", ttl=None,
+                        version_fn=utils.knowledge_index_version,
+                        cache_if=utils.knowledge_result_cacheable)
 async def policy_checker(query: str) -> str:
     """
     专门用于检索杭州地铁的官方规章制度、乘客守则、法律条文。
     当涉及“是否允许”、“处罚标准”、“官方定义”时使用。
     """
+    # 明确引用了条号 (如“第二十条说了什么”) 时先查条文索引，问题的其余部分仍走向量检索
+    articles = regulation_splitter.article_index.find(query)
+    cited = [_format_article(entry) for entry in articles]
+
     store = utils.get_vector_store()
     if not store:
-        return "系统提示：规章数据库暂时不可用。"
+        return "\n\n".join(cited) if cited else "系统提示：规章数据库暂时不可用。"
 
-    try:
+    def search(store):
         retriever = store.as_retriever(
             search_type="similarity",
-            search_kwargs={"k": 2}
+            # 只检索规章领域的分区
+            search_kwargs=knowledge_domains.search_kwargs(store, "policy_checker", k=2)
         )
-        docs = await retriever.ainvoke(query)
-        if not docs:
+        return retriever.ainvoke(query)
+
+    try:
+        # Milvus 检索失败或熔断时改用本地快照
+        docs, from_snapshot = await utils.search_vector_store(store, search)
+        if articles:
+            # 已直查给出的条文不再重复
+            seen = {(regulation_splitter.regulation_name(entry["source"]), entry["article"]) for entry in articles}
+            docs = [doc for doc in docs
+                    if (regulation_splitter.regulation_name(regulation_splitter.source_of(doc.metadata)),
+                        doc.metadata.get("article")) not in seen]
+        if not docs and not cited:
             return "【查询结果】未找到对应的官方条文。请基于通用安全常识进行判定。"
         
-        return "\n\n".join([f"【官方条文】: {doc.page_content}" for doc in docs])
+        results = cited + [f"【官方条文】: {doc.page_content}" for doc in docs]
+        if from_snapshot and docs:
+            results.append(utils.SNAPSHOT_NOTE)
+        return "\n\n".join(results)
     except Exception as e:
+        if cited:
+            return "\n\n".join(cited)
         return f"查询异常: {str(e)}"
 
-tools = [policy_checker]
-llm_with_tools = utils.llm.bind_tools(tools)
-
-class SubAgentState(TypedDict):
-    messages: Annotated[List[BaseMessage], add_messages]
 
-def call_model(state: SubAgentState):
-    return {"messages": [llm_with_tools.invoke(state["messages"])]}
+def _format_article(entry: dict) -> str:
+    """直查条文带上所属规章与章节，多部规章有同号条文时可以区分"""
+    name = regulation_splitter.regulation_name(entry["source"])
+    label = " ".join(part for part in (f"《{name}》" if name else "", entry["chapter"]) if part)
+    return f"【官方条文】({label}): {entry['text']}" if label else f"【官方条文】: {entry['text']}"
 
-worker_workflow = StateGraph(SubAgentState)
-worker_workflow.add_node("model", call_model)
-worker_workflow.add_node("tools", ToolNode(tools))
-worker_workflow.add_edge(START, "model")
-worker_workflow.add_conditional_edges("model", tools_condition)
-worker_workflow.add_edge("tools", "model")
-react_app = worker_workflow.compile()
+tools = [policy_checker]
+react_app = ReactEngine("judge_agent", tools)
 
 async def judge_agent(state: WorkerState):
     task = state["task"]
     isolated_input = task['input_content']
     global_messages = state.get("messages", [])
-    
-    # --- 核心修改：System Prompt 适配结构化思考格式 ---
-    system_prompt = """
-    你是杭州地铁的**合规与规章制度专家**。你的职责是依据官方准则对用户的行为或疑问做出权威判定。
-    
-    ### 🧠 你的思考模式 (Structured Thinking)
-    在给出判定结论前，你必须严格按照以下格式展示你的推理过程。你可以输出多个 Title/Content 块来展示不同的思考阶段：
-    
-    Title: <简短标题，如：识别判定关键点 / 检索官方依据 / 综合风险评估>
-    Content: <具体的思考内容，详细描述你如何解读规章、如何匹配条文以及你的逻辑推演过程>
-
-    **输出示例：**
-    Title: 识别判定关键点
-    Content: 用户询问是否可以在车厢内进食。这涉及到《杭州市地铁乘车规则》中关于环境卫生的限制条款。
-    
-    Title: 检索官方依据
-    Content: 我需要调用 `policy_checker` 来确认是否有明确的“禁食”规定，以及是否有特殊的例外情况（如婴儿、病人）。
-    
-    Title: 最终判定逻辑
-    Content: 根据检索到的条文，除特殊人群外，车厢内禁止进食。我将以此为基础整理事实。
 
-    ### 🛡️ 业务规则：
-    1. **权威性**：所有判定必须尽量寻找官方依据，优先调用 `policy_checker`。
-    2. **客观性**：不要带有个人感情色彩，只陈述规章允许或禁止的内容。
-    3. **输出格式**：必须展示思考过程，严格遵守 `Title: ... \n Content: ...`。最终提交给 Responder 的应该是清晰的事实判定。
-    """
-    
+    # 静态前缀 -> 历史 -> 本次任务输入，保证前缀可被缓存
     inputs = {
-        "messages": [
-            SystemMessage(content=system_prompt),
-            *global_messages[:-1],
-            HumanMessage(content=isolated_input)
-        ]
+        "messages": prompts.assemble(
+            "judge_agent",
+            history=global_messages[:-1],
+            volatile=[HumanMessage(content=isolated_input)],
+        )
     }
     
     # 执行 ReAct 流程
@@ -99,13 +90,13 @@ async def judge_agent(state: WorkerState):
     final_content = result["messages"][-1].content
     
     # 更新任务看板
-    updated_task = utils.update_task_result(task, result=final_content)
+    task_update = utils.update_task_result(task, result=final_content)
     
-    # 计算需要同步回全局状态的增量消息
+    # 计算增量消息 (写入本轮的 worker_trace，不进入全局 messages)
     input_len = len(inputs["messages"])
     generated_messages = result["messages"][input_len:]
 
     return {
-        "task_board": [updated_task],
-        "messages": generated_messages
+        **task_update,
+        "worker_trace": generated_messages
     }
\ No newline at end of file
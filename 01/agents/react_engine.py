@@ -0,0 +1,139 @@
+'''
+Author: Yunpeng Shi
+Description: Worker 通用 ReAct 执行引擎 - 步数上限、单工具超时、同一轮多个工具调用并发执行
+'''
+import asyncio
+import os
+import time
+from typing import Annotated, Dict, List, Optional, TypedDict
+
+import metrics
+import prompts
+import utils
+from langchain_core.messages import (AIMessage, BaseMessage, RemoveMessage,
+                                     SystemMessage, ToolMessage)
+from langchain_core.tools import BaseTool
+from langgraph.graph import END, START, StateGraph
+from langgraph.graph.message import add_messages
+
+# 默认配置，可通过环境变量按部署调整
+DEFAULT_MAX_STEPS = int(os.getenv("REACT_MAX_STEPS", "6"))
+DEFAULT_TOOL_TIMEOUT = float(os.getenv("REACT_TOOL_TIMEOUT", "15"))
+
+BUDGET_EXHAUSTED_PROMPT = (
+    "【系统提示】工具调用次数已达上限，禁止再调用任何工具。"
+    "请基于以上已获得的信息，直接给出最终结论；信息不足之处请如实说明。"
+)
+
+
+class ReactState(TypedDict):
+    messages: Annotated[List[BaseMessage], add_messages]
+    steps: int
+
+
+class ReactEngine:
+    """
+    model -> tools -> model 循环的共享实现。
+    - 每次调用模型计为一步，超过 max_steps 后强制模型不带工具给出最终答复
+    - 同一轮模型返回的多个工具调用并发执行，每个工具有独立超时
+    - 每次执行结束后按 agent 记录步数，便于调参
+    """
+
+    def __init__(self, name: str, tools: List[BaseTool], max_steps: Optional[int] = None,
+                 tool_timeout: Optional[float] = None, tool_timeouts: Optional[Dict[str, float]] = None,
+                 llm=None):
+        self.name = name
+        self.tools = {t.name: t for t in tools}
+        self.max_steps = max_steps or DEFAULT_MAX_STEPS
+        self.tool_timeout = tool_timeout or DEFAULT_TOOL_TIMEOUT
+        self.tool_timeouts = tool_timeouts or {}
+        self._llm = llm
+        self._llm_with_tools = None
+        self.app = self._build()
+
+    # 延迟绑定工具，避免导入阶段就构造模型
+    @property
+    def llm(self):
+        return self._llm or utils.get_llm(self.name)
+
+    @property
+    def llm_with_tools(self):
+        if self._llm_with_tools is None:
+            self._llm_with_tools = self.llm.bind_tools(list(self.tools.values()))
+        return self._llm_with_tools
+
+    def _build(self):
+        workflow = StateGraph(ReactState)
+        workflow.add_node("model", self._call_model)
+        workflow.add_node("tools", self._call_tools)
+        workflow.add_node("finalize", self._finalize)
+        workflow.add_edge(START, "model")
+        workflow.add_conditional_edges("model", self._route, ["tools", "finalize", END])
+        workflow.add_edge("tools", "model")
+        workflow.add_edge("finalize", END)
+        return workflow.compile()
+
+    async def _call_model(self, state: ReactState):
+        response = await self.llm_with_tools.ainvoke(state["messages"])
+        prompts.record_usage(self.name, response)
+        return {"messages": [response], "steps": state.get("steps", 0) + 1}
+
+    def _route(self, state: ReactState):
+        last = state["messages"][-1]
+        if not isinstance(last, AIMessage) or not last.tool_calls:
+            return END
+        if state.get("steps", 0) >= self.max_steps:
+            return "finalize"
+        return "tools"
+
+    async def _run_tool(self, tool_call: dict) -> ToolMessage:
+        name = tool_call["name"]
+        tool = self.tools.get(name)
+        if tool is None:
+            return ToolMessage(content=f"工具 {name} 不存在，请勿重复调用。",
+                               tool_call_id=tool_call["id"], name=name, status="error")
+
+        timeout = self.tool_timeouts.get(name, self.tool_timeout)
+        start = time.perf_counter()
+        try:
+            result = await asyncio.wait_for(tool.ainvoke({**tool_call, "type": "tool_call"}), timeout=timeout)
+        except asyncio.TimeoutError:
+            metrics.incr("react_tool_timeouts", agent=self.name, tool=name)
+            utils.logger.warning(f"[{self.name}] 工具 {name} 超时 ({timeout}s)")
+            return ToolMessage(content=f"工具 {name} 执行超时（{timeout}秒），请基于已有信息继续。",
+                               tool_call_id=tool_call["id"], name=name, status="error")
+        except Exception as e:
+            utils.logger.error(f"[{self.name}] 工具 {name} 执行失败: {e}")
+            return ToolMessage(content=f"工具 {name} 执行失败: {e}",
+                               tool_call_id=tool_call["id"], name=name, status="error")
+        finally:
+            metrics.observe("react_tool_latency_ms", (time.perf_counter() - start) * 1000, tool=name)
+
+        if isinstance(result, ToolMessage):
+            return result
+        return ToolMessage(content=str(result), tool_call_id=tool_call["id"], name=name)
+
+    async def _call_tools(self, state: ReactState):
+        tool_calls = state["messages"][-1].tool_calls
+        results = await asyncio.gather(*(self._run_tool(tc) for tc in tool_calls))
+        return {"messages": list(results)}
+
+    async def _finalize(self, state: ReactState):
+        """步数耗尽：撤回悬空的工具调用消息，不带工具再问一次模型"""
+        dangling = state["messages"][-1]
+        history = state["messages"][:-1] + [SystemMessage(content=BUDGET_EXHAUSTED_PROMPT)]
+        response = await self.llm.ainvoke(history)
+        prompts.record_usage(self.name, response)
+        metrics.incr("react_budget_exhausted", agent=self.name)
+        return {"messages": [RemoveMessage(id=dangling.id), response]}
+
+    async def ainvoke(self, inputs: dict, config=None) -> dict:
+        # 每步最多经过 model/tools 两个节点，额外留出 finalize 的余量
+        # run_name 便于在事件流/追踪中区分各 Worker 的 ReAct 子图
+        # 调用方配置在前，步数上限与 run_name 最后设置，不会被父图传入的 recursion_limit 等覆盖
+        run_config = {**(config or {}), "recursion_limit": self.max_steps * 2 + 5, "run_name": f"{self.name}.react"}
+        result = await self.app.ainvoke({**inputs, "steps": 0}, config=run_config)
+        steps = result.get("steps", 0)
+        metrics.observe("react_steps", steps, agent=self.name)
+        utils.logger.info(f"[{self.name}] ReAct 结束，共 {steps} 步")
+        return result
@@ -10,58 +10,123 @@ Description: 这是默认设置,请设置`customMade`, 打开koroFileHeader查
 Author: Yunpeng Shi
 Description: 通用汇总智能体 - 负责整合多任务结果并进行润色
 '''
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import metrics
+import prompts
+import utils
+from langchain_core.callbacks import adispatch_custom_event
 from langchain_core.messages import AIMessage, SystemMessage
-from state import agentState
-from utils import llm
+from langgraph.config import get_stream_writer
+from state import TaskBoard, agentState, board_tasks, task_result
+from utils import logger
 
+# --- 直出策略 (Bypass) ---
+# off: 始终由 LLM 汇总; single: 单任务且结果可直接给用户时跳过汇总
+BYPASS_MODE = os.getenv("RESPONDER_BYPASS", "single")
+BYPASS_MAX_CHARS = int(os.getenv("RESPONDER_BYPASS_MAX_CHARS", "1500"))
+BYPASS_TASK_TYPES = set(
+    os.getenv("RESPONDER_BYPASS_TASK_TYPES", "general_chat,ticket_agent,complaint_agent,judge_agent,manager_agent").split(",")
+)
+# 直出时每个 SSE 分片的字符数
+BYPASS_CHUNK_CHARS = 48
 
-async def responder_agent(state: agentState):
-    board = state.get("task_board", [])
-    
-    # 1. 拼接上下文（让汇总模型看清楚每个部门干了什么）
-    results_context = "【⬇️ 任务执行报告 - 供参考 ⬇️】:\n"
-    for i, task in enumerate(board):
-        res = task.get("result", "未提供有效执行结果")
-        results_context += f">>> [任务 {i+1}] 类型: {task.get('task_type')}\n描述: {task.get('description', '')}\n输出结果: {res}\n\n"
+# 结果中出现这些标记说明任务失败或降级，需要 LLM 以抱歉口吻补充说明
+FAILURE_MARKERS = ("系统错误", "系统提示", "查询异常", "暂时不可用", "执行失败", "执行超时", "未提供有效执行结果")
+# 结果仍带有结构化思考标签，说明不是整理好的最终答复
+THOUGHT_MARKERS = ("Title:", "Content:")
 
-    # 2. 核心 Prompt 修改
-    system_prompt = """
-    你是**全能私人助理的首席协调官**。
-    你的任务是将后台各个专业助手（如搜索、代码、知识库助手）的执行结果，整合并翻译成一段自然、流畅、专业且温暖的最终答复。
 
-    ### 🧠 你的思考模式 (Structured Thinking)
-    在输出最终回复之前，你必须展示你的逻辑推演过程：
-    **严格遵守格式：Title: <标题> 换行 Content: <思考内容>**
+def user_answer(result: Optional[str]) -> str:
+    """
+    取出可直接给用户的答复：Worker 按提示词在思考块之后以 FINAL_ANSWER_MARKER 给出最终答复时取最后一段，
+    否则原样返回 (仍带思考标签的结果由 bypass_decision 判为 not_user_ready)
+    """
+    result = (result or "").strip()
+    _, marker, answer = result.rpartition(prompts.FINAL_ANSWER_MARKER)
+    return answer.strip() if marker else result
 
-    Title: 信息一致性检查
-    Content: 我需要核对各个助手提供的数据（如时间、价格、技术参数）是否冲突。如果有冲突，以知识库或搜索助手的最新结果为准。
-    
-    Title: 结构化整合策略
-    Content: 用户的问题包含多个维度，我将按照“核心结论 -> 详细细节 -> 后续建议”的逻辑进行组织，确保回复不显得杂乱。
 
-    ### 🛡️ 核心准则：
-    1. **引用保护 (最高优先级)**：
-       - 如果子任务结果中包含 `[参考资料]`、`【📚来源】` 或 `(Source: ...)` 等标记，**绝对禁止删除或修改这些标记**。它们是信任的基石。
-    
-    2. **数据忠实性**：
-       - 禁止修改任何具体的数字、链接、专有名词或代码片段。你只能优化语气，不能改动事实。
+def bypass_decision(board: Union[TaskBoard, List[Dict[str, Any]]],
+                    results: Optional[Dict[str, str]] = None) -> Tuple[bool, str]:
+    """判断本轮是否可以直接把 Worker 结果作为最终回复，返回 (是否直出, 原因)"""
+    if BYPASS_MODE != "single":
+        return False, "disabled"
+    tasks = board_tasks(board)
+    if len(tasks) != 1:
+        return False, "multi_task"
+    task = tasks[0]
+    result = (task_result(task, results) or "").strip()
+    answer = user_answer(result)
+    if task.status != "done" or not result:
+        return False, "failed_task"
+    if any(marker in result for marker in FAILURE_MARKERS):
+        return False, "failed_task"
+    if task.task_type not in BYPASS_TASK_TYPES:
+        return False, "task_type"
+    if len(answer) > BYPASS_MAX_CHARS:
+        return False, "too_long"
+    if not answer or any(marker in answer for marker in THOUGHT_MARKERS):
+        return False, "not_user_ready"
+    return True, "single_task"
 
-    3. **拟人化包装**：
-       - 避免使用“任务1已完成”这种机械的表述。
-       - 使用：“我为您查询到了...”、“综合来看...”、“建议您接下来可以...”等自然的过渡语。
 
-    4. **异常处理**：
-       - 如果某个子任务失败了（结果为“无结果”），请以抱歉的口吻说明原因，并基于其他成功任务的信息给出补充建议。
+async def stream_bypass(content: str):
     """
+    分片推送直出内容，graph_stream 将其转为 message 事件：
+    astream_events 通过自定义回调事件接收，轻量模式 (astream custom 流) 通过 stream writer 接收；
+    未订阅 custom 流时 writer 为空操作，两条通道不会重复
+    """
+    writer = get_stream_writer()
+    for i in range(0, len(content), BYPASS_CHUNK_CHARS):
+        piece = content[i:i + BYPASS_CHUNK_CHARS]
+        await adispatch_custom_event("responder_chunk", {"content": piece})
+        writer({"event": "responder_chunk", "content": piece})
+
+
+async def responder_agent(state: agentState):
+    board = board_tasks(state.get("task_board"))
+    results = state.get("task_results") or {}
+
+    bypass, reason = bypass_decision(board, results)
+    metrics.incr("responder_decisions", decision="bypass" if bypass else "synthesize", reason=reason)
+    if bypass:
+        content = user_answer(task_result(board[0], results))
+        await stream_bypass(content)
+        # 以近期 LLM 汇总耗时的均值估算节省的延迟
+        recent = metrics.get_samples("responder_synthesis_ms")
+        if recent:
+            metrics.observe("responder_latency_saved_ms", sum(recent) / len(recent))
+        logger.info(f"[Responder] 直出单任务结果: 类型={board[0].task_type}")
+        return {
+            "messages": [AIMessage(content=content, name="responder_agent")],
+            "task_board": "RESET",
+            "task_results": "RESET"
+        }
     
-    # 构建消息序列
-    messages = [SystemMessage(content=system_prompt)] + state["messages"]
-    messages.append(SystemMessage(content=results_context))
+    # 1. 拼接上下文（让汇总模型看清楚每个部门干了什么）
+    results_context = "【⬇️ 任务执行报告 - 供参考 ⬇️】:\n"
+    for i, task in enumerate(board):
+        res = task_result(task, results) or "未提供有效执行结果"
+        results_context += f">>> [任务 {i+1}] 类型: {task.task_type}\n描述: {task.description}\n输出结果: {res}\n\n"
+
+    # 2. 构建消息序列：静态提示词 -> 对话历史 -> 本轮任务报告
+    messages = prompts.assemble(
+        "responder_agent",
+        history=state["messages"],
+        volatile=[SystemMessage(content=results_context)],
+    )
 
-    response = await llm.ainvoke(messages)
+    start = time.perf_counter()
+    response = await utils.get_llm("responder_agent").ainvoke(messages)
+    metrics.observe("responder_synthesis_ms", (time.perf_counter() - start) * 1000)
+    prompts.record_usage("responder_agent", response)
     
     return {
         "messages": [AIMessage(content=response.content, name="responder_agent")],
         # 发送重置信号，清空看板，为下一轮对话做准备
-        "task_board": "RESET"
+        "task_board": "RESET",
+        "task_results": "RESET"
     }
\ No newline at end of file
@@ -3,17 +3,73 @@ Author: Yunpeng Shi y.shi27@newcastle.ac.uk
 FilePath: /01/agents/supervisor.py
 Description: 总调度智能体 - 引入结构化思考 (Title/Content) 与任务分发逻辑
 '''
+import asyncio
+import os
 import uuid
 from datetime import datetime
-from typing import List, Literal
+from typing import List, Literal, Optional
 
-from langchain_core.messages import HumanMessage, SystemMessage
+import prompts
+import utils
+from agents import early_dispatch
+from langchain_core.messages import AIMessageChunk, SystemMessage
+from langchain_core.runnables import RunnableConfig
 from langgraph.types import Send
-from state import PlanningResponse, agentState
-from utils import WORKERS_INFO, llm
+from pydantic import ValidationError
+from state import PlanningResponse, Task, agentState, board_tasks
+from utils import logger
 
+# 是否在规划流中解析出单个任务后立即启动对应 Worker
+EARLY_DISPATCH = os.getenv("SUPERVISOR_EARLY_DISPATCH", "1") == "1"
 
-async def supervisor_node(state: agentState):
+
+async def stream_plan(messages, state: agentState, config: RunnableConfig) -> List[dict]:
+    """
+    流式规划：逐块读取 PlanningResponse 的 tool-call 参数，
+    每解析出一个完整 Task 就写入看板并（可选）提前启动 Worker。
+    """
+    planner = utils.get_llm("supervisor_node").bind_tools(
+        [PlanningResponse],
+        tool_choice=PlanningResponse.__name__,
+        parallel_tool_calls=False,
+    )
+    parser = early_dispatch.TaskStreamParser()
+    new_board = []
+    full: Optional[AIMessageChunk] = None
+
+    try:
+        async for chunk in planner.astream(messages, config=config):
+            full = chunk if full is None else full + chunk
+            for tc in chunk.tool_call_chunks:
+                if tc.get("index", 0) not in (0, None):
+                    continue
+                for raw_task in parser.feed(tc.get("args") or ""):
+                    try:
+                        task_dict = Task.model_validate(raw_task).model_dump()
+                    except ValidationError as e:
+                        logger.warning(f"[Supervisor] 忽略不合法的任务: {e.errors()[:1]}")
+                        continue
+                    # 任务 ID 一律由服务端生成：模型给出的 ID 通常是 "1"、"task_1"，同一线程的并发请求之间
+                    # 会撞上提前执行注册表的键 (thread_id, task_id)，同一规划内重复时看板也会合并为一条
+                    task_dict["id"] = str(uuid.uuid4())
+                    task_dict["status"] = "pending"
+                    new_board.append(task_dict)
+                    if EARLY_DISPATCH:
+                        early_dispatch.schedule(task_dict, state["messages"], config)
+    except asyncio.CancelledError:
+        # 请求被取消时图节点不会再认领提前启动的任务，立即取消而不是等待过期清理
+        early_dispatch.discard([task["id"] for task in new_board], config)
+        raise
+    except Exception:
+        if not new_board:
+            raise
+        # 已有任务在执行，保留已解析的部分计划
+        logger.exception(f"[Supervisor] 规划流中断，保留已解析的 {len(new_board)} 个任务")
+    prompts.record_usage("supervisor_node", full)
+    return new_board
+
+
+async def supervisor_node(state: agentState, config: RunnableConfig):
     """
     核心调度节点：分析用户意图，展示结构化思考过程，并生成任务看板 (Task Board)
     """
@@ -22,79 +78,20 @@ async def supervisor_node(state: agentState):
 
     # 仅当看板为空时（新一轮对话开始），进行规划
     if not current_board:
-        # 动态获取当前时间，辅助决策
+        # 动态获取当前时间，辅助决策（如“明天”换算成具体日期）
         current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         
-        # 格式化工人描述，让 LLM 清楚每个部门的职责
-        members_desc = "\n".join([f"- **{k}**: {v}" for k, v in WORKERS_INFO.items()])
-        
-        # --- 核心修改：在 System Prompt 中加入结构化思考格式指令 ---
-        system_prompt = f"""
-        你是全能型的**私人智能助理总调度官 (Supervisor)**,你的名字叫贾维斯。
-        当前系统时间：{current_time}
-        
-        ### 🧠 你的思考模式 (Structured Thinking)
-        在生成最终的任务分配方案前，你必须向用户展示你的逻辑推演过程。
-        **为了让前端正确展示你的思考步骤，请严格遵守以下格式输出（保留 Title/Content 标签）：**
-        
-        Title: <简短标题，例如：需求分析 / 工具选择策略 / 任务优先级判断>
-        Content: <具体的思考内容，描述你如何理解用户需求，以及为何选择特定的助手处理>
-        
-        **输出示例 1 (查询类)：**
-        Title: 需求分析
-        Content: 用户想要了解“最新的苹果发布会内容”，这是一个需要获取实时信息的请求。
-        Title: 任务分发
-        Content: 本地知识库可能过时，我需要调度 `search_agent` 进行联网检索，然后由 `responder_agent` 总结。
-
-        **输出示例 2 (复杂任务)：**
-        Title: 意图拆解
-        Content: 用户说“帮我查一下明天北京天气，并写一首关于雨天的诗”，这包含两个独立意图。
-        Title: 策略制定
-        Content: 任务1（查天气）分配给 `tools_agent` 或 `weather_agent`；任务2（写诗）分配给 `creative_writer`。两者可以并行。
-
-        ### 你的职责：
-        分析用户的输入，将其拆解为 1 个或多个具体的子任务，并分配给最合适的子智能体处理。
-        
-        ### 可选处理子智能体及其职责：
-        {members_desc}
-        
-        ### 决策原则 (通用版)：
-        1. **精准分发**：
-           - **实时信息/百科/新闻/天气** -> 分配给 `search_agent` (或你定义的联网搜索工具)
-           - **日程/提醒/邮件/日历操作** -> 分配给 `productivity_agent` (或工具类Agent)
-           - **代码编写/数据分析/数学计算** -> 分配给 `code_interpreter` (或代码Agent)
-           - **创意写作/文案润色/翻译** -> 分配给 `writer_agent` (或写作Agent)
-           - **闲聊/情感陪伴/哲学探讨/无法归类的通用问题** -> 必须分配给 `general_chat`
-           
-        2. **参数提取**：
-           - 尽可能从用户输入中提取关键信息（如地点、时间、主题）作为 `input_content`。
-           - 如果用户询问“明天”，请结合当前时间 {current_time} 计算出具体日期。
-           
-        3. **多任务处理**：
-           - 如果用户输入包含多个意图（例如：“查一下股价然后发邮件给老板”），请拆分为多个独立的任务。
-        """
-        
-        # 使用 Structured Output 强制生成规范的任务列表
-        # main.py 的流式解析器会捕捉 invoke 过程中产生的文本流（思考过程）
-        planner_chain = llm.with_structured_output(PlanningResponse, method="function_calling")
-        
-        # 将 System Prompt 和 历史对话 传入
-        messages = [SystemMessage(content=system_prompt)] + state["messages"]
+        # 静态系统提示词 -> 历史对话 -> 当前时间：时间放在最后，避免破坏可缓存的前缀
+        # main.py 的流式解析器会捕捉规划过程中产生的文本流（思考过程）
+        messages = prompts.assemble(
+            "supervisor_node",
+            history=state["messages"],
+            volatile=[SystemMessage(content=f"当前系统时间：{current_time}")],
+        )
         
         try:
-            plan = await planner_chain.ainvoke(messages)
-            
-            new_board = []
-            if plan and plan.tasks:
-                for task in plan.tasks:
-                    task_dict = task.model_dump()
-                    # 确保每个任务都有唯一 ID
-                    if not task_dict.get("id"):
-                        task_dict["id"] = str(uuid.uuid4())
-                    # 默认状态为 pending
-                    task_dict["status"] = "pending"
-                    new_board.append(task_dict)
-            else:
+            new_board = await stream_plan(messages, state, config)
+            if not new_board:
                 # 兜底逻辑
                 new_board.append({
                     "id": str(uuid.uuid4()),
@@ -115,6 +112,8 @@ async def supervisor_node(state: agentState):
                 "status": "pending"
             }]
 
+        # 新一轮开始，清空上一轮的 Worker 中间消息 (已由 main.py 存入 thread_traces)
+        updates["worker_trace"] = "RESET"
         return updates
     
     return updates
@@ -124,8 +123,7 @@ def workflow_router(state: agentState) -> Literal["responder_agent"] | List[Send
     路由逻辑：
     - 检查 task_board 中状态为 'pending' 的任务并分发。
     """
-    board = state.get("task_board", [])
-    pending_tasks = [t for t in board if t["status"] == "pending"]
+    pending_tasks = [t for t in board_tasks(state.get("task_board")) if t.status == "pending"]
     
     if not pending_tasks:
         # 所有任务已结束 -> 汇总回复
@@ -133,6 +131,6 @@ def workflow_router(state: agentState) -> Literal["responder_agent"] | List[Send
     
     # 并行分发
     return [
-        Send(node=task["task_type"], arg={"task": task, "messages": state["messages"]}) 
+        Send(node=task.task_type, arg={"task": task.as_task(), "messages": state["messages"]})
         for task in pending_tasks
     ]
\ No newline at end of file
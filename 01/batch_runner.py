@@ -0,0 +1,237 @@
+'''
+Author: Yunpeng Shi
+Description: 批量问答 - 读取 NDJSON 问题列表，按设定并发度在同一个编译好的图上执行，结果按完成顺序以 NDJSON 流式输出，
+             末尾附带吞吐与失败统计；工具缓存、Embedding、向量库与 LLM 客户端都是进程级共享的，批内重复问题直接命中缓存
+
+输入每行一个 JSON 对象: {"query": "...", "id": "可选", "thread_id": "可选"}
+    - 未指定 thread_id 时每个问题使用独立会话；同一 thread_id 的问题按输入顺序串行执行 (多轮评测)
+输出每行一个结果: {"id", "thread_id", "answer", "latency_ms", "error"}，最后一行 {"type": "summary", ...}
+
+用法 (在 01 目录下):
+    python batch_runner.py questions.ndjson -o answers.ndjson --concurrency 8          # 调用运行中的服务 /chat/batch
+    python batch_runner.py questions.txt --local --concurrency 4                       # 进程内直接执行 (每行一个问题)
+'''
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+import uuid
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterable, List, Optional
+
+import metrics
+from langchain_core.messages import AIMessage, HumanMessage
+
+# 命令行调用远程服务时不导入 utils (避免要求配置 LLM 密钥)
+logger = logging.getLogger("MetroAgent")
+
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "32"))
+BATCH_ITEM_TIMEOUT_S = float(os.getenv("BATCH_ITEM_TIMEOUT_S", "180"))
+
+
+async def parse_ndjson(chunks: AsyncIterator[bytes]) -> AsyncIterator[Dict[str, Any]]:
+    """逐行解析请求体，不必等整个请求体上传完成；格式错误的行产出带 error 的条目"""
+    buffer = b""
+    line_no = 0
+
+    def parse(raw: bytes):
+        try:
+            item = json.loads(raw)
+        except ValueError as e:
+            return {"_error": f"第 {line_no} 行不是合法 JSON: {e}"}
+        if not isinstance(item, dict) or not str(item.get("query", "")).strip():
+            return {"_error": f"第 {line_no} 行缺少 query"}
+        return item
+
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for raw in lines:
+            line_no += 1
+            if raw.strip():
+                yield parse(raw)
+    if buffer.strip():
+        line_no += 1
+        yield parse(buffer)
+
+
+def final_answer(messages: List[Any]) -> str:
+    """取 Responder 的最终回复；没有时退回最后一条 AI 消息"""
+    for message in reversed(messages):
+        if isinstance(message, AIMessage) and message.name == "responder_agent":
+            return message.content
+    for message in reversed(messages):
+        if isinstance(message, AIMessage) and message.content:
+            return message.content
+    return ""
+
+
+async def run_batch(graph, items: AsyncIterator[Dict[str, Any]], concurrency: int = BATCH_CONCURRENCY,
+                    batch_id: Optional[str] = None,
+                    save_trace: Optional[Callable[[str, Dict[str, Any]], Awaitable[None]]] = None
+                    ) -> AsyncIterator[Dict[str, Any]]:
+    """
+    固定数量的 worker 从队列中取问题执行，结果完成一条输出一条；最后输出汇总。
+    输入队列有上限，读取请求体与执行之间形成背压。
+    save_trace(thread_id, 最终状态) 在每条问题结束后保存 Worker 中间过程 (worker_traces.save_turn)，失败不影响结果
+    """
+    batch_id = batch_id or uuid.uuid4().hex[:8]
+    concurrency = max(1, min(concurrency, BATCH_MAX_CONCURRENCY))
+    pending: asyncio.Queue = asyncio.Queue(maxsize=concurrency * 2)
+    results: asyncio.Queue = asyncio.Queue()
+    thread_locks: Dict[str, asyncio.Lock] = {}
+    latencies: List[float] = []
+    counts = {"total": 0, "succeeded": 0, "failed": 0}
+    started = time.perf_counter()
+
+    async def run_one(seq: int, item: Dict[str, Any]) -> Dict[str, Any]:
+        item_id = item.get("id", seq)
+        if "_error" in item:
+            return {"id": item_id, "thread_id": None, "answer": None, "latency_ms": 0.0, "error": item["_error"]}
+        thread_id = item.get("thread_id") or f"batch-{batch_id}-{seq}"
+        lock = thread_locks.setdefault(thread_id, asyncio.Lock())
+        start = time.perf_counter()
+        try:
+            async with lock:
+                state = await asyncio.wait_for(
+                    graph.ainvoke({"messages": [HumanMessage(content=item["query"])]},
+                                  config={"configurable": {"thread_id": thread_id}}),
+                    timeout=BATCH_ITEM_TIMEOUT_S)
+                if save_trace is not None:
+                    # 同一会话的下一条问题会 RESET worker_trace，在释放会话锁之前保存
+                    try:
+                        await save_trace(thread_id, state)
+                    except Exception as e:
+                        logger.error(f"保存 Worker 中间过程失败 (thread_id={thread_id}): {e}")
+            latency = (time.perf_counter() - start) * 1000
+            latencies.append(latency)
+            metrics.observe("batch_item_ms", latency)
+            return {"id": item_id, "thread_id": thread_id, "answer": final_answer(state.get("messages", [])),
+                    "latency_ms": round(latency, 1), "error": None}
+        except Exception as e:
+            error = "超时" if isinstance(e, asyncio.TimeoutError) else f"{type(e).__name__}: {e}"
+            logger.error(f"批量任务 {batch_id} 第 {seq} 条失败: {error}")
+            return {"id": item_id, "thread_id": thread_id, "answer": None,
+                    "latency_ms": round((time.perf_counter() - start) * 1000, 1), "error": error}
+
+    async def worker():
+        while True:
+            entry = await pending.get()
+            if entry is None:
+                return
+            await results.put(await run_one(*entry))
+
+    async def feed():
+        seq = 0
+        try:
+            async for item in items:
+                seq += 1
+                await pending.put((seq, item))
+        finally:
+            for _ in range(concurrency):
+                await pending.put(None)
+
+    async def supervise():
+        workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+        try:
+            await feed()
+            await asyncio.gather(*workers)
+        finally:
+            for task in workers:
+                task.cancel()
+            await results.put(None)
+
+    supervisor = asyncio.create_task(supervise())
+    try:
+        while True:
+            result = await results.get()
+            if result is None:
+                break
+            counts["total"] += 1
+            counts["failed" if result["error"] else "succeeded"] += 1
+            yield result
+        await supervisor
+    finally:
+        # 客户端断开时停止剩余任务
+        if not supervisor.done():
+            supervisor.cancel()
+            await asyncio.gather(supervisor, return_exceptions=True)
+
+    elapsed = time.perf_counter() - started
+    metrics.incr("batch_items", counts["succeeded"], status="ok")
+    metrics.incr("batch_items", counts["failed"], status="error")
+    yield {
+        "type": "summary", "batch_id": batch_id, **counts, "concurrency": concurrency,
+        "elapsed_s": round(elapsed, 2),
+        "throughput_qps": round(counts["total"] / elapsed, 3) if elapsed > 0 else 0.0,
+        "latency_p50_ms": round(metrics.quantile(latencies, 0.50), 1),
+        "latency_p95_ms": round(metrics.quantile(latencies, 0.95), 1),
+    }
+
+
+# --- 命令行 ---
+def read_input(path: str) -> List[Dict[str, Any]]:
+    """.ndjson/.jsonl 按行解析 JSON，其余文本文件每行一个问题"""
+    with open(path, "r", encoding="utf-8") as f:
+        lines = [line.strip() for line in f if line.strip()]
+    if path.endswith((".ndjson", ".jsonl")):
+        return [json.loads(line) for line in lines]
+    return [{"query": line} for line in lines]
+
+
+async def _iterate(items: Iterable[Dict[str, Any]]) -> AsyncIterator[Dict[str, Any]]:
+    for item in items:
+        yield item
+
+
+async def run_remote(items: List[Dict[str, Any]], url: str, concurrency: int) -> AsyncIterator[Dict[str, Any]]:
+    import httpx
+    body = "".join(json.dumps(item, ensure_ascii=False) + "\n" for item in items).encode("utf-8")
+    async with httpx.AsyncClient(timeout=None) as client:
+        async with client.stream("POST", f"{url.rstrip('/')}/chat/batch", params={"concurrency": concurrency},
+                                 content=body, headers={"Content-Type": "application/x-ndjson"}) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if line.strip():
+                    yield json.loads(line)
+
+
+async def run_local(items: List[Dict[str, Any]], concurrency: int) -> AsyncIterator[Dict[str, Any]]:
+    from langgraph.checkpoint.memory import InMemorySaver
+    from main import build_graph
+    graph = build_graph().compile(checkpointer=InMemorySaver())
+    async for result in run_batch(graph, _iterate(items), concurrency):
+        yield result
+
+
+async def _main(args):
+    items = read_input(args.input)
+    stream = run_local(items, args.concurrency) if args.local else run_remote(items, args.url, args.concurrency)
+    out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    try:
+        async for result in stream:
+            if result.get("type") == "summary":
+                print(json.dumps(result, ensure_ascii=False), file=sys.stderr)
+            else:
+                out.write(json.dumps(result, ensure_ascii=False) + "\n")
+                out.flush()
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="批量问答")
+    parser.add_argument("input", help=".ndjson/.jsonl 问题列表，或每行一个问题的文本文件")
+    parser.add_argument("-o", "--output", help="结果输出文件 (默认标准输出)")
+    parser.add_argument("-c", "--concurrency", type=int, default=BATCH_CONCURRENCY)
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--local", action="store_true", help="不经过服务，在当前进程内执行")
+    asyncio.run(_main(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+'''
+Author: Yunpeng Shi
+Description: Embedding 后端基准测试 - 对比 PyTorch 与 ONNX Runtime (fp32 / int8) 的加载耗时、查询延迟、吞吐与内存占用
+
+每个后端在独立子进程中运行，保证 RSS 互不干扰。在 01 目录下执行:
+    python benchmarks/bench_embeddings.py --backends torch onnx onnx-int8
+'''
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+QUERIES = [
+    "折叠自行车可以带进地铁吗？",
+    "车厢内可以吃东西吗",
+    "携带宠物乘车有什么规定",
+    "第二十条说了什么",
+    "逃票会被怎么处罚",
+    "儿童乘车需要买票吗",
+    "地铁里能不能使用滑板车",
+    "易燃易爆物品的定义是什么",
+]
+
+
+def current_rss_mb() -> float:
+    with open("/proc/self/status", "r") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def peak_rss_mb() -> float:
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_worker(backend: str, rounds: int, batch_size: int, vectors_out: str):
+    """子进程入口：加载单个后端并测量"""
+    rss_before = current_rss_mb()
+    start = time.perf_counter()
+    import embedding_backends
+    if backend == "torch":
+        embeddings = embedding_backends.create_embeddings(backend="torch")
+    else:
+        quantize = backend == "onnx-int8"
+        path = embedding_backends.onnx_model_file(embedding_backends.ONNX_DIR, quantize)
+        if not os.path.exists(path):
+            path = embedding_backends.export_onnx(quantize=quantize)
+        embeddings = embedding_backends.OnnxEmbeddings(embedding_backends.LOCAL_MODEL_PATH, path)
+    embeddings.embed_query("预热")
+    load_seconds = time.perf_counter() - start
+    rss_loaded = current_rss_mb()
+
+    latencies = []
+    for _ in range(rounds):
+        for query in QUERIES:
+            t = time.perf_counter()
+            embeddings.embed_query(query)
+            latencies.append((time.perf_counter() - t) * 1000)
+
+    docs = (QUERIES * (batch_size // len(QUERIES) + 1))[:batch_size]
+    t = time.perf_counter()
+    embeddings.embed_documents(docs)
+    throughput = batch_size / (time.perf_counter() - t)
+
+    import numpy as np
+    np.save(vectors_out, np.asarray(embeddings.embed_documents(QUERIES), dtype=np.float32))
+
+    latencies.sort()
+    return {
+        "backend": backend,
+        "load_s": round(load_seconds, 2),
+        "rss_delta_mb": round(rss_loaded - rss_before, 1),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "query_p50_ms": round(statistics.median(latencies), 2),
+        "query_p95_ms": round(latencies[int(len(latencies) * 0.95) - 1], 2),
+        "batch_texts_per_s": round(throughput, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Embedding 后端基准测试")
+    parser.add_argument("--backends", nargs="+", default=["torch", "onnx", "onnx-int8"])
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    parser.add_argument("--vectors-out", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_worker(args.worker, args.rounds, args.batch_size, args.vectors_out)))
+        return
+
+    import numpy as np
+    results, vectors = [], {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for backend in args.backends:
+            out = os.path.join(tmp, f"{backend}.npy")
+            proc = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--worker", backend,
+                 "--rounds", str(args.rounds), "--batch-size", str(args.batch_size), "--vectors-out", out],
+                cwd=ROOT, capture_output=True, text=True,
+            )
+            if proc.returncode != 0:
+                print(f"❌ {backend} 运行失败:\n{proc.stderr[-2000:]}")
+                continue
+            results.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+            vectors[backend] = np.load(out)
+
+    reference = vectors.get("torch")
+    for row in results:
+        if reference is not None and row["backend"] != "torch":
+            cosine = (vectors[row["backend"]] * reference).sum(axis=1)
+            row["min_cosine_vs_torch"] = round(float(cosine.min()), 5)
+
+    headers = list(dict.fromkeys(k for row in results for k in row))
+    print(" | ".join(headers))
+    for row in results:
+        print(" | ".join(str(row.get(h, "-")) for h in headers))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+'''
+Author: Yunpeng Shi
+Description: 对冲请求效果评估 - 假 LLM 按 --slow-rate 比例注入首 token 长尾延迟，分别在关闭/开启对冲 (各自独立子进程) 时
+             顺序执行相同的对话，统计整轮耗时与首个回复 token 的 p50/p95/p99，以及对冲发出次数、胜出次数与额外请求比例
+
+在 01 目录下执行:
+    python benchmarks/bench_hedging.py --turns 100
+    python benchmarks/bench_hedging.py --turns 100 --slow-rate 0.05 --slow-ms 2000 --nodes supervisor_node,responder_agent
+'''
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+import uuid
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.bench_streaming import wait_for_llm  # noqa: E402
+from benchmarks.loadtest import QUERIES, build_vector_store, free_port, start_process  # noqa: E402
+
+
+async def run_turns(turns: int, warmup: int) -> dict:
+    import graph_stream
+    import llm_hedging
+    import metrics
+    import tracing
+    import utils
+    store, embeddings = build_vector_store("memory", "fake")
+    utils.get_vector_store = lambda: store
+    utils.get_embeddings = lambda: embeddings
+    from langchain_core.messages import HumanMessage
+    from langgraph.checkpoint.memory import InMemorySaver
+    from main import build_graph
+
+    graph_app = build_graph().compile(checkpointer=InMemorySaver())
+    turn_ms, first_token_ms = [], []
+    for i in range(warmup + turns):
+        trace = tracing.RequestTrace("bench")
+        config = {"configurable": {"thread_id": f"hedge-{uuid.uuid4().hex[:8]}"}}
+        start = time.perf_counter()
+        first = None
+        async for event_type, _ in graph_stream.stream_graph(
+                graph_app, {"messages": [HumanMessage(content=QUERIES[i % len(QUERIES)])]}, config, trace, "light"):
+            if event_type == "message" and first is None:
+                first = (time.perf_counter() - start) * 1000
+        if i >= warmup:
+            turn_ms.append((time.perf_counter() - start) * 1000)
+            first_token_ms.append(first or turn_ms[-1])
+
+    def dist(samples):
+        return {f"p{int(q * 100)}": round(metrics.quantile(samples, q), 1) for q in (0.5, 0.95, 0.99)}
+
+    hedging = llm_hedging.stats()
+    calls = sum(s["call"] for s in hedging.values())
+    fired = sum(s["fired"] for s in hedging.values())
+    return {
+        "turn_ms": dist(turn_ms),
+        "first_reply_token_ms": dist(first_token_ms),
+        "llm_calls": calls,
+        "hedges_fired": fired,
+        "hedges_won": sum(s["won"] for s in hedging.values()),
+        "extra_request_pct": round(fired / calls * 100, 1) if calls else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LLM 对冲请求长尾延迟对比")
+    parser.add_argument("--turns", type=int, default=60)
+    parser.add_argument("--warmup", type=int, default=20, help="预热轮次，用于积累各节点的延迟样本")
+    parser.add_argument("--ttft-ms", type=float, default=150)
+    parser.add_argument("--tokens-per-s", type=float, default=0)
+    parser.add_argument("--slow-rate", type=float, default=0.05)
+    parser.add_argument("--slow-ms", type=float, default=1500)
+    parser.add_argument("--nodes", default="*", help="LLM_HEDGE_NODES")
+    parser.add_argument("--percentile", default="0.9", help="LLM_HEDGE_PERCENTILE")
+    parser.add_argument("--budget", default="0.2", help="LLM_HEDGE_BUDGET")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--save", help="将结果保存为 JSON")
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(asyncio.run(run_turns(args.turns, args.warmup))))
+        return
+
+    os.chdir(ROOT)
+    llm_port = free_port()
+    env = {**os.environ, "DEEPSEEK_API_KEY": os.getenv("DEEPSEEK_API_KEY", "sk-bench"),
+           "DEEPSEEK_BASE_URL": f"http://127.0.0.1:{llm_port}/v1", "CHECKPOINT_BACKEND": "memory",
+           "LOG_FILE": "", "LOG_LEVEL": "WARNING"}
+    llm_proc = start_process([sys.executable, "benchmarks/fake_llm_server.py", "--port", str(llm_port),
+                              "--ttft-ms", str(args.ttft_ms), "--tokens-per-s", str(args.tokens_per_s),
+                              "--jitter", "0.2", "--slow-rate", str(args.slow_rate),
+                              "--slow-ms", str(args.slow_ms)], env)
+    report = {"slow_rate": args.slow_rate, "slow_ms": args.slow_ms}
+    try:
+        wait_for_llm(llm_port)
+        for mode, nodes in (("off", ""), ("on", args.nodes)):
+            child_env = {**env, "LLM_HEDGE_NODES": nodes, "LLM_HEDGE_PERCENTILE": args.percentile,
+                         "LLM_HEDGE_BUDGET": args.budget,
+                         # 样本不足时的阈值取正常首 token 延迟的 3 倍
+                         "LLM_HEDGE_DEFAULT_DELAY_MS": str(args.ttft_ms * 3)}
+            out = subprocess.run([sys.executable, __file__, "--child", "--turns", str(args.turns),
+                                  "--warmup", str(args.warmup)],
+                                 env=child_env, capture_output=True, text=True, check=True)
+            report[mode] = json.loads(out.stdout.strip().splitlines()[-1])
+    finally:
+        llm_proc.terminate()
+        llm_proc.wait(timeout=10)
+
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+'''
+Author: Yunpeng Shi
+Description: 流式实现对比 - 同一进程内交替以 events (astream_events v2) 与 light (astream 多流) 两种模式执行相同的对话，
+             统计每轮 CPU 时间、墙钟时间、图产出的原始事件数与推送给前端的 SSE 事件数，并校验两种模式推送的事件一致
+
+假 LLM 运行在子进程中 (不计入本进程 CPU)，默认无首 token 延迟与吐字间隔，结果反映的是流式管线自身的开销。
+在 01 目录下执行:
+    python benchmarks/bench_streaming.py --turns 30
+    python benchmarks/bench_streaming.py --turns 30 --tasks-per-turn 3 --reply-tokens 200
+'''
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+import uuid
+from collections import Counter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.loadtest import QUERIES, build_vector_store, free_port, start_process  # noqa: E402
+
+MODES = ("events", "light")
+
+
+def wait_for_llm(port: int, timeout: float = 30):
+    import httpx
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/v1/models", timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError("假 LLM 服务未就绪")
+
+
+def count_raw(translator_cls, counter: Counter, mode: str):
+    """包装 translate，统计图产出的原始事件数 (含被丢弃的)"""
+    original = translator_cls.translate
+
+    def translate(self, *args):
+        counter[mode] += 1
+        return original(self, *args)
+
+    translator_cls.translate = translate
+
+
+def fingerprint(events: list) -> tuple:
+    """并发 Worker 的事件顺序不固定，按 (类型, 标题) 多重集合与回复全文比较"""
+    steps = Counter((t, d.get("title")) for t, d in events if t == "step")
+    thoughts = sum(len(d["content"]) for t, d in events if t == "thought")
+    message = "".join(d["content"] for t, d in events if t == "message")
+    return tuple(sorted(steps.items())), thoughts, message
+
+
+async def run(args) -> dict:
+    import graph_stream
+    import tracing
+    import utils
+    store, embeddings = build_vector_store("memory", "fake")
+    utils.get_vector_store = lambda: store
+    utils.get_embeddings = lambda: embeddings
+    from langchain_core.messages import HumanMessage
+    from langgraph.checkpoint.memory import InMemorySaver
+    from main import build_graph
+
+    raw = Counter()
+    count_raw(graph_stream.EventsTranslator, raw, "events")
+    count_raw(graph_stream.LightTranslator, raw, "light")
+    graph_app = build_graph().compile(checkpointer=InMemorySaver())
+    samples = {mode: {"cpu_ms": [], "wall_ms": [], "sse_events": 0} for mode in MODES}
+    mismatches = 0
+
+    async def turn(mode: str, query: str, record: bool) -> tuple:
+        trace = tracing.RequestTrace("bench")
+        config = {"configurable": {"thread_id": f"bench-{mode}-{uuid.uuid4().hex[:8]}"}}
+        events = []
+        cpu, wall = time.process_time(), time.perf_counter()
+        async for item in graph_stream.stream_graph(graph_app, {"messages": [HumanMessage(content=query)]},
+                                                    config, trace, mode):
+            events.append(item)
+        if record:
+            samples[mode]["cpu_ms"].append((time.process_time() - cpu) * 1000)
+            samples[mode]["wall_ms"].append((time.perf_counter() - wall) * 1000)
+            samples[mode]["sse_events"] += len(events)
+        return fingerprint(events)
+
+    for i in range(args.warmup):
+        for mode in MODES:
+            await turn(mode, QUERIES[i % len(QUERIES)], record=False)
+    raw.clear()
+    for i in range(args.turns):
+        query = QUERIES[i % len(QUERIES)]
+        # 交替先后顺序，抵消缓存/GC 带来的偏差
+        order = MODES if i % 2 == 0 else MODES[::-1]
+        results = {mode: await turn(mode, query, record=True) for mode in order}
+        if results["events"] != results["light"]:
+            mismatches += 1
+
+    import metrics
+    report = {"turns": args.turns, "mismatched_turns": mismatches}
+    for mode in MODES:
+        s = samples[mode]
+        report[mode] = {
+            "cpu_ms_mean": round(sum(s["cpu_ms"]) / len(s["cpu_ms"]), 2),
+            "cpu_ms_p50": round(metrics.quantile(s["cpu_ms"], 0.5), 2),
+            "cpu_ms_p95": round(metrics.quantile(s["cpu_ms"], 0.95), 2),
+            "wall_ms_p50": round(metrics.quantile(s["wall_ms"], 0.5), 1),
+            "raw_events_per_turn": round(raw[mode] / args.turns, 1),
+            "sse_events_per_turn": round(s["sse_events"] / args.turns, 1),
+        }
+    base = report["events"]["cpu_ms_mean"]
+    report["cpu_saved_pct"] = round((base - report["light"]["cpu_ms_mean"]) / base * 100, 1) if base else 0.0
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="events / light 流式模式 CPU 开销对比")
+    parser.add_argument("--turns", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--tasks-per-turn", type=int, default=2)
+    parser.add_argument("--reply-tokens", type=int, default=120)
+    parser.add_argument("--save", help="将结果保存为 JSON")
+    args = parser.parse_args()
+
+    os.chdir(ROOT)
+    llm_port = free_port()
+    os.environ.update({
+        "DEEPSEEK_API_KEY": os.getenv("DEEPSEEK_API_KEY", "sk-bench"),
+        "DEEPSEEK_BASE_URL": f"http://127.0.0.1:{llm_port}/v1",
+        "CHECKPOINT_BACKEND": "memory",
+    })
+    llm_proc = start_process([sys.executable, "benchmarks/fake_llm_server.py", "--port", str(llm_port),
+                              "--ttft-ms", "0", "--tokens-per-s", "0", "--jitter", "0",
+                              "--reply-tokens", str(args.reply_tokens),
+                              "--tasks-per-turn", str(args.tasks_per_turn)], dict(os.environ))
+    try:
+        wait_for_llm(llm_port)
+        report = asyncio.run(run(args))
+    finally:
+        llm_proc.terminate()
+        llm_proc.wait(timeout=10)
+
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
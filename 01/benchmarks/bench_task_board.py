@@ -0,0 +1,94 @@
+'''
+Author: Yunpeng Shi
+Description: 任务看板基准 - 模拟宽扇出的一轮对话 (规划 N 个任务，N 个 Worker 在同一超步内逐个合并结果)，
+             对比旧的列表看板与按 ID 索引的看板：每次合并耗时，以及检查点序列化后的看板大小
+
+在 01 目录下执行:
+    python benchmarks/bench_task_board.py
+    python benchmarks/bench_task_board.py --fanout 8 64 512 --result-chars 2000
+'''
+import argparse
+import os
+import sys
+import time
+import uuid
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import state  # noqa: E402
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer  # noqa: E402
+
+
+def legacy_reduce(left, right):
+    """改造前的实现：每次合并复制整个列表并重建 id -> 下标映射"""
+    if right == "RESET":
+        return []
+    updates = [right] if isinstance(right, dict) else right
+    if not left:
+        return updates
+    new_board = left.copy()
+    id_to_index = {task["id"]: i for i, task in enumerate(new_board)}
+    for update in updates:
+        t_id = update.get("id")
+        if t_id and t_id in id_to_index:
+            idx = id_to_index[t_id]
+            new_board[idx] = {**new_board[idx], **update}
+        else:
+            new_board.append(update)
+    return new_board
+
+
+def plan(n: int) -> list:
+    return [{"id": str(uuid.uuid4()), "task_type": "judge_agent", "description": f"查询第 {i + 1} 项乘车规定",
+             "input_content": f"携带物品第 {i + 1} 类能否进站？", "status": "pending", "result": None}
+            for i in range(n)]
+
+
+def run_turn(n: int, result: str, compact: bool):
+    """返回 (看板, 结果表, 每次 Worker 合并的耗时 µs 列表)"""
+    tasks = plan(n)
+    reduce = state.reduce_task_board if compact else legacy_reduce
+    board = reduce({} if compact else [], tasks)
+    results = {}
+    timings = []
+    for task in tasks:
+        # Worker 返回的更新与线上一致
+        if compact:
+            update = state.complete_task(task, result)
+            results = state.reduce_task_results(results, update.get("task_results", {}))
+            update = update["task_board"]
+        else:
+            update = [{**task, "status": "done", "result": result}]
+        start = time.perf_counter()
+        board = reduce(board, update)
+        timings.append((time.perf_counter() - start) * 1e6)
+    return board, results, timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="任务看板合并耗时与序列化大小")
+    parser.add_argument("--fanout", type=int, nargs="+", default=[4, 16, 64, 256])
+    parser.add_argument("--result-chars", type=int, default=800)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    serde = JsonPlusSerializer()
+    result = ("根据杭州地铁乘客守则，" * (args.result_chars // 11 + 1))[:args.result_chars]
+    print(f"{'N':>5} {'实现':<8} {'合并 µs/次':>12} {'整轮合并 ms':>12} {'看板 KB':>10} {'看板+结果 KB':>14}")
+    for n in args.fanout:
+        for compact in (False, True):
+            samples = []
+            for _ in range(args.repeat):
+                board, results, timings = run_turn(n, result, compact)
+                samples.append(timings)
+            per_merge = sum(sum(t) for t in samples) / (args.repeat * n)
+            per_turn = sum(sum(t) for t in samples) / args.repeat / 1000
+            board_bytes = len(serde.dumps_typed(board)[1])
+            total_bytes = board_bytes + (len(serde.dumps_typed(results)[1]) if results else 0)
+            print(f"{n:>5} {'keyed' if compact else 'list':<8} {per_merge:>12.1f} {per_turn:>12.2f} "
+                  f"{board_bytes / 1024:>10.1f} {total_bytes / 1024:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+'''
+Author: Yunpeng Shi
+Description: 压测用的假 OpenAI 兼容服务 - 按配置的首 token 延迟与吐字速率流式返回，支持工具调用
+             - 强制调用 PlanningResponse 时：返回包含 --tasks-per-turn 个任务的规划
+             - 绑定了其他工具且尚未有工具结果时：调用第一个工具 (参数按 schema 自动填充)
+             - 其余情况：返回 Title/Content 结构的文本答复
+
+用法 (在 01 目录下):
+    python benchmarks/fake_llm_server.py --port 9100 --ttft-ms 300 --tokens-per-s 40
+    DEEPSEEK_BASE_URL=http://127.0.0.1:9100/v1 uvicorn main:app
+'''
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+TASK_TYPES = ["general_chat", "judge_agent", "ticket_agent", "complaint_agent", "manager_agent"]
+
+
+class FakeLLMConfig:
+    def __init__(self, ttft_ms: float = 300, tokens_per_s: float = 40, reply_tokens: int = 60,
+                 jitter: float = 0.2, tasks_per_turn: int = 1, tool_calls: bool = True,
+                 slow_rate: float = 0.0, slow_ms: float = 0.0):
+        self.ttft_ms = ttft_ms
+        self.tokens_per_s = tokens_per_s
+        self.reply_tokens = reply_tokens
+        self.jitter = jitter
+        self.tasks_per_turn = tasks_per_turn
+        self.tool_calls = tool_calls
+        # 长尾：slow_rate 比例的请求首 token 额外延迟 slow_ms
+        self.slow_rate = slow_rate
+        self.slow_ms = slow_ms
+
+
+def _last_user_text(messages: list) -> str:
+    for message in reversed(messages):
+        if message.get("role") == "user":
+            content = message.get("content")
+            return content if isinstance(content, str) else json.dumps(content, ensure_ascii=False)
+    return ""
+
+
+def _fill_args(parameters: dict, text: str) -> dict:
+    args = {}
+    properties = parameters.get("properties", {})
+    for name in parameters.get("required", list(properties)):
+        kind = properties.get(name, {}).get("type")
+        args[name] = 3 if kind in ("integer", "number") else text[:40]
+    return args
+
+
+def _plan(text: str, count: int) -> dict:
+    return {"tasks": [
+        {"task_type": TASK_TYPES[i % len(TASK_TYPES)], "description": f"子任务 {i + 1}", "input_content": text}
+        for i in range(count)
+    ]}
+
+
+def decide(body: dict, config: FakeLLMConfig):
+    """返回 (tool_name, arguments_json) 或 (None, 文本)"""
+    messages = body.get("messages", [])
+    text = _last_user_text(messages)
+    tools = body.get("tools") or []
+    choice = body.get("tool_choice")
+    forced = choice.get("function", {}).get("name") if isinstance(choice, dict) else None
+
+    if forced == "PlanningResponse":
+        return "PlanningResponse", json.dumps(_plan(text, config.tasks_per_turn), ensure_ascii=False)
+    # 只看本轮 (最后一条用户消息之后) 是否已有工具结果，历史轮次的工具消息不算
+    last_user = max((i for i, m in enumerate(messages) if m.get("role") == "user"), default=-1)
+    has_tool_result = any(m.get("role") == "tool" for m in messages[last_user + 1:])
+    if tools and config.tool_calls and not has_tool_result:
+        function = tools[0]["function"]
+        return function["name"], json.dumps(_fill_args(function.get("parameters", {}), text), ensure_ascii=False)
+    words = ["根据", "杭州", "地铁", "乘客", "守则", "，", "相关", "规定", "如下", "。"]
+    reply = "".join(words[i % len(words)] for i in range(config.reply_tokens))
+    # 与 Worker 提示词一致：思考块之后以 Answer: 段落给出最终答复
+    return None, f"Title: 整理结论\nContent: 已获取所需信息，整理答复。\nAnswer: {reply}"
+
+
+def _pieces(text: str, size: int = 4):
+    return [text[i:i + size] for i in range(0, len(text), size)] or [""]
+
+
+def create_app(config: FakeLLMConfig) -> FastAPI:
+    app = FastAPI()
+    stats = {"requests": 0, "active": 0, "peak_active": 0}
+
+    async def first_token_delay():
+        jitter = 1 + random.uniform(-config.jitter, config.jitter)
+        delay_ms = config.ttft_ms * jitter
+        if config.slow_rate and random.random() < config.slow_rate:
+            delay_ms += config.slow_ms
+        await asyncio.sleep(max(0.0, delay_ms / 1000))
+
+    def chunk(completion_id: str, delta: dict, finish_reason=None, usage=None) -> str:
+        payload = {
+            "id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()),
+            "model": "deepseek-chat",
+            "choices": [] if usage else [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+        if usage:
+            payload["usage"] = usage
+        return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+    def usage_for(body: dict, completion_tokens: int) -> dict:
+        prompt_tokens = sum(len(str(m.get("content") or "")) for m in body.get("messages", [])) // 2
+        return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+                "prompt_cache_hit_tokens": prompt_tokens // 2, "prompt_cache_miss_tokens": prompt_tokens - prompt_tokens // 2}
+
+    async def stream(body: dict):
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        tool_name, output = decide(body, config)
+        pieces = _pieces(output)
+        interval = 1 / config.tokens_per_s if config.tokens_per_s > 0 else 0
+        await first_token_delay()
+        if tool_name:
+            yield chunk(completion_id, {"role": "assistant", "content": None, "tool_calls": [{
+                "index": 0, "id": f"call_{uuid.uuid4().hex[:8]}", "type": "function",
+                "function": {"name": tool_name, "arguments": ""}}]})
+        else:
+            yield chunk(completion_id, {"role": "assistant", "content": ""})
+        for piece in pieces:
+            if interval:
+                await asyncio.sleep(interval)
+            if tool_name:
+                yield chunk(completion_id, {"tool_calls": [{"index": 0, "function": {"arguments": piece}}]})
+            else:
+                yield chunk(completion_id, {"content": piece})
+        yield chunk(completion_id, {}, finish_reason="tool_calls" if tool_name else "stop")
+        if (body.get("stream_options") or {}).get("include_usage"):
+            yield chunk(completion_id, {}, usage=usage_for(body, len(pieces)))
+        yield "data: [DONE]\n\n"
+
+    async def complete(body: dict) -> dict:
+        tool_name, output = decide(body, config)
+        pieces = _pieces(output)
+        await first_token_delay()
+        if config.tokens_per_s > 0:
+            await asyncio.sleep(len(pieces) / config.tokens_per_s)
+        message = {"role": "assistant", "content": output if not tool_name else None}
+        if tool_name:
+            message["tool_calls"] = [{"id": f"call_{uuid.uuid4().hex[:8]}", "type": "function",
+                                      "function": {"name": tool_name, "arguments": output}}]
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex[:12]}", "object": "chat.completion", "created": int(time.time()),
+            "model": "deepseek-chat",
+            "choices": [{"index": 0, "message": message, "finish_reason": "tool_calls" if tool_name else "stop"}],
+            "usage": usage_for(body, len(pieces)),
+        }
+
+    async def tracked(gen):
+        stats["active"] += 1
+        stats["peak_active"] = max(stats["peak_active"], stats["active"])
+        try:
+            async for item in gen:
+                yield item
+        finally:
+            stats["active"] -= 1
+
+    @app.post("/chat/completions")
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        stats["requests"] += 1
+        if body.get("stream"):
+            return StreamingResponse(tracked(stream(body)), media_type="text/event-stream")
+        return JSONResponse(await complete(body))
+
+    @app.get("/models")
+    @app.get("/v1/models")
+    async def models():
+        return {"object": "list", "data": [{"id": "deepseek-chat", "object": "model", "owned_by": "fake"}]}
+
+    @app.get("/stats")
+    async def get_stats():
+        return stats
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="假 OpenAI 兼容流式服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--ttft-ms", type=float, default=300)
+    parser.add_argument("--tokens-per-s", type=float, default=40)
+    parser.add_argument("--reply-tokens", type=int, default=60)
+    parser.add_argument("--jitter", type=float, default=0.2)
+    parser.add_argument("--tasks-per-turn", type=int, default=1)
+    parser.add_argument("--no-tool-calls", action="store_true")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="首 token 额外变慢的请求比例 (模拟长尾)")
+    parser.add_argument("--slow-ms", type=float, default=0.0)
+    args = parser.parse_args()
+
+    import uvicorn
+    config = FakeLLMConfig(args.ttft_ms, args.tokens_per_s, args.reply_tokens, args.jitter,
+                           args.tasks_per_turn, not args.no_tool_calls, args.slow_rate, args.slow_ms)
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,288 @@
+'''
+Author: Yunpeng Shi
+Description: 端到端压测 - 用本地替身 (假 LLM 流式服务、内存/本地 Postgres 检查点、FAISS/内存向量库) 启动 main.app，
+             并发驱动 /chat/stream 会话，统计吞吐、首字延迟 (TTFT) 与总延迟的 p50/p95/p99 以及数据库连接占用
+
+在 01 目录下执行:
+    python benchmarks/loadtest.py --sessions 20 --requests 200
+    python benchmarks/loadtest.py --save baseline.json                 # 保存基线
+    python benchmarks/loadtest.py --baseline baseline.json             # 与基线对比
+    python benchmarks/loadtest.py --checkpoint postgres                # 使用 DB_URI 指向的本地 Postgres
+'''
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+import uuid
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+QUERIES = [
+    "折叠自行车可以带进地铁吗？",
+    "车厢内可以吃东西吗",
+    "帮我查一下交通卡 12345 的余额",
+    "携带宠物乘车有什么规定",
+    "安检员态度很差，我要投诉",
+    "逃票会被怎么处罚",
+    "儿童乘车需要买票吗",
+]
+
+KNOWLEDGE = [
+    "第十二条 乘客不得在车厢内饮食，婴儿、病人除外。",
+    "第二十条 乘客应当自觉遵守乘车秩序，先下后上，不得强行上下车。",
+    "第二十三条 折叠自行车折叠后可以携带进站乘车，非折叠自行车禁止携带。",
+    "第二十五条 乘客不得携带猫、狗等宠物进站乘车，导盲犬除外。",
+    "第三十条 无票乘车或者持无效车票乘车的，按线网单程最高票价补票。",
+    "身高 1.3 米以下的儿童可由成年乘客带领免费乘车。",
+]
+
+# 报告中参与基线对比的指标：True 表示越大越好
+REPORT_KEYS = {
+    "throughput_rps": True,
+    "ttft_p50_ms": False, "ttft_p95_ms": False, "ttft_p99_ms": False,
+    "total_p50_ms": False, "total_p95_ms": False, "total_p99_ms": False,
+    "error_rate": False,
+    "db_connections_peak": False,
+}
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+# --- 服务端 (子进程) ---
+def build_vector_store(kind: str, embeddings_kind: str):
+    if kind == "none":
+        return None, None
+    if embeddings_kind == "real":
+        import utils
+        embeddings = utils.get_embeddings()
+    else:
+        from langchain_core.embeddings import DeterministicFakeEmbedding
+        embeddings = DeterministicFakeEmbedding(size=512)
+    if kind == "faiss":
+        from langchain_community.vectorstores import FAISS
+        return FAISS.from_texts(KNOWLEDGE, embeddings), embeddings
+    from langchain_core.vectorstores import InMemoryVectorStore
+    return InMemoryVectorStore.from_texts(KNOWLEDGE, embeddings), embeddings
+
+
+def serve(args):
+    """在子进程中启动 main.app，向量库替换为本地 FAISS/内存实现"""
+    os.chdir(ROOT)
+    import uvicorn
+    import utils
+    store, embeddings = build_vector_store(args.vector_store, args.embeddings)
+    utils.get_vector_store = lambda: store
+    if embeddings is not None:
+        utils.get_embeddings = lambda: embeddings
+
+    import main
+    uvicorn.run(main.app, host="127.0.0.1", port=args.app_port, log_level="warning")
+
+
+# --- 客户端 ---
+async def wait_until_ready(client, url: str, timeout: float = 120):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            response = await client.get(url)
+            if response.status_code == 200:
+                return
+        except Exception:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError(f"服务未在 {timeout}s 内就绪: {url}")
+
+
+async def run_turn(client, base_url: str, query: str, thread_id: str) -> dict:
+    start = time.perf_counter()
+    result = {"ttft_ms": None, "first_event_ms": None, "total_ms": None, "error": None}
+    event = None
+    try:
+        async with client.stream("POST", f"{base_url}/chat/stream",
+                                 json={"query": query, "thread_id": thread_id}) as response:
+            if response.status_code != 200:
+                result["error"] = f"HTTP {response.status_code}"
+                return result
+            async for line in response.aiter_lines():
+                if line.startswith("event: "):
+                    event = line[7:].strip()
+                    elapsed = (time.perf_counter() - start) * 1000
+                    if result["first_event_ms"] is None:
+                        result["first_event_ms"] = elapsed
+                    if event == "message" and result["ttft_ms"] is None:
+                        result["ttft_ms"] = elapsed
+                elif line.startswith("data: ") and event == "error":
+                    result["error"] = line[6:][:200]
+    except Exception as e:
+        result["error"] = repr(e)
+    result["total_ms"] = (time.perf_counter() - start) * 1000
+    if result["ttft_ms"] is None and result["error"] is None:
+        result["error"] = "未收到回复内容"
+    return result
+
+
+async def sample_db_pool(client, base_url: str, stop: asyncio.Event, peaks: dict):
+    """定期读取 /metrics 中的连接池统计，记录峰值"""
+    while not stop.is_set():
+        try:
+            stats = (await client.get(f"{base_url}/metrics")).json().get("db_pool")
+            if stats:
+                in_use = stats.get("pool_size", 0) - stats.get("pool_available", 0)
+                peaks["db_connections_peak"] = max(peaks.get("db_connections_peak", 0), in_use)
+                peaks["db_pool_size_peak"] = max(peaks.get("db_pool_size_peak", 0), stats.get("pool_size", 0))
+                peaks["db_requests_waiting_peak"] = max(peaks.get("db_requests_waiting_peak", 0),
+                                                        stats.get("requests_waiting", 0))
+        except Exception:
+            pass
+        try:
+            await asyncio.wait_for(stop.wait(), 0.25)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def drive(args, base_url: str) -> dict:
+    import httpx
+    from metrics import quantile
+
+    run_id = uuid.uuid4().hex[:6]
+    counter = iter(range(args.requests))
+    results = []
+    limits = httpx.Limits(max_connections=args.sessions + 4)
+
+    async with httpx.AsyncClient(timeout=args.timeout, limits=limits) as client:
+        await wait_until_ready(client, f"{base_url}/health/ready")
+
+        async def session(index: int):
+            thread_id = f"loadtest-{run_id}-{index}"
+            turn = 0
+            for n in counter:
+                # 每个会话连续 --turns 轮后换新线程，模拟多轮对话的历史增长
+                if turn == args.turns:
+                    thread_id, turn = f"loadtest-{run_id}-{index}-{n}", 0
+                query = f"{random.choice(QUERIES)} (#{n})"
+                results.append(await run_turn(client, base_url, query, thread_id))
+                turn += 1
+
+        peaks, stop = {}, asyncio.Event()
+        sampler = asyncio.create_task(sample_db_pool(client, base_url, stop, peaks))
+        start = time.perf_counter()
+        await asyncio.gather(*(session(i) for i in range(args.sessions)))
+        elapsed = time.perf_counter() - start
+        stop.set()
+        await sampler
+        server_metrics = (await client.get(f"{base_url}/metrics")).json()
+
+    ok = [r for r in results if not r["error"]]
+    ttft = [r["ttft_ms"] for r in ok]
+    total = [r["total_ms"] for r in ok]
+    report = {
+        "requests": len(results),
+        "sessions": args.sessions,
+        "duration_s": round(elapsed, 2),
+        "throughput_rps": round(len(ok) / elapsed, 2) if elapsed else 0.0,
+        "error_rate": round(1 - len(ok) / len(results), 4) if results else 0.0,
+    }
+    for name, samples in (("ttft", ttft), ("total", total)):
+        for q in (50, 95, 99):
+            report[f"{name}_p{q}_ms"] = round(quantile(samples, q / 100), 1)
+    report["first_event_p50_ms"] = round(quantile([r["first_event_ms"] for r in ok if r["first_event_ms"]], 0.5), 1)
+    report.update(peaks)
+    report["errors"] = sorted({r["error"] for r in results if r["error"]})[:5]
+    report["server_counters"] = {k: server_metrics.get("counters", {}).get(k)
+                                 for k in ("responder_decisions", "tool_cache")}
+    return report
+
+
+def compare(report: dict, baseline: dict):
+    print(f"\n{'指标':<24}{'本次':>12}{'基线':>12}{'变化':>10}")
+    for key, higher_is_better in REPORT_KEYS.items():
+        current, base = report.get(key), baseline.get(key)
+        if current is None or base is None:
+            continue
+        delta = (current - base) / base * 100 if base else 0.0
+        better = (delta > 0) == higher_is_better
+        mark = "" if abs(delta) < 5 else ("✅" if better else "❌")
+        print(f"{key:<24}{current:>12}{base:>12}{delta:>+9.1f}% {mark}")
+
+
+def start_process(cmd, env) -> subprocess.Popen:
+    return subprocess.Popen(cmd, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="端到端 /chat/stream 压测")
+    parser.add_argument("--sessions", type=int, default=10, help="并发会话数")
+    parser.add_argument("--requests", type=int, default=100, help="总请求数")
+    parser.add_argument("--turns", type=int, default=3, help="每个线程连续对话轮数")
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--checkpoint", choices=["memory", "postgres"], default="memory")
+    parser.add_argument("--vector-store", choices=["faiss", "memory", "none"], default="faiss")
+    parser.add_argument("--embeddings", choices=["fake", "real"], default="fake")
+    parser.add_argument("--ttft-ms", type=float, default=300, help="假 LLM 首 token 延迟")
+    parser.add_argument("--tokens-per-s", type=float, default=40, help="假 LLM 吐字速率")
+    parser.add_argument("--tasks-per-turn", type=int, default=1)
+    parser.add_argument("--save", help="将报告保存为基线 JSON")
+    parser.add_argument("--baseline", help="与已保存的基线对比")
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--app-port", type=int, default=0, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args)
+        return
+
+    if args.vector_store == "faiss":
+        try:
+            import faiss  # noqa: F401
+        except ImportError:
+            print(">>> 未安装 faiss-cpu，改用内存向量库")
+            args.vector_store = "memory"
+
+    llm_port, app_port = free_port(), free_port()
+    env = {
+        **os.environ,
+        "DEEPSEEK_API_KEY": os.getenv("DEEPSEEK_API_KEY", "sk-loadtest"),
+        "DEEPSEEK_BASE_URL": f"http://127.0.0.1:{llm_port}/v1",
+        "CHECKPOINT_BACKEND": args.checkpoint,
+    }
+    llm_proc = start_process([sys.executable, "benchmarks/fake_llm_server.py", "--port", str(llm_port),
+                              "--ttft-ms", str(args.ttft_ms), "--tokens-per-s", str(args.tokens_per_s),
+                              "--tasks-per-turn", str(args.tasks_per_turn)], env)
+    app_proc = start_process([sys.executable, os.path.abspath(__file__), "--serve", "--app-port", str(app_port),
+                              "--vector-store", args.vector_store, "--embeddings", args.embeddings], env)
+    try:
+        report = asyncio.run(drive(args, f"http://127.0.0.1:{app_port}"))
+    except Exception:
+        app_proc.terminate()
+        print(app_proc.communicate(timeout=10)[1][-3000:])
+        raise
+    finally:
+        for proc in (app_proc, llm_proc):
+            if proc.poll() is None:
+                proc.terminate()
+                proc.wait(timeout=10)
+
+    report["config"] = {k: getattr(args, k) for k in ("checkpoint", "vector_store", "embeddings", "ttft_ms",
+                                                       "tokens_per_s", "tasks_per_turn", "turns")}
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            compare(report, json.load(f))
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f">>> 基线已保存: {args.save}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+'''
+Author: Yunpeng Shi
+Description: 向量索引调参 - 从线上集合导出全部向量，为每种候选索引建立临时集合，扫描 ef / nprobe 等检索参数，
+             以暴力检索结果为基准报告 recall@k 与单次查询 p50/p99 延迟，语料增长后据此重新选择参数
+
+在 01 目录下执行 (需要可连接的 Milvus):
+    python benchmarks/tune_index.py --queries data/eval_queries.txt --k 5
+    python benchmarks/tune_index.py --index HNSW --index IVF_FLAT --ef 32 64 128 --nprobe 8 16 32
+    python benchmarks/tune_index.py --sample 200 --save tune_report.json      # 无评测集时从语料中抽样作为查询
+
+结果选定后通过 VECTOR_INDEX_TYPE / VECTOR_INDEX_PARAMS / VECTOR_SEARCH_PARAMS 配置，重新执行 build_knowledge.py
+'''
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import metrics  # noqa: E402
+import vector_index  # noqa: E402
+
+
+def load_corpus(client, collection: str):
+    """导出集合中的全部向量"""
+    vectors = []
+    iterator = client.query_iterator(collection, batch_size=1000, output_fields=["vector"])
+    while True:
+        batch = iterator.next()
+        if not batch:
+            iterator.close()
+            break
+        vectors.extend(row["vector"] for row in batch)
+    return np.asarray(vectors, dtype=np.float32)
+
+
+def load_queries(path: str, corpus: np.ndarray, sample: int, seed: int) -> np.ndarray:
+    if path:
+        from embedding_backends import LOCAL_MODEL_PATH, create_embeddings
+        with open(path, "r", encoding="utf-8") as f:
+            texts = [line.strip() for line in f if line.strip()]
+        return np.asarray(create_embeddings(LOCAL_MODEL_PATH).embed_documents(texts), dtype=np.float32)
+    # 没有评测集时抽样语料向量并加少量噪声，近似“与某条切片相近的提问”
+    rng = np.random.default_rng(seed)
+    picked = corpus[rng.choice(len(corpus), size=min(sample, len(corpus)), replace=False)]
+    noisy = picked + rng.normal(scale=0.02, size=picked.shape).astype(np.float32)
+    return noisy / np.linalg.norm(noisy, axis=1, keepdims=True)
+
+
+def build_temp_collection(client, name: str, corpus: np.ndarray, params: dict):
+    from pymilvus import DataType
+    if client.has_collection(name):
+        client.drop_collection(name)
+    schema = client.create_schema(auto_id=False)
+    schema.add_field("row", DataType.INT64, is_primary=True)
+    schema.add_field("vector", DataType.FLOAT_VECTOR, dim=corpus.shape[1])
+    index = client.prepare_index_params()
+    index.add_index(field_name="vector", **params)
+    client.create_collection(name, schema=schema, index_params=index)
+    for start in range(0, len(corpus), 2000):
+        chunk = corpus[start:start + 2000]
+        client.insert(name, [{"row": start + i, "vector": v.tolist()} for i, v in enumerate(chunk)])
+    client.flush(name)
+    client.load_collection(name)
+
+
+def evaluate(client, name: str, queries: np.ndarray, truth: np.ndarray, k: int, params: dict) -> dict:
+    results, latencies = [], []
+    for query in queries:
+        start = time.perf_counter()
+        hits = client.search(name, data=[query.tolist()], limit=k, search_params=params, anns_field="vector")
+        latencies.append((time.perf_counter() - start) * 1000)
+        results.append([hit["id"] for hit in hits[0]])
+    return {
+        "recall": round(vector_index.recall_at_k(results, truth, k), 4),
+        "p50_ms": round(metrics.quantile(latencies, 0.50), 2),
+        "p99_ms": round(metrics.quantile(latencies, 0.99), 2),
+    }
+
+
+def sweep_values(index_type: str, args) -> list:
+    """每种索引要扫描的检索参数组合"""
+    if index_type == "HNSW":
+        return [{"ef": max(ef, args.k)} for ef in (args.ef or vector_index.DEFAULT_SWEEPS["HNSW"]["ef"])]
+    if index_type.startswith("IVF"):
+        return [{"nprobe": n} for n in (args.nprobe or vector_index.DEFAULT_SWEEPS[index_type]["nprobe"])]
+    return [{}]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="向量索引 recall@k / 延迟调参")
+    parser.add_argument("--collection", default="metro_knowledge")
+    parser.add_argument("--queries", help="评测查询文件 (每行一条)")
+    parser.add_argument("--sample", type=int, default=200, help="无评测集时从语料抽样的查询数")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--index", action="append", help="候选索引类型，可重复指定 (默认 HNSW 与 IVF_FLAT)")
+    parser.add_argument("--ef", type=int, nargs="+")
+    parser.add_argument("--nprobe", type=int, nargs="+")
+    parser.add_argument("--metric", default=vector_index.VECTOR_METRIC)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--save", help="将结果保存为 JSON")
+    args = parser.parse_args()
+
+    from pymilvus import MilvusClient
+    host = os.getenv("MILVUS_HOST", "127.0.0.1")
+    port = os.getenv("MILVUS_PORT", "29530")
+    client = MilvusClient(uri=f"http://{host}:{port}", timeout=30)
+
+    corpus = load_corpus(client, args.collection)
+    if not len(corpus):
+        print(f"集合 {args.collection} 为空")
+        return
+    queries = load_queries(args.queries, corpus, args.sample, args.seed)
+    truth = vector_index.exact_top_k(corpus, queries, args.k, args.metric)
+    print(f">>> 语料 {len(corpus)} 条 (dim={corpus.shape[1]})，查询 {len(queries)} 条，k={args.k}")
+
+    report = []
+    for index_type in [t.upper() for t in (args.index or ["HNSW", "IVF_FLAT"])]:
+        params = vector_index.index_params(index_type, overrides={}, num_vectors=len(corpus), metric=args.metric)
+        name = f"{args.collection}_tune_{index_type.lower()}"
+        start = time.perf_counter()
+        build_temp_collection(client, name, corpus, params)
+        build_s = round(time.perf_counter() - start, 1)
+        try:
+            for search in sweep_values(index_type, args):
+                result = evaluate(client, name, queries, truth, args.k,
+                                  {"metric_type": args.metric, "params": search})
+                row = {"index": index_type, "index_params": params["params"], "search_params": search,
+                       "build_s": build_s, **result}
+                report.append(row)
+                print(f"{index_type:<10} {json.dumps(search):<18} recall@{args.k}={result['recall']:.4f}  "
+                      f"p50={result['p50_ms']:.2f}ms  p99={result['p99_ms']:.2f}ms")
+        finally:
+            client.drop_collection(name)
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump({"corpus": len(corpus), "queries": len(queries), "k": args.k, "results": report},
+                      f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
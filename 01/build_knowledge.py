@@ -4,11 +4,16 @@ import re  # <--- 新增：引入正则模块用于清洗数据
 import sys
 from typing import Dict, List
 
+import knowledge_domains
+import vector_index
 from dotenv import load_dotenv
+from embedding_backends import EMBEDDING_BACKEND, create_embeddings
+from embedding_store import CachedEmbeddings, EmbeddingStore, model_id, text_key
 from langchain_community.document_loaders import TextLoader
-from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_milvus import Milvus
 from langchain_text_splitters import RecursiveCharacterTextSplitter
+from regulation_splitter import (EMPTY_METADATA, build_article_index, is_regulation, save_article_index,
+                                 split_regulation)
 
 load_dotenv()
 
@@ -22,6 +27,13 @@ LOCAL_MODEL_PATH = "./models/bge-small-zh-v1.5"
 MILVUS_HOST = os.getenv("MILVUS_HOST", "127.0.0.1")
 MILVUS_PORT = os.getenv("MILVUS_PORT", "29530")
 
+# 本地 FAISS 快照目录：Milvus 不可用时检索工具降级使用 (见 utils.get_snapshot_store)，置空则不生成。
+# 默认与 utils 一致，为仓库根目录的 data/vector_store；索引文件名为 <COLLECTION_NAME>.faiss/.pkl
+SNAPSHOT_DIR = os.getenv(
+    "VECTOR_STORE_SNAPSHOT_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "vector_store"),
+)
+
 # ==========================================
 # 🛠️ 工程师优化点 1: 数据清洗函数
 # ==========================================
@@ -61,6 +73,20 @@ def get_all_files(directory: str, ext: str = ".txt") -> List[str]:
                 file_paths.append(os.path.join(root, file))
     return file_paths
 
+def save_snapshot(splits, embeddings):
+    """
+    与 Milvus 集合同内容的本地 FAISS 索引 (切片向量均已在缓存中，不会重复计算)；
+    切片元数据带 domain 字段，快照检索可按业务域过滤
+    """
+    if not SNAPSHOT_DIR:
+        return
+    try:
+        from langchain_community.vectorstores import FAISS
+        FAISS.from_documents(splits, embeddings).save_local(SNAPSHOT_DIR, index_name=COLLECTION_NAME)
+        print(f">>> 本地向量库快照已保存: {os.path.join(SNAPSHOT_DIR, COLLECTION_NAME)}.faiss")
+    except ImportError:
+        print(">>> 未安装 faiss-cpu，跳过本地向量库快照")
+
 def build_index():
     # ==========================================
     # 0. 环境清理
@@ -74,18 +100,19 @@ def build_index():
     # ==========================================
     # 1. 加载本地模型
     # ==========================================
-    print(f">>> [Phase 1] 正在从本地路径加载模型: {LOCAL_MODEL_PATH}")
+    print(f">>> [Phase 1] 正在从本地路径加载模型: {LOCAL_MODEL_PATH} (后端: {EMBEDDING_BACKEND})")
     if not os.path.exists(LOCAL_MODEL_PATH):
         print(f"❌ 错误：找不到模型文件夹 {LOCAL_MODEL_PATH}")
         return
 
     try:
-        embeddings = HuggingFaceEmbeddings(
-            model_name=LOCAL_MODEL_PATH,
-            model_kwargs={'device': 'cpu'}, 
-            encode_kwargs={'normalize_embeddings': True}
-        )
+        # 与线上检索共用同一个后端配置，保证向量空间一致
+        embeddings = create_embeddings(LOCAL_MODEL_PATH)
         print(">>> ✅ 本地模型加载成功！")
+        # 磁盘向量缓存：未变化的切片直接复用上次计算的向量
+        cache = EmbeddingStore(model_id(LOCAL_MODEL_PATH))
+        embeddings = CachedEmbeddings(embeddings, cache)
+        print(f">>> 向量缓存: {cache.dir} (已缓存 {len(cache)} 条)")
     except Exception as e:
         print(f">>> ❌ 模型加载失败: {e}")
         return
@@ -119,8 +146,8 @@ def build_index():
                 
                 # ⚡ 应用优化 2: 注入更清晰的元数据
                 doc.metadata["source_filename"] = os.path.basename(file_path)
-                
-                # (可选) 你可以在这里尝试提取 "章节标题" 并加入 metadata，但这需要复杂的规则
+                # 领域标签：写入对应分区，检索工具按领域过滤
+                doc.metadata["domain"] = knowledge_domains.classify(file_path, RAW_DOCS_DIR)
             
             docs.extend(loaded_docs)
         except Exception as e:
@@ -147,14 +174,29 @@ def build_index():
             "！", "？", " ", ""
         ]
     )
-    splits = text_splitter.split_documents(docs)
+    splits = []
+    for doc in docs:
+        if is_regulation(doc.page_content):
+            # 规章类文本按条切分：一条一个切片，不重叠，元数据带章/节/条层级
+            articles = split_regulation(doc.page_content, doc.metadata)
+            print(f"    - {doc.metadata['source_filename']}: 按条文结构切分为 {len(articles)} 个切片")
+            splits.extend(articles)
+        else:
+            for chunk in text_splitter.split_documents([doc]):
+                chunk.metadata = {**chunk.metadata, **EMPTY_METADATA}
+                splits.append(chunk)
     print(f">>> 切分完成，共 {len(splits)} 个高密度切片。")
+    domain_counts: Dict[str, int] = {}
+    for chunk in splits:
+        domain_counts[chunk.metadata["domain"]] = domain_counts.get(chunk.metadata["domain"], 0) + 1
+    print(f">>> 领域分布: {domain_counts}")
 
     # ==========================================
     # 3. 重建 Milvus 集合
     # ==========================================
     milvus_uri = f"tcp://{MILVUS_HOST}:{MILVUS_PORT}"
     print(f">>> 正在连接 Milvus: {milvus_uri} 并重建集合...")
+    print(f">>> 向量索引: {vector_index.index_params(num_vectors=len(splits))}")
 
     try:
         Milvus.from_documents(
@@ -167,9 +209,28 @@ def build_index():
                 "timeout": 30
             },
             # ⚠️ 强制清空旧数据，因为切片策略变了，旧向量必须作废
-            drop_old=True 
+            drop_old=True,
+            # 按 domain 分区：带领域过滤的检索只扫描相关分区
+            partition_key_field=knowledge_domains.PARTITION_KEY_FIELD,
+            num_partitions=knowledge_domains.KNOWLEDGE_NUM_PARTITIONS,
+            # 索引类型与参数见 vector_index.py (VECTOR_INDEX_TYPE / VECTOR_INDEX_PARAMS)
+            index_params=vector_index.index_params(num_vectors=len(splits)),
+            search_params=vector_index.search_params(),
         )
         
+        stats = embeddings.stats()
+        print(f">>> 向量缓存命中 {stats['hits']} 条，新计算 {stats['misses']} 条")
+        # 清理语料中已不存在的切片，缓存只保留当前版本
+        current_keys = {text_key(doc.page_content) for doc in splits}
+        if len(cache) > len(current_keys):
+            cache.compact(keep=list(current_keys))
+
+        # 条号直查表：policy_checker 遇到“第X条”引用时直接读取
+        article_index = build_article_index(splits)
+        save_article_index(article_index)
+        print(f">>> 条文索引已生成，共 {len(article_index)} 条")
+        save_snapshot(splits, embeddings)
+
         # 更新日志
         for file_path in new_files:
             file_name = os.path.relpath(file_path, RAW_DOCS_DIR)
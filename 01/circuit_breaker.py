@@ -0,0 +1,124 @@
+'''
+Author: Yunpeng Shi
+Description: 熔断器 - 下游 (如 Milvus) 连续失败达到阈值后熔断 (open)，冷却期内的调用直接快速失败、不再等待超时；
+             冷却结束进入半开 (half_open)，只放行一个探测调用，成功则恢复 (closed)，失败则重新熔断
+
+配置 (环境变量，<NAME> 为熔断器名称的大写，如 VECTOR_STORE):
+    CIRCUIT_<NAME>_FAILURES=3        连续失败多少次后熔断
+    CIRCUIT_<NAME>_RESET_S=30        熔断后多少秒进入半开状态并放行探测
+'''
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+import metrics
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """
+    线程安全 (向量库连接在预热线程与事件循环中都会发生)：
+    - allow() 判断本次调用能否访问下游，熔断期间返回 False，调用方应直接走降级逻辑
+    - 访问下游后必须调用 record_success() / record_failure() 反馈结果
+    - 半开状态下探测调用未反馈时，其他调用仍被拒绝；探测超过 reset_timeout 未反馈视为丢失，重新放行一个
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 3, reset_timeout: float = 30.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probe_started: Optional[float] = None
+        self._last_error: Optional[str] = None
+
+    def _current_state(self) -> str:
+        if self._state == OPEN and self._clock() - self._opened_at >= self.reset_timeout:
+            self._state = HALF_OPEN
+            self._probe_started = None
+        return self._state
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def allow(self) -> bool:
+        with self._lock:
+            state = self._current_state()
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN:
+                now = self._clock()
+                if self._probe_started is None or now - self._probe_started >= self.reset_timeout:
+                    self._probe_started = now
+                    metrics.incr("circuit_breaker", breaker=self.name, event="probe")
+                    return True
+        metrics.incr("circuit_breaker", breaker=self.name, event="rejected")
+        return False
+
+    def record_success(self):
+        with self._lock:
+            if self._state != CLOSED:
+                metrics.incr("circuit_breaker", breaker=self.name, event="closed")
+            self._state = CLOSED
+            self._failures = 0
+            self._opened_at = None
+            self._probe_started = None
+
+    def record_failure(self, error: Any = None):
+        with self._lock:
+            self._failures += 1
+            if error is not None:
+                self._last_error = str(error)[:200]
+            # 半开探测失败立即重新熔断
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != OPEN:
+                    metrics.incr("circuit_breaker", breaker=self.name, event="opened")
+                self._state = OPEN
+                self._opened_at = self._clock()
+                self._probe_started = None
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            state = self._current_state()
+            retry_in = None
+            if state == OPEN:
+                retry_in = round(max(0.0, self.reset_timeout - (self._clock() - self._opened_at)), 1)
+            return {
+                "state": state,
+                "consecutive_failures": self._failures,
+                "retry_in_s": retry_in,
+                "last_error": self._last_error,
+                "rejected": metrics.get_counter("circuit_breaker", breaker=self.name, event="rejected"),
+                "opened": metrics.get_counter("circuit_breaker", breaker=self.name, event="opened"),
+            }
+
+
+BREAKERS: Dict[str, CircuitBreaker] = {}
+
+
+def get(name: str, failure_threshold: int = 3, reset_timeout: float = 30.0) -> CircuitBreaker:
+    """按名称获取 (首次调用时创建) 熔断器，阈值可被 CIRCUIT_<NAME>_* 环境变量覆盖"""
+    breaker = BREAKERS.get(name)
+    if breaker is None:
+        prefix = f"CIRCUIT_{name.upper()}"
+        breaker = CircuitBreaker(
+            name,
+            failure_threshold=int(os.getenv(f"{prefix}_FAILURES", failure_threshold)),
+            reset_timeout=float(os.getenv(f"{prefix}_RESET_S", reset_timeout)),
+        )
+        BREAKERS[name] = breaker
+    return breaker
+
+
+def snapshot() -> Dict[str, Dict[str, Any]]:
+    return {name: breaker.snapshot() for name, breaker in BREAKERS.items()}
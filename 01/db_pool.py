@@ -0,0 +1,84 @@
+'''
+Author: Yunpeng Shi
+Description: 数据库连接池配置 - 按 worker 数与全局连接预算计算每个 worker 的 min/max，启动时预先建好 min_size 个连接，
+             并导出当前 worker 的等待与饱和度指标
+
+配置 (环境变量):
+    WEB_CONCURRENCY=1                uvicorn worker 数 (serve.py 会按 --workers 设置)
+    DB_MAX_CONNECTIONS=100           Postgres max_connections，所有 worker 共享的连接预算
+    DB_RESERVED_CONNECTIONS=10       预留给运维、init_db 等脚本的连接数
+    DB_POOL_MIN_SIZE / DB_POOL_MAX_SIZE   显式指定单个 worker 的连接池大小 (不设置则按预算自动计算)
+    DB_POOL_OPEN_TIMEOUT=30          启动时等待 min_size 个连接建好的超时秒数
+'''
+import math
+import os
+from typing import Optional, Tuple
+
+from psycopg_pool import AsyncConnectionPool
+
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+DB_MAX_CONNECTIONS = int(os.getenv("DB_MAX_CONNECTIONS", "100"))
+DB_RESERVED_CONNECTIONS = int(os.getenv("DB_RESERVED_CONNECTIONS", "10"))
+DB_POOL_MIN_SIZE = os.getenv("DB_POOL_MIN_SIZE")
+DB_POOL_MAX_SIZE = os.getenv("DB_POOL_MAX_SIZE")
+DB_POOL_OPEN_TIMEOUT = float(os.getenv("DB_POOL_OPEN_TIMEOUT", "30"))
+
+# 单个 worker 连接池上限：超过后收益不大 (事件循环本身成为瓶颈)，多余的预算留给扩容
+MAX_POOL_PER_WORKER = 20
+
+
+def pool_sizing(workers: int, max_connections: int = DB_MAX_CONNECTIONS,
+                reserved: int = DB_RESERVED_CONNECTIONS) -> Tuple[int, int]:
+    """
+    按全局预算平分给每个 worker，返回 (min_size, max_size)：
+    max_size = (max_connections - reserved) // workers，且不超过 MAX_POOL_PER_WORKER；
+    min_size 取 max_size 的四分之一 (至少 1)，常驻连接覆盖日常流量，突发时再扩到 max_size
+    """
+    budget = max_connections - reserved
+    if workers < 1 or budget < workers:
+        raise ValueError(f"连接预算不足：{workers} 个 worker 至少需要 {workers} 个连接，"
+                         f"可用 {budget} (max_connections={max_connections}, reserved={reserved})")
+    max_size = min(MAX_POOL_PER_WORKER, budget // workers)
+    min_size = max(1, math.ceil(max_size / 4))
+    return min_size, max_size
+
+
+def configured_sizing(workers: Optional[int] = None) -> Tuple[int, int]:
+    """显式配置优先，否则按预算计算"""
+    min_size, max_size = pool_sizing(workers or WEB_CONCURRENCY)
+    if DB_POOL_MAX_SIZE:
+        max_size = int(DB_POOL_MAX_SIZE)
+    if DB_POOL_MIN_SIZE:
+        min_size = int(DB_POOL_MIN_SIZE)
+    return min(min_size, max_size), max_size
+
+
+async def open_pool(conninfo: str) -> AsyncConnectionPool:
+    """创建连接池并等待 min_size 个连接建立完成，首批请求不再承担建连耗时"""
+    min_size, max_size = configured_sizing()
+    pool = AsyncConnectionPool(conninfo=conninfo, min_size=min_size, max_size=max_size,
+                               kwargs={"autocommit": True}, open=False)
+    try:
+        await pool.open(wait=True, timeout=DB_POOL_OPEN_TIMEOUT)
+    except Exception:
+        await pool.close()
+        raise
+    return pool
+
+
+def pool_stats(pool: AsyncConnectionPool) -> dict:
+    """
+    psycopg_pool 原始统计 + 派生指标：
+    in_use 正在使用的连接数，saturation = in_use / pool_max，
+    avg_wait_ms 为排队请求的平均等待时间 (requests_queued 为需要排队的请求数)
+    """
+    stats = pool.get_stats()
+    in_use = stats.get("pool_size", 0) - stats.get("pool_available", 0)
+    queued = stats.get("requests_queued", 0)
+    return {
+        **stats,
+        "pid": os.getpid(),
+        "in_use": in_use,
+        "saturation": round(in_use / stats["pool_max"], 3) if stats.get("pool_max") else 0.0,
+        "avg_wait_ms": round(stats.get("requests_wait_ms", 0) / queued, 1) if queued else 0.0,
+    }
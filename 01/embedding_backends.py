@@ -0,0 +1,246 @@
+'''
+Author: Yunpeng Shi
+Description: Embedding 后端工厂 - 默认 PyTorch (HuggingFaceEmbeddings)，可选 ONNX Runtime (支持 int8 动态量化)
+             通过 EMBEDDING_BACKEND=torch|onnx 切换，utils.get_embeddings() 与 build_knowledge.py 共用
+
+用法:
+    python embedding_backends.py export [--quantize]   # 将本地模型导出为 ONNX
+    python embedding_backends.py verify [--quantize]   # 与 PyTorch 输出对比，检查误差
+'''
+import argparse
+import json
+import logging
+import os
+from typing import List, Optional, Tuple
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger("MetroAgent")
+
+LOCAL_MODEL_PATH = "./models/bge-small-zh-v1.5"
+FALLBACK_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+ONNX_DIR = os.getenv("EMBEDDING_ONNX_DIR", "./models/bge-small-zh-v1.5-onnx")
+ONNX_QUANTIZE = os.getenv("EMBEDDING_ONNX_QUANTIZE", "0") == "1"
+ONNX_THREADS = int(os.getenv("EMBEDDING_ONNX_THREADS", "0"))  # 0 表示由 onnxruntime 自行决定
+
+# 与 PyTorch 归一化向量的允许误差 (余弦相似度下限)
+DEFAULT_MIN_COSINE = 0.999
+QUANTIZED_MIN_COSINE = 0.98
+
+
+def onnx_model_file(onnx_dir: str, quantize: bool) -> str:
+    return os.path.join(onnx_dir, "model_int8.onnx" if quantize else "model.onnx")
+
+
+def read_pooling_mode(model_path: str) -> str:
+    """读取 sentence-transformers 的池化配置，bge 系列为 CLS 池化"""
+    config_path = os.path.join(model_path, "1_Pooling", "config.json")
+    try:
+        with open(config_path, "r", encoding="utf-8") as f:
+            config = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return "cls" if "bge" in os.path.basename(model_path.rstrip("/")) else "mean"
+    if config.get("pooling_mode_cls_token"):
+        return "cls"
+    return "mean"
+
+
+class OnnxEmbeddings(Embeddings):
+    """
+    ONNX Runtime 推理的句向量模型，输出与 HuggingFaceEmbeddings(normalize_embeddings=True) 对齐。
+    只依赖 onnxruntime + tokenizers，运行时不需要导入 torch。
+    """
+
+    def __init__(self, model_path: str, onnx_path: str, max_length: int = 512, batch_size: int = 32,
+                 pooling: Optional[str] = None, threads: int = ONNX_THREADS):
+        try:
+            import onnxruntime as ort
+            from tokenizers import Tokenizer
+        except ImportError as e:
+            raise ImportError("ONNX 后端需要安装 onnxruntime 与 tokenizers") from e
+
+        self.model_path = model_path
+        self.onnx_path = onnx_path
+        self.batch_size = batch_size
+        self.pooling = pooling or read_pooling_mode(model_path)
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_path, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=max_length)
+        self.tokenizer.enable_padding()
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(onnx_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(texts)
+        input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = np.array([e.type_ids for e in encodings], dtype=np.int64)
+
+        hidden = self.session.run(None, feeds)[0]
+        if self.pooling == "cls":
+            vectors = hidden[:, 0]
+        else:
+            mask = attention_mask[..., None].astype(hidden.dtype)
+            vectors = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.clip(norms, 1e-12, None)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        texts = [t.replace("\n", " ") for t in texts]
+        results = []
+        for i in range(0, len(texts), self.batch_size):
+            results.append(self._encode_batch(texts[i:i + self.batch_size]))
+        if not results:
+            return []
+        return np.concatenate(results).astype(np.float32).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+def _staging_path(path: str) -> str:
+    """同目录下的临时文件 (保留 .onnx 后缀)，写完后 os.replace 到最终路径"""
+    root, ext = os.path.splitext(path)
+    return f"{root}.tmp{os.getpid()}{ext}"
+
+
+def _export_fp32(model_path: str, fp32_path: str):
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    logger.info(f"正在导出 ONNX 模型: {model_path} -> {fp32_path}")
+    tokenizer = AutoTokenizer.from_pretrained(model_path)
+    model = AutoModel.from_pretrained(model_path).eval()
+    sample = tokenizer(["杭州地铁乘车规则"], return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+    staging = _staging_path(fp32_path)
+    try:
+        with torch.no_grad():
+            torch.onnx.export(
+                model,
+                tuple(sample[name] for name in input_names),
+                staging,
+                input_names=input_names,
+                output_names=["last_hidden_state"],
+                dynamic_axes=dynamic_axes,
+                opset_version=17,
+            )
+        os.replace(staging, fp32_path)
+    finally:
+        if os.path.exists(staging):
+            os.remove(staging)
+
+
+def _quantize(fp32_path: str, int8_path: str):
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    logger.info(f"正在进行 int8 动态量化: {int8_path}")
+    staging = _staging_path(int8_path)
+    try:
+        quantize_dynamic(fp32_path, staging, weight_type=QuantType.QInt8)
+        os.replace(staging, int8_path)
+    finally:
+        if os.path.exists(staging):
+            os.remove(staging)
+
+
+def export_onnx(model_path: str = LOCAL_MODEL_PATH, onnx_dir: str = ONNX_DIR, quantize: bool = False) -> str:
+    """
+    将本地 HuggingFace 模型导出为 ONNX (只在导出时需要 torch/transformers)，可选 int8 动态量化。
+    返回最终可用的模型文件路径。
+    多个 uvicorn worker 首次使用时会同时调用：文件锁保证只有一个进程导出，其余进程等待后直接复用；
+    先写临时文件再 os.replace，导出中途崩溃不会留下被当作可用模型的半截文件
+    """
+    from filelock import FileLock
+
+    os.makedirs(onnx_dir, exist_ok=True)
+    fp32_path = onnx_model_file(onnx_dir, quantize=False)
+    int8_path = onnx_model_file(onnx_dir, quantize=True)
+    with FileLock(os.path.join(onnx_dir, ".export.lock")):
+        if not os.path.exists(fp32_path):
+            _export_fp32(model_path, fp32_path)
+        if not quantize:
+            return fp32_path
+        if not os.path.exists(int8_path):
+            _quantize(fp32_path, int8_path)
+    return int8_path
+
+
+def resolve_model() -> Tuple[str, str]:
+    """优先使用本地模型；本地模型不存在时退回可在线下载的默认模型 (只能走 PyTorch 后端)"""
+    if os.path.exists(LOCAL_MODEL_PATH):
+        return LOCAL_MODEL_PATH, EMBEDDING_BACKEND
+    logger.warning(f"⚠️ 本地模型未找到: {LOCAL_MODEL_PATH}，尝试使用默认 all-MiniLM-L6-v2 (可能需要下载)")
+    # 远程模型无法导出 ONNX，退回 PyTorch 后端
+    return FALLBACK_MODEL, "torch"
+
+
+def create_embeddings(model_path: str = LOCAL_MODEL_PATH, backend: Optional[str] = None) -> Embeddings:
+    """按配置创建 Embedding 模型；ONNX 模型不存在时自动从本地模型导出"""
+    backend = backend or EMBEDDING_BACKEND
+    if backend == "onnx":
+        onnx_path = onnx_model_file(ONNX_DIR, ONNX_QUANTIZE)
+        if not os.path.exists(onnx_path):
+            onnx_path = export_onnx(model_path, ONNX_DIR, quantize=ONNX_QUANTIZE)
+        return OnnxEmbeddings(model_path, onnx_path)
+
+    from langchain_huggingface import HuggingFaceEmbeddings
+    return HuggingFaceEmbeddings(
+        model_name=model_path,
+        model_kwargs={'device': 'cpu'},  # Docker 内通常用 CPU
+        encode_kwargs={'normalize_embeddings': True}
+    )
+
+
+def compare_embeddings(candidate: Embeddings, reference: Embeddings, texts: List[str]) -> dict:
+    """对比两个后端输出的归一化向量，返回最大绝对误差与最小余弦相似度"""
+    a = np.asarray(candidate.embed_documents(texts), dtype=np.float32)
+    b = np.asarray(reference.embed_documents(texts), dtype=np.float32)
+    cosine = (a * b).sum(axis=1) / (np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1))
+    return {"max_abs_diff": float(np.abs(a - b).max()), "min_cosine": float(cosine.min())}
+
+
+SAMPLE_TEXTS = [
+    "折叠自行车可以带进地铁吗？",
+    "乘客在车厢内饮食会受到什么处罚",
+    "第二十条 乘客应当自觉遵守乘车秩序，先下后上。",
+    "我的交通卡余额还有多少",
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ONNX Embedding 后端工具")
+    parser.add_argument("command", choices=["export", "verify"])
+    parser.add_argument("--model-path", default=LOCAL_MODEL_PATH)
+    parser.add_argument("--onnx-dir", default=ONNX_DIR)
+    parser.add_argument("--quantize", action="store_true")
+    args = parser.parse_args()
+
+    onnx_path = export_onnx(args.model_path, args.onnx_dir, quantize=args.quantize)
+    print(f">>> ONNX 模型: {onnx_path}")
+    if args.command == "verify":
+        result = compare_embeddings(
+            OnnxEmbeddings(args.model_path, onnx_path),
+            create_embeddings(args.model_path, backend="torch"),
+            SAMPLE_TEXTS,
+        )
+        threshold = QUANTIZED_MIN_COSINE if args.quantize else DEFAULT_MIN_COSINE
+        status = "✅ 通过" if result["min_cosine"] >= threshold else "❌ 超出误差"
+        print(f">>> {status}: {result} (余弦下限 {threshold})")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
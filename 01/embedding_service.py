@@ -0,0 +1,161 @@
+'''
+Author: Yunpeng Shi
+Description: 进程内 Embedding 微批处理服务 - 把并发的查询向量化请求攒成一批，在专用线程池/进程池中统一推理，
+             避免 CPU 密集的前向计算占用事件循环或挤占默认线程池
+
+配置 (环境变量):
+    EMBEDDING_BATCHING=1|0          是否启用微批处理
+    EMBEDDING_BATCH_MAX_SIZE=16     单批最多合并的查询数
+    EMBEDDING_BATCH_MAX_WAIT_MS=5   第一个请求到达后最多等待多久凑批
+    EMBEDDING_EXECUTOR=thread|process   process 模式下模型只在子进程中加载 (spawn 启动)，父进程不保留副本
+    EMBEDDING_EXECUTOR_WORKERS=1    推理线程/进程数
+'''
+import asyncio
+import multiprocessing
+import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, List, Optional
+
+import embedding_backends
+import metrics
+from langchain_core.embeddings import Embeddings
+
+EMBEDDING_BATCHING = os.getenv("EMBEDDING_BATCHING", "1") == "1"
+BATCH_MAX_SIZE = int(os.getenv("EMBEDDING_BATCH_MAX_SIZE", "16"))
+BATCH_MAX_WAIT_MS = float(os.getenv("EMBEDDING_BATCH_MAX_WAIT_MS", "5"))
+EXECUTOR_KIND = os.getenv("EMBEDDING_EXECUTOR", "thread")
+EXECUTOR_WORKERS = int(os.getenv("EMBEDDING_EXECUTOR_WORKERS", "1"))
+
+
+# --- 进程池模式：每个子进程各自加载一份模型 ---
+_process_embeddings: Optional[Embeddings] = None
+
+
+def _init_process_worker(model_path: str, backend: str):
+    global _process_embeddings
+    _process_embeddings = embedding_backends.create_embeddings(model_path, backend=backend)
+
+
+def _embed_in_process(texts: List[str]) -> List[List[float]]:
+    return _process_embeddings.embed_documents(texts)
+
+
+class BatchingEmbeddings(Embeddings):
+    """
+    包装任意 Embeddings：
+    - aembed_query 进入队列，由收集协程在 max_wait_ms 内凑满 max_batch_size 后一次 embed_documents
+    - 推理线程都在忙时，新请求继续排队，空出线程后自然形成更大的批
+    - aembed_documents (批量建库等) 不再合并，直接提交到同一个执行器
+    - 同步接口原样透传，供脚本与同步检索路径使用；进程池模式下没有本进程的模型 (base 为 None)，同步调用也提交到进程池
+    """
+
+    def __init__(self, base: Optional[Embeddings], max_batch_size: int = BATCH_MAX_SIZE,
+                 max_wait_ms: float = BATCH_MAX_WAIT_MS, executor: Optional[Executor] = None,
+                 workers: int = EXECUTOR_WORKERS, embed_fn: Optional[Callable[[List[str]], List[List[float]]]] = None):
+        self.base = base
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self.workers = max(1, workers)
+        self.executor = executor or ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="embedding")
+        # 进程池模式下 embed_fn 为可 pickle 的模块级函数
+        self.embed_fn = embed_fn or base.embed_documents
+        # 队列与收集协程绑定在创建它们的事件循环上 (每个 uvicorn worker 一个循环)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._collector: Optional[asyncio.Task] = None
+
+    # --- 同步接口 ---
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if self.base is None:
+            return self.executor.submit(self.embed_fn, list(texts)).result()
+        return self.base.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        if self.base is None:
+            return self.embed_documents([text])[0]
+        return self.base.embed_query(text)
+
+    # --- 异步接口 ---
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self.embed_fn, list(texts))
+
+    async def aembed_query(self, text: str) -> List[float]:
+        loop = asyncio.get_running_loop()
+        self._ensure_collector(loop)
+        future = loop.create_future()
+        await self._queue.put((text, future, time.perf_counter()))
+        return await future
+
+    def _ensure_collector(self, loop: asyncio.AbstractEventLoop):
+        if self._loop is loop and self._collector is not None and not self._collector.done():
+            return
+        self._loop = loop
+        self._queue = asyncio.Queue()
+        self._slots = asyncio.Semaphore(self.workers)
+        self._collector = loop.create_task(self._collect(), name="embedding-batch-collector")
+
+    async def _collect(self):
+        queue, slots = self._queue, self._slots
+        loop = asyncio.get_running_loop()
+        while True:
+            first = await queue.get()
+            # 等到有空闲推理线程再开始凑批，期间到达的请求都会并入这一批
+            await slots.acquire()
+            batch = [first]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                if not queue.empty():
+                    batch.append(queue.get_nowait())
+                    continue
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            loop.create_task(self._run_batch(batch, slots))
+
+    async def _run_batch(self, batch: list, slots: asyncio.Semaphore):
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        for _, _, enqueued_at in batch:
+            metrics.observe("embedding_queue_delay_ms", (started - enqueued_at) * 1000)
+        metrics.observe("embedding_batch_size", len(batch))
+        metrics.observe("embedding_batch_fill", len(batch) / self.max_batch_size)
+
+        try:
+            vectors = await loop.run_in_executor(self.executor, self.embed_fn, [text for text, _, _ in batch])
+        except Exception as e:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+        else:
+            for (_, future, _), vector in zip(batch, vectors):
+                # 调用方已取消 (如工具超时) 时直接丢弃结果
+                if not future.done():
+                    future.set_result(vector)
+        finally:
+            metrics.observe("embedding_batch_ms", (time.perf_counter() - started) * 1000)
+            slots.release()
+
+    def close(self):
+        if self._collector is not None:
+            self._collector.cancel()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+def load_embeddings(model_path: str, backend: str) -> Embeddings:
+    """
+    按配置加载模型并加上微批处理。进程池模式下模型只在子进程中加载，父进程不再多占一份内存；
+    子进程以 spawn 方式启动，不继承父进程中已导入的 torch 及其线程池 (fork 之后这些状态不可靠)
+    """
+    if EMBEDDING_BATCHING and EXECUTOR_KIND == "process":
+        executor = ProcessPoolExecutor(max_workers=EXECUTOR_WORKERS, mp_context=multiprocessing.get_context("spawn"),
+                                       initializer=_init_process_worker, initargs=(model_path, backend))
+        return BatchingEmbeddings(None, executor=executor, embed_fn=_embed_in_process)
+    base = embedding_backends.create_embeddings(model_path, backend=backend)
+    return BatchingEmbeddings(base) if EMBEDDING_BATCHING else base
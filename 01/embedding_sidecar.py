@@ -0,0 +1,432 @@
+'''
+Author: Yunpeng Shi
+Description: 共享 Embedding sidecar - 单独进程加载一次模型，通过 Unix socket 为所有 uvicorn worker 提供向量化服务
+             请求/响应头为定长二进制结构，向量结果写入共享内存缓冲区，不经过 socket 传输
+
+用法:
+    python embedding_sidecar.py serve [--socket PATH]   # 启动 sidecar (加载完模型后才开始监听)
+    python embedding_sidecar.py ping  [--socket PATH]   # 检查 sidecar 是否可用
+worker 侧设置 EMBEDDING_SIDECAR_SOCKET 后，utils.get_embeddings() 返回 SidecarEmbeddings；
+sidecar 不可用时自动退回进程内加载模型，并在 EMBEDDING_SIDECAR_RETRY_S 秒后重试 sidecar。
+
+协议 (网络字节序):
+    请求  MAGIC(4s) VERSION(B) OP(B) PAYLOAD_LEN(I)  + 载荷: COUNT(I) + COUNT 个 LEN(I) + UTF-8 文本
+    响应  MAGIC(4s) STATUS(B) COUNT(I) DIM(H) EXTRA_LEN(H) + EXTRA
+          STATUS=0 时 EXTRA 为共享内存名，其中前 COUNT*DIM 个 float32 即结果；否则 EXTRA 为错误信息
+'''
+import argparse
+import asyncio
+import logging
+import os
+import signal
+import socket
+import struct
+import threading
+import time
+from multiprocessing import resource_tracker, shared_memory
+from typing import Callable, Dict, List, Optional
+
+import embedding_backends
+import embedding_service
+import metrics
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger("MetroAgent")
+
+SIDECAR_SOCKET = os.getenv("EMBEDDING_SIDECAR_SOCKET", "")
+SIDECAR_TIMEOUT = float(os.getenv("EMBEDDING_SIDECAR_TIMEOUT", "10"))
+SIDECAR_RETRY_S = float(os.getenv("EMBEDDING_SIDECAR_RETRY_S", "30"))
+SIDECAR_POOL_SIZE = int(os.getenv("EMBEDDING_SIDECAR_POOL_SIZE", "8"))
+DEFAULT_SOCKET = "/tmp/metro_embedding.sock"
+
+MAGIC = b"MEMB"
+VERSION = 1
+OP_PING = 0
+OP_EMBED = 1
+STATUS_OK = 0
+STATUS_ERROR = 1
+
+REQUEST_HEADER = struct.Struct("!4sBBI")
+RESPONSE_HEADER = struct.Struct("!4sBIHH")
+MAX_EXTRA = 0xFFFF
+
+
+class SidecarUnavailable(Exception):
+    """sidecar 未启动、连接中断或超时，调用方应退回进程内推理"""
+
+
+# --- 编解码 ---
+def encode_request(op: int, texts: List[str]) -> bytes:
+    encoded = [t.encode("utf-8") for t in texts]
+    payload = struct.pack(f"!I{len(encoded)}I", len(encoded), *(len(b) for b in encoded)) + b"".join(encoded)
+    return REQUEST_HEADER.pack(MAGIC, VERSION, op, len(payload)) + payload
+
+
+def decode_texts(payload: bytes) -> List[str]:
+    (count,) = struct.unpack_from("!I", payload)
+    lengths = struct.unpack_from(f"!{count}I", payload, 4)
+    offset = 4 + 4 * count
+    texts = []
+    for length in lengths:
+        texts.append(payload[offset:offset + length].decode("utf-8"))
+        offset += length
+    return texts
+
+
+def encode_response(status: int, count: int = 0, dim: int = 0, extra: bytes = b"") -> bytes:
+    extra = extra[:MAX_EXTRA]
+    return RESPONSE_HEADER.pack(MAGIC, status, count, dim, len(extra)) + extra
+
+
+# 本进程 (sidecar) 创建的共享内存段，由创建方负责登记与释放
+_owned_segments = set()
+
+
+def _attach_shared_memory(name: str) -> shared_memory.SharedMemory:
+    """只读方挂载共享内存，不登记到 resource_tracker (否则 worker 退出时会误删 sidecar 的缓冲区)"""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:  # Python < 3.13
+        shm = shared_memory.SharedMemory(name=name)
+        # 同一进程内创建的段 (如测试中服务端与客户端同进程) 不能注销，否则释放时 tracker 报错
+        if shm.name not in _owned_segments:
+            resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+
+class _ResultReader:
+    """客户端连接持有的共享内存挂载，sidecar 扩容换缓冲区时重新挂载"""
+
+    def __init__(self):
+        self.shm: Optional[shared_memory.SharedMemory] = None
+
+    def read(self, name: str, count: int, dim: int) -> List[List[float]]:
+        if self.shm is None or self.shm.name.lstrip("/") != name.lstrip("/"):
+            self.close()
+            self.shm = _attach_shared_memory(name)
+        view = np.ndarray((count, dim), dtype=np.float32, buffer=self.shm.buf)
+        vectors = view.tolist()
+        del view
+        return vectors
+
+    def close(self):
+        if self.shm is not None:
+            self.shm.close()
+            self.shm = None
+
+
+def _parse_response(header: bytes):
+    magic, status, count, dim, extra_len = RESPONSE_HEADER.unpack(header)
+    if magic != MAGIC:
+        raise SidecarUnavailable("sidecar 响应格式错误")
+    return status, count, dim, extra_len
+
+
+def _vectors_or_raise(reader: _ResultReader, status: int, count: int, dim: int, extra: bytes):
+    if status != STATUS_OK:
+        raise RuntimeError(f"sidecar 推理失败: {extra.decode('utf-8', 'replace')}")
+    return reader.read(extra.decode("ascii"), count, dim) if count else []
+
+
+# --- 客户端 ---
+class _SyncConnection:
+    def __init__(self, path: str, timeout: float):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(timeout)
+        self.sock.connect(path)
+        self.reader = _ResultReader()
+
+    def _recv_exactly(self, size: int) -> bytes:
+        chunks, remaining = [], size
+        while remaining:
+            chunk = self.sock.recv(remaining)
+            if not chunk:
+                raise SidecarUnavailable("sidecar 关闭了连接")
+            chunks.append(chunk)
+            remaining -= len(chunk)
+        return b"".join(chunks)
+
+    def request(self, op: int, texts: List[str]):
+        self.sock.sendall(encode_request(op, texts))
+        status, count, dim, extra_len = _parse_response(self._recv_exactly(RESPONSE_HEADER.size))
+        extra = self._recv_exactly(extra_len)
+        return _vectors_or_raise(self.reader, status, count, dim, extra)
+
+    def close(self):
+        self.reader.close()
+        self.sock.close()
+
+
+class _AsyncConnection:
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.stream_reader = reader
+        self.writer = writer
+        self.reader = _ResultReader()
+
+    async def request(self, op: int, texts: List[str]):
+        self.writer.write(encode_request(op, texts))
+        await self.writer.drain()
+        status, count, dim, extra_len = _parse_response(
+            await self.stream_reader.readexactly(RESPONSE_HEADER.size)
+        )
+        extra = await self.stream_reader.readexactly(extra_len)
+        return _vectors_or_raise(self.reader, status, count, dim, extra)
+
+    def close(self):
+        self.reader.close()
+        self.writer.close()
+
+
+class SidecarEmbeddings(Embeddings):
+    """
+    sidecar 客户端：
+    - 同步接口每个线程一条连接，异步接口按事件循环维护一个小连接池
+    - 连接失败/超时后标记 sidecar 不可用，retry_interval 秒内直接走进程内兜底模型
+    - sidecar 返回的推理错误原样抛出，不触发兜底
+    """
+
+    def __init__(self, socket_path: str, fallback_factory: Callable[[], Embeddings],
+                 timeout: float = SIDECAR_TIMEOUT, retry_interval: float = SIDECAR_RETRY_S,
+                 pool_size: int = SIDECAR_POOL_SIZE):
+        self.socket_path = socket_path
+        self.fallback_factory = fallback_factory
+        self.timeout = timeout
+        self.retry_interval = retry_interval
+        self.pool_size = pool_size
+        self._local = threading.local()
+        self._pool: List[_AsyncConnection] = []
+        self._pool_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._down_until = 0.0
+        self._fallback: Optional[Embeddings] = None
+        self._fallback_lock = threading.Lock()
+
+    # --- 可用性与兜底 ---
+    def _available(self) -> bool:
+        return time.monotonic() >= self._down_until
+
+    def _mark_down(self, error: BaseException):
+        self._down_until = time.monotonic() + self.retry_interval
+        metrics.incr("embedding_sidecar_fallback")
+        logger.warning(f"⚠️ Embedding sidecar 不可用 ({error!r})，{self.retry_interval:.0f}s 内改用进程内模型")
+
+    def _get_fallback(self) -> Embeddings:
+        with self._fallback_lock:
+            if self._fallback is None:
+                self._fallback = self.fallback_factory()
+            return self._fallback
+
+    # --- 同步接口 ---
+    def _request_sync(self, texts: List[str]) -> List[List[float]]:
+        conn = getattr(self._local, "conn", None)
+        try:
+            if conn is None:
+                conn = self._local.conn = _SyncConnection(self.socket_path, self.timeout)
+            return conn.request(OP_EMBED, texts)
+        except (OSError, SidecarUnavailable) as e:
+            if conn is not None:
+                conn.close()
+            self._local.conn = None
+            raise SidecarUnavailable(str(e)) from e
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if self._available():
+            try:
+                return self._request_sync(list(texts))
+            except SidecarUnavailable as e:
+                self._mark_down(e)
+        return self._get_fallback().embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    # --- 异步接口 ---
+    async def _acquire(self) -> _AsyncConnection:
+        loop = asyncio.get_running_loop()
+        if self._pool_loop is not loop:
+            # 连接绑定在事件循环上，换了循环 (如测试) 就丢弃旧连接
+            self._pool, self._pool_loop = [], loop
+        if self._pool:
+            return self._pool.pop()
+        reader, writer = await asyncio.open_unix_connection(self.socket_path)
+        return _AsyncConnection(reader, writer)
+
+    def _release(self, conn: _AsyncConnection):
+        if len(self._pool) < self.pool_size:
+            self._pool.append(conn)
+        else:
+            conn.close()
+
+    async def _request_async(self, texts: List[str]) -> List[List[float]]:
+        conn = None
+        try:
+            conn = await asyncio.wait_for(self._acquire(), self.timeout)
+            vectors = await asyncio.wait_for(conn.request(OP_EMBED, texts), self.timeout)
+        except RuntimeError:
+            # 服务端返回的业务错误，连接本身仍可复用；获取连接阶段的错误则没有连接可放回
+            if conn is not None:
+                self._release(conn)
+            raise
+        except (OSError, EOFError, asyncio.TimeoutError, SidecarUnavailable) as e:
+            if conn is not None:
+                conn.close()
+            raise SidecarUnavailable(str(e)) from e
+        except BaseException:
+            # 被取消时连接上可能残留未读完的响应，不能放回连接池
+            if conn is not None:
+                conn.close()
+            raise
+        self._release(conn)
+        return vectors
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        if self._available():
+            try:
+                return await self._request_async(list(texts))
+            except SidecarUnavailable as e:
+                self._mark_down(e)
+        fallback = await asyncio.to_thread(self._get_fallback)
+        return await fallback.aembed_documents(texts)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text]))[0]
+
+
+# --- 服务端 ---
+class _ResultBuffer:
+    """每条连接独占一块共享内存，按需扩容；连接断开时释放"""
+
+    def __init__(self):
+        self.shm: Optional[shared_memory.SharedMemory] = None
+
+    def write(self, vectors: np.ndarray) -> str:
+        nbytes = vectors.nbytes
+        if self.shm is None or self.shm.size < nbytes:
+            self.close()
+            self.shm = shared_memory.SharedMemory(create=True, size=max(nbytes, 64 * 1024))
+            _owned_segments.add(self.shm.name)
+        np.ndarray(vectors.shape, dtype=np.float32, buffer=self.shm.buf)[:] = vectors
+        return self.shm.name
+
+    def close(self):
+        if self.shm is not None:
+            self.shm.close()
+            self.shm.unlink()
+            _owned_segments.discard(self.shm.name)
+            self.shm = None
+
+
+class SidecarServer:
+    def __init__(self, embeddings: Embeddings, socket_path: str):
+        self.embeddings = embeddings
+        self.socket_path = socket_path
+        self._connections: Dict[asyncio.Task, asyncio.StreamWriter] = {}
+
+    async def _embed(self, texts: List[str]) -> np.ndarray:
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        if len(texts) == 1:
+            # 单条查询走微批处理，来自不同 worker 的并发查询在这里合并
+            vectors = [await self.embeddings.aembed_query(texts[0])]
+        else:
+            vectors = await self.embeddings.aembed_documents(texts)
+        return np.asarray(vectors, dtype=np.float32).reshape(len(texts), -1)
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        buffer = _ResultBuffer()
+        task = asyncio.current_task()
+        self._connections[task] = writer
+        try:
+            while True:
+                try:
+                    header = await reader.readexactly(REQUEST_HEADER.size)
+                except asyncio.IncompleteReadError:
+                    break
+                magic, version, op, payload_len = REQUEST_HEADER.unpack(header)
+                if magic != MAGIC or version != VERSION:
+                    writer.write(encode_response(STATUS_ERROR, extra="协议版本不匹配".encode("utf-8")))
+                    break
+                payload = await reader.readexactly(payload_len)
+
+                if op == OP_PING:
+                    writer.write(encode_response(STATUS_OK))
+                elif op == OP_EMBED:
+                    try:
+                        vectors = await self._embed(decode_texts(payload))
+                        name = buffer.write(vectors) if len(vectors) else ""
+                        writer.write(encode_response(STATUS_OK, vectors.shape[0], vectors.shape[1],
+                                                     name.encode("ascii")))
+                    except Exception as e:
+                        logger.error(f"sidecar 推理失败: {e}")
+                        writer.write(encode_response(STATUS_ERROR, extra=str(e).encode("utf-8")))
+                else:
+                    writer.write(encode_response(STATUS_ERROR, extra=f"未知操作 {op}".encode("utf-8")))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._connections.pop(task, None)
+            buffer.close()
+            writer.close()
+
+    async def serve(self, stop: Optional[asyncio.Event] = None):
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        server = await asyncio.start_unix_server(self.handle, path=self.socket_path)
+        os.chmod(self.socket_path, 0o660)
+        logger.info(f"✅ Embedding sidecar 已就绪: {self.socket_path}")
+        stop = stop or asyncio.Event()
+        try:
+            async with server:
+                await stop.wait()
+                # 客户端连接池会一直保持连接：主动断开，等各连接的处理协程释放共享内存后再退出
+                for writer in list(self._connections.values()):
+                    writer.close()
+                await asyncio.gather(*self._connections, return_exceptions=True)
+        finally:
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+
+def ping(socket_path: str, timeout: float = 2.0) -> bool:
+    try:
+        conn = _SyncConnection(socket_path, timeout)
+    except OSError:
+        return False
+    try:
+        conn.request(OP_PING, [])
+        return True
+    except (OSError, SidecarUnavailable, RuntimeError):
+        return False
+    finally:
+        conn.close()
+
+
+async def _run_server(socket_path: str):
+    model_path, backend = embedding_backends.resolve_model()
+    logger.info(f"sidecar 正在加载 Embedding 模型: {model_path} (后端: {backend}) ...")
+    embeddings = await asyncio.to_thread(embedding_service.load_embeddings, model_path, backend)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+    await SidecarServer(embeddings, socket_path).serve(stop)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="共享 Embedding sidecar")
+    parser.add_argument("command", choices=["serve", "ping"])
+    parser.add_argument("--socket", default=SIDECAR_SOCKET or DEFAULT_SOCKET)
+    args = parser.parse_args()
+
+    if args.command == "ping":
+        ok = ping(args.socket)
+        print(f">>> {'✅ 可用' if ok else '❌ 不可用'}: {args.socket}")
+        raise SystemExit(0 if ok else 1)
+    asyncio.run(_run_server(args.socket))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,172 @@
+'''
+Author: Yunpeng Shi
+Description: 内容寻址的磁盘 Embedding 缓存 - 以 (模型标识, 切片文本哈希) 为键，向量按段保存为 .npy 矩阵并以内存映射方式读取；
+             重建知识库时只为新增/变化的切片计算向量，其余直接从缓存加载
+
+目录结构 (每个模型一个子目录，互不混用):
+    data/embedding_cache/<model_id>/seg-00001.npy    float32 向量矩阵
+    data/embedding_cache/<model_id>/seg-00001.keys.npy  对应行的文本哈希 (16 字节 blake2b)
+
+每次写入生成一个新段 (先写临时文件再原子替换)，段数超过 EMBEDDING_CACHE_MAX_SEGMENTS 时合并为一个段。
+只供单个索引进程使用，不做跨进程加锁。
+
+配置 (环境变量):
+    EMBEDDING_CACHE_DIR=./data/embedding_cache
+    EMBEDDING_CACHE_MAX_SEGMENTS=16
+'''
+import glob
+import hashlib
+import os
+import re
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from embedding_backends import EMBEDDING_BACKEND, ONNX_QUANTIZE
+from langchain_core.embeddings import Embeddings
+
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", "./data/embedding_cache")
+EMBEDDING_CACHE_MAX_SEGMENTS = int(os.getenv("EMBEDDING_CACHE_MAX_SEGMENTS", "16"))
+
+KEY_SIZE = 16
+
+
+def text_key(text: str) -> bytes:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=KEY_SIZE).digest()
+
+
+def _pack_keys(keys: Sequence[bytes]) -> np.ndarray:
+    # 以 uint8 矩阵保存原始摘要 (numpy 的定长字节串类型会截掉末尾的 \x00)
+    return np.frombuffer(b"".join(keys), dtype=np.uint8).reshape(-1, KEY_SIZE)
+
+
+def _unpack_keys(packed: np.ndarray) -> List[bytes]:
+    raw = packed.tobytes()
+    return [raw[i:i + KEY_SIZE] for i in range(0, len(raw), KEY_SIZE)]
+
+
+def model_id(model_path: str, backend: str = EMBEDDING_BACKEND, quantize: bool = ONNX_QUANTIZE) -> str:
+    """同一模型的不同推理后端输出存在细微差异，缓存按 模型名-后端 隔离"""
+    name = os.path.basename(model_path.rstrip("/")) or model_path
+    if backend == "onnx" and quantize:
+        backend = "onnx-int8"
+    return re.sub(r"[^A-Za-z0-9._-]", "_", f"{name}-{backend}")
+
+
+class EmbeddingStore:
+    def __init__(self, model: str, root: str = EMBEDDING_CACHE_DIR):
+        self.dir = os.path.join(root, model)
+        os.makedirs(self.dir, exist_ok=True)
+        self._segments: List[np.ndarray] = []
+        self._index: Dict[bytes, Tuple[int, int]] = {}
+        self.dim: Optional[int] = None
+        self._load()
+
+    def _segment_paths(self) -> List[str]:
+        return sorted(glob.glob(os.path.join(self.dir, "seg-*[0-9].npy")))
+
+    def _load(self):
+        self._segments, self._index = [], {}
+        for vec_path in self._segment_paths():
+            keys_path = vec_path[:-4] + ".keys.npy"
+            if not os.path.exists(keys_path):
+                continue  # 写入中断的残缺段
+            vectors = np.load(vec_path, mmap_mode="r")
+            keys = np.load(keys_path)
+            if len(keys) != len(vectors):
+                continue
+            seg = len(self._segments)
+            self._segments.append(vectors)
+            self.dim = vectors.shape[1]
+            for row, key in enumerate(_unpack_keys(keys)):
+                self._index[key] = (seg, row)
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def __contains__(self, key: bytes) -> bool:
+        return key in self._index
+
+    def get_many(self, keys: Sequence[bytes]) -> np.ndarray:
+        """按顺序取出向量 (键必须都已存在)；同一段的行合并为一次索引读取"""
+        out = np.empty((len(keys), self.dim), dtype=np.float32)
+        by_segment: Dict[int, Tuple[List[int], List[int]]] = {}
+        for i, key in enumerate(keys):
+            seg, row = self._index[key]
+            positions, rows = by_segment.setdefault(seg, ([], []))
+            positions.append(i)
+            rows.append(row)
+        for seg, (positions, rows) in by_segment.items():
+            out[positions] = self._segments[seg][rows]
+        return out
+
+    def put_many(self, keys: Sequence[bytes], vectors: np.ndarray):
+        """写入一个新段；已存在的键会被跳过"""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        fresh = [i for i, key in enumerate(keys) if key not in self._index]
+        if not fresh:
+            return
+        self._write_segment(_pack_keys([keys[i] for i in fresh]), vectors[fresh])
+        if len(self._segments) > EMBEDDING_CACHE_MAX_SEGMENTS:
+            self.compact()
+
+    def _write_segment(self, keys: np.ndarray, vectors: np.ndarray, number: Optional[int] = None):
+        paths = self._segment_paths()
+        if number is None:
+            number = int(os.path.basename(paths[-1])[4:9]) + 1 if paths else 1
+        base = os.path.join(self.dir, f"seg-{number:05d}")
+        # 先写向量再写键：键文件存在即表示该段完整
+        for suffix, array in ((".npy", vectors), (".keys.npy", keys)):
+            tmp = f"{base}.tmp{suffix}"
+            np.save(tmp, array)
+            os.replace(tmp, base + suffix)
+        seg = len(self._segments)
+        self._segments.append(np.load(base + ".npy", mmap_mode="r"))
+        self.dim = vectors.shape[1]
+        for row, key in enumerate(_unpack_keys(keys)):
+            self._index[key] = (seg, row)
+
+    def compact(self, keep: Optional[Sequence[bytes]] = None):
+        """合并所有段；传入 keep 时只保留这些键 (清理语料中已不存在的切片)"""
+        keys = [k for k in (keep if keep is not None else list(self._index)) if k in self._index]
+        old_paths = self._segment_paths()
+        number = int(os.path.basename(old_paths[-1])[4:9]) + 1 if old_paths else 1
+        vectors = self.get_many(keys) if keys else np.empty((0, self.dim or 0), dtype=np.float32)
+        self._segments, self._index = [], {}
+        if keys:
+            self._write_segment(_pack_keys(keys), vectors, number)
+        for vec_path in old_paths:
+            for path in (vec_path, vec_path[:-4] + ".keys.npy"):
+                if os.path.exists(path):
+                    os.remove(path)
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    在任意 Embeddings 外包一层磁盘缓存：embed_documents 只为缓存中没有的文本调用底层模型，
+    同一批次内重复的文本也只计算一次。查询向量不缓存
+    """
+
+    def __init__(self, base: Embeddings, store: EmbeddingStore):
+        self.base = base
+        self.store = store
+        self.hits = 0
+        self.misses = 0
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [text_key(t) for t in texts]
+        missing: Dict[bytes, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in self.store and key not in missing:
+                missing[key] = text
+        if missing:
+            vectors = self.base.embed_documents(list(missing.values()))
+            self.store.put_many(list(missing), np.asarray(vectors, dtype=np.float32))
+        self.misses += len(missing)
+        self.hits += len(texts) - len(missing)
+        return self.store.get_many(keys).tolist() if texts else []
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.base.embed_query(text)
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "cached": len(self.store)}
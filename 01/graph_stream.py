@@ -0,0 +1,227 @@
+'''
+Author: Yunpeng Shi
+Description: 图执行过程 -> 前端 SSE 事件 (step / thought / message)，两种实现输出完全相同的事件协议
+             - events: 基于 astream_events v2，每个链、模型、工具、检索器的起止都会生成回调事件，绝大部分被丢弃
+             - light: 基于 astream(stream_mode=["messages", "custom", "tasks"])，只订阅模型 token、自定义事件与节点起止，
+                      省去逐个 runnable 的事件构造与分发开销
+
+配置 (环境变量):
+    STREAM_MODE=events     events | light，请求体的 stream_mode 字段可覆盖
+'''
+import os
+import re
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+import tracing
+from langchain_core.messages import AIMessageChunk
+
+STREAM_MODE = os.getenv("STREAM_MODE", "events")
+STREAM_MODES = ("events", "light")
+# light 模式订阅的流：节点起止由 tasks 提供 (updates 只在节点结束时产出，无法推送 loading 状态)
+LIGHT_STREAM_MODES = ["messages", "custom", "tasks"]
+
+NODE_DISPLAY_NAMES = {
+    "supervisor_node": "总控调度中",
+    "ticket_agent": "正在查询票务系统",
+    "complaint_agent": "正在处理建议反馈",
+    "general_chat": "正在思考",
+    "manager_agent": "正在查阅管理手册",
+    "judge_agent": "正在查询规章制度",
+    "responder_agent": "正在整理回复",
+}
+RESPONDER = "responder_agent"
+# 不向前端展示的工具
+HIDDEN_TOOLS = {"FinalAnswer"}
+# 未识别到 Title 时缓冲超过该长度直接作为思考内容输出
+THOUGHT_FLUSH_CHARS = 300
+
+_TITLE_RE = re.compile(r"Title:\s*(.*?)\s*(?:\n|Content:)(.*)", re.DOTALL)
+_NEXT_TITLE_RE = re.compile(r"(.*?)Title:", re.DOTALL)
+
+SSEEvent = Tuple[str, Any]
+
+
+def node_started(name: str) -> SSEEvent:
+    return "step", {"title": f"{NODE_DISPLAY_NAMES.get(name, f'正在运行 {name}')}...", "status": "loading"}
+
+
+def node_finished(name: str) -> SSEEvent:
+    return "step", {"title": NODE_DISPLAY_NAMES.get(name, name).replace("正在", "") + " 完成", "status": "done"}
+
+
+def tool_started(name: str) -> SSEEvent:
+    return "step", {"title": f"正在调用工具: {name}...", "status": "loading"}
+
+
+def tool_finished(name: str) -> SSEEvent:
+    return "step", {"title": f"工具 {name} 调用完成", "status": "done"}
+
+
+class ThoughtParser:
+    """
+    Worker 模型输出的 Title/Content 结构流式解析 (按模型调用各自一个实例)：
+    Title 出现即推送 step，Content 部分按到达的片段推送 thought；一段输出中可以有多个 Title
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.in_content_mode = False
+
+    def feed(self, content: str) -> List[SSEEvent]:
+        events: List[SSEEvent] = []
+        self.buffer += content
+        while True:
+            buf = self.buffer
+            # 1. 尝试寻找新的 Title 块
+            match = _TITLE_RE.search(buf)
+            if match:
+                title, rest = match.group(1).strip(), match.group(2)
+                events.append(("step", {"title": title, "status": "loading"}))
+                self.in_content_mode = True
+                # 剩余部分中又出现 Title: 说明当前块已完整
+                next_title = _NEXT_TITLE_RE.search(rest)
+                if next_title:
+                    current = next_title.group(1).strip()
+                    if current:
+                        events.append(("thought", {"content": current}))
+                    self.buffer = rest[len(next_title.group(1)):]
+                    self.in_content_mode = False
+                    continue
+                if rest.strip():
+                    events.append(("thought", {"content": rest.strip()}))
+                self.buffer = ""
+                break
+            # 2. 处于内容模式时，监控是否有新 Title 冒头
+            if self.in_content_mode:
+                if "Title:" in buf:
+                    idx = buf.find("Title:")
+                    pre = buf[:idx].strip()
+                    if pre:
+                        events.append(("thought", {"content": pre}))
+                    self.buffer = buf[idx:]
+                    self.in_content_mode = False
+                    continue
+                events.append(("thought", {"content": buf}))
+                self.buffer = ""
+                break
+            # 3. 降级：缓冲区过大
+            if len(buf) > THOUGHT_FLUSH_CHARS:
+                events.append(("thought", {"content": buf}))
+                self.buffer = ""
+                self.in_content_mode = True
+            break
+        return events
+
+
+class _Translator:
+    def __init__(self, trace: tracing.RequestTrace):
+        self.trace = trace
+        self.parsers: Dict[str, ThoughtParser] = {}
+
+    def model_token(self, key: str, content: str, is_responder: bool) -> List[SSEEvent]:
+        if is_responder:
+            self.trace.mark("first_token")
+            return [("message", {"content": content})]
+        parser = self.parsers.get(key)
+        if parser is None:
+            parser = self.parsers[key] = ThoughtParser()
+        return parser.feed(content)
+
+    def responder_chunk(self, content: str) -> List[SSEEvent]:
+        # Responder 直出模式：Worker 结果直接作为最终回复推送
+        self.trace.mark("first_token")
+        return [("message", {"content": content})]
+
+
+class EventsTranslator(_Translator):
+    """astream_events v2 事件 -> SSE 事件"""
+
+    def __init__(self, trace: tracing.RequestTrace):
+        super().__init__(trace)
+        self.active_steps = set()
+
+    def translate(self, event: dict) -> List[SSEEvent]:
+        self.trace.on_event(event)
+        kind = event["event"]
+        name = event.get("name", "")
+
+        if kind == "on_chain_start" and name in NODE_DISPLAY_NAMES:
+            if name == RESPONDER:
+                return []
+            self.active_steps.add(name)
+            return [node_started(name)]
+        if kind == "on_chain_end" and name in self.active_steps:
+            self.active_steps.remove(name)
+            return [node_finished(name)]
+        if kind == "on_custom_event" and name == "responder_chunk":
+            return self.responder_chunk(event["data"]["content"])
+        if kind == "on_tool_start" and name not in HIDDEN_TOOLS:
+            return [tool_started(name)]
+        if kind == "on_tool_end" and name not in HIDDEN_TOOLS:
+            return [tool_finished(name)]
+        if kind == "on_chat_model_stream":
+            content = event["data"]["chunk"].content
+            if not content:
+                return []
+            meta = event.get("metadata", {})
+            is_responder = meta.get("langgraph_node") == RESPONDER or RESPONDER in event.get("tags", [])
+            return self.model_token(event.get("run_id"), content, is_responder)
+        return []
+
+
+class LightTranslator(_Translator):
+    """astream(stream_mode=LIGHT_STREAM_MODES, subgraphs=True) 的产出 -> SSE 事件"""
+
+    def translate(self, namespace: Tuple[str, ...], mode: str, payload: Any) -> List[SSEEvent]:
+        if mode == "messages":
+            message, meta = payload
+            # 节点输出中的完整消息也会出现在 messages 流里，只处理模型流式产出的分片
+            if not isinstance(message, AIMessageChunk) or not message.content:
+                return []
+            is_responder = meta.get("langgraph_node") == RESPONDER or RESPONDER in meta.get("tags", [])
+            return self.model_token(message.id, message.content, is_responder)
+        if mode == "custom":
+            if isinstance(payload, dict) and payload.get("event") == "responder_chunk":
+                return self.responder_chunk(payload["content"])
+            return []
+        if mode == "tasks":
+            self.trace.on_task(namespace, payload)
+            return self._task(namespace, payload)
+        return []
+
+    def _task(self, namespace: Tuple[str, ...], payload: dict) -> List[SSEEvent]:
+        name = payload["name"]
+        finished = "result" in payload
+        if not namespace:
+            if name not in NODE_DISPLAY_NAMES or name == RESPONDER:
+                return []
+            return [node_finished(name) if finished else node_started(name)]
+        # Worker ReAct 子图的 tools 节点：起止对应本轮全部工具调用
+        if name != "tools":
+            return []
+        if finished:
+            messages = (payload.get("result") or {}).get("messages", [])
+            names = [getattr(m, "name", None) for m in messages]
+            return [tool_finished(n) for n in names if n and n not in HIDDEN_TOOLS]
+        messages = (payload.get("input") or {}).get("messages") or []
+        tool_calls = (getattr(messages[-1], "tool_calls", None) or []) if messages else []
+        return [tool_started(tc["name"]) for tc in tool_calls if tc["name"] not in HIDDEN_TOOLS]
+
+
+async def stream_graph(graph_app, input_state: dict, config: dict, trace: tracing.RequestTrace,
+                       mode: Optional[str] = None) -> AsyncIterator[SSEEvent]:
+    """执行图并产出 (事件类型, 数据)，由调用方格式化为 SSE"""
+    mode = mode or STREAM_MODE
+    if mode not in STREAM_MODES:
+        raise ValueError(f"不支持的流式模式: {mode}")
+    if mode == "light":
+        translator = LightTranslator(trace)
+        async for namespace, stream_mode, payload in graph_app.astream(
+                input_state, config=config, stream_mode=LIGHT_STREAM_MODES, subgraphs=True):
+            for item in translator.translate(namespace, stream_mode, payload):
+                yield item
+        return
+    translator = EventsTranslator(trace)
+    async for event in graph_app.astream_events(input_state, config=config, version="v2"):
+        for item in translator.translate(event):
+            yield item
@@ -0,0 +1,78 @@
+'''
+Author: Yunpeng Shi
+Description: 知识库领域划分 - 建库时为每个切片标注 domain (规章/运营手册/员工管理/常见问题/通用)，
+             Milvus 以 domain 作为 partition key 分区存储；各检索工具只在自己相关的领域内搜索，
+             检索开销随相关子集而不是整个语料增长
+
+领域判定顺序:
+    1. raw_docs 下的一级子目录名 (如 data/raw_docs/regulation/xxx.txt)
+    2. 文件名关键词
+    3. 默认 general
+'''
+import json
+import os
+from typing import Dict, List, Optional
+
+DOMAINS = ["regulation", "operations", "staff", "faq", "general"]
+DEFAULT_DOMAIN = "general"
+
+# 文件名关键词 -> 领域，按顺序匹配
+FILENAME_RULES = [
+    ("regulation", ("规则", "条例", "守则", "办法", "规定", "管理规范")),
+    ("operations", ("运营", "手册", "应急", "作业", "调度")),
+    ("staff", ("员工", "排班", "考核", "绩效", "培训")),
+    ("faq", ("常见问题", "FAQ", "faq", "问答")),
+]
+
+# 各检索工具可搜索的领域
+TOOL_DOMAINS: Dict[str, List[str]] = {
+    "policy_checker": ["regulation"],
+    "search_knowledge": ["faq", "general", "regulation", "operations"],
+}
+
+KNOWLEDGE_NUM_PARTITIONS = int(os.getenv("KNOWLEDGE_NUM_PARTITIONS", "16"))
+PARTITION_KEY_FIELD = "domain"
+
+
+def classify(file_path: str, root: str) -> str:
+    rel = os.path.relpath(file_path, root)
+    parts = rel.split(os.sep)
+    if len(parts) > 1 and parts[0] in DOMAINS:
+        return parts[0]
+    name = os.path.basename(file_path)
+    for domain, keywords in FILENAME_RULES:
+        if any(keyword in name for keyword in keywords):
+            return domain
+    return DEFAULT_DOMAIN
+
+
+def domain_expr(domains: List[str]) -> str:
+    return f"{PARTITION_KEY_FIELD} in {json.dumps(domains, ensure_ascii=False)}"
+
+
+def search_kwargs(store, tool_name: str, **kwargs) -> dict:
+    """
+    生成检索参数：集合带有 domain 字段时附加过滤表达式 (partition key 会据此只扫描相关分区)；
+    旧集合没有该字段则不过滤，重建知识库后自动生效。本地 FAISS 快照同理：
+    build_knowledge.py 生成的快照按元数据过滤，切片缺少 domain 的旧快照不过滤
+    """
+    domains: Optional[List[str]] = TOOL_DOMAINS.get(tool_name)
+    if not domains:
+        return kwargs
+    fields = getattr(store, "fields", None)
+    if isinstance(fields, list):
+        if PARTITION_KEY_FIELD in fields:
+            kwargs["expr"] = domain_expr(domains)
+    elif isinstance(getattr(store, "index_to_docstore_id", None), dict):
+        if _snapshot_has_domain(store):
+            kwargs["filter"] = {PARTITION_KEY_FIELD: {"$in": domains}}
+    return kwargs
+
+
+def _snapshot_has_domain(store) -> bool:
+    """快照中的切片是否带 domain 元数据 (同一次建库写入的切片字段一致，抽查第一条即可)"""
+    doc_id = next(iter(store.index_to_docstore_id.values()), None)
+    if doc_id is None:
+        return True
+    doc = store.docstore.search(doc_id)
+    return PARTITION_KEY_FIELD in (getattr(doc, "metadata", None) or {})
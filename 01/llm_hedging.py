@@ -0,0 +1,229 @@
+'''
+Author: Yunpeng Shi
+Description: LLM 对冲请求 (hedged requests) - 首个 token (流式) 或完整响应 (非流式) 在延迟阈值内未到达时，
+             再发出一个相同的请求，先返回者胜出，另一个立即取消；阈值取该节点历史延迟的分位数，
+             只用于降低长尾延迟，不替代 max_retries 的失败重试
+
+配置 (环境变量):
+    LLM_HEDGE_NODES=                  启用对冲的节点，逗号分隔 (如 supervisor_node,responder_agent,judge_agent)，* 表示全部；默认不启用
+    LLM_HEDGE_PERCENTILE=0.95         延迟阈值取历史延迟的该分位数
+    LLM_HEDGE_MIN_SAMPLES=20          样本不足时使用 LLM_HEDGE_DEFAULT_DELAY_MS
+    LLM_HEDGE_DEFAULT_DELAY_MS=3000
+    LLM_HEDGE_MIN_DELAY_MS=200        阈值下限，避免低延迟时几乎每次都对冲
+    LLM_HEDGE_BUDGET=0.1              对冲请求数占调用数的上限，下游整体变慢时不会把请求量翻倍
+    LLM_HEDGE_BUDGET_WINDOW_S=60      预算按最近该时间窗口内的调用数计算，空闲期不会积攒额度
+'''
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, List, Optional, Set
+
+import metrics
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+
+logger = logging.getLogger("MetroAgent")
+
+LLM_HEDGE_NODES = {n.strip() for n in os.getenv("LLM_HEDGE_NODES", "").split(",") if n.strip()}
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "0.95"))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+LLM_HEDGE_DEFAULT_DELAY_MS = float(os.getenv("LLM_HEDGE_DEFAULT_DELAY_MS", "3000"))
+LLM_HEDGE_MIN_DELAY_MS = float(os.getenv("LLM_HEDGE_MIN_DELAY_MS", "200"))
+LLM_HEDGE_BUDGET = float(os.getenv("LLM_HEDGE_BUDGET", "0.1"))
+LLM_HEDGE_BUDGET_WINDOW_S = float(os.getenv("LLM_HEDGE_BUDGET_WINDOW_S", "60"))
+
+# 延迟类别：流式请求看首 token，非流式请求看完整响应
+FIRST_TOKEN = "first_token"
+RESPONSE = "response"
+
+# 已创建对冲模型的节点
+_NODES: Set[str] = set()
+# 预算窗口：节点 -> (最近的调用时间, 最近的对冲时间)
+_windows: Dict[str, tuple] = {}
+
+
+def enabled(node: str) -> bool:
+    return "*" in LLM_HEDGE_NODES or node in LLM_HEDGE_NODES
+
+
+def hedge_delay_ms(node: str, phase: str) -> float:
+    samples = metrics.get_samples("llm_hedge_latency_ms", node=node, phase=phase)
+    if len(samples) < LLM_HEDGE_MIN_SAMPLES:
+        return LLM_HEDGE_DEFAULT_DELAY_MS
+    return max(LLM_HEDGE_MIN_DELAY_MS, metrics.quantile(samples, LLM_HEDGE_PERCENTILE))
+
+
+def _window(node: str) -> tuple:
+    window = _windows.get(node)
+    if window is None:
+        window = _windows[node] = (deque(), deque())
+    now = time.monotonic()
+    for times in window:
+        while times and now - times[0] > LLM_HEDGE_BUDGET_WINDOW_S:
+            times.popleft()
+    return window
+
+
+def record(node: str, event: str):
+    """记录一次调用 (call) 或对冲 (fired)：累计计数供 /metrics 查看，时间戳用于预算窗口"""
+    metrics.incr("llm_hedge", node=node, event=event)
+    calls, fired = _window(node)
+    (calls if event == "call" else fired).append(time.monotonic())
+
+
+def within_budget(node: str) -> bool:
+    """
+    按最近 LLM_HEDGE_BUDGET_WINDOW_S 秒内的调用数计算预算。累计计数会在空闲期积攒额度，
+    下游整体变慢时每次调用都会对冲直到额度耗尽；窗口内的对冲数始终不超过近期调用数的 LLM_HEDGE_BUDGET
+    """
+    calls, fired = _window(node)
+    return len(fired) < LLM_HEDGE_BUDGET * len(calls)
+
+
+def reset():
+    _windows.clear()
+
+
+class _Attempt:
+    """一次请求：task 等待首个结果 (流式为首个 chunk)，stream 为流式请求的后续输出"""
+
+    def __init__(self, tag: str, first: Awaitable, stream: Optional[AsyncIterator] = None):
+        self.tag = tag
+        self.start = time.perf_counter()
+        self.task = asyncio.ensure_future(first)
+        self.stream = stream
+
+    async def close(self):
+        if self.stream is not None:
+            await self.stream.aclose()
+
+    async def discard(self):
+        self.task.cancel()
+        try:
+            await self.task
+        except BaseException:
+            pass
+        try:
+            await self.close()
+        except Exception:
+            pass
+
+
+async def race(node: str, phase: str, launch: Callable[[str], _Attempt]) -> _Attempt:
+    """
+    发出主请求，超过阈值仍无结果 (且在预算内) 时发出一个对冲请求，返回最先成功的一个，落败者被取消。
+    主请求在阈值前失败直接抛出 (失败重试由 max_retries 负责)；已对冲时两个都失败才抛出
+    """
+    record(node, "call")
+    delay: Optional[float] = hedge_delay_ms(node, phase) / 1000
+    attempts: List[_Attempt] = [launch("primary")]
+    winner: Optional[_Attempt] = None
+    try:
+        while winner is None:
+            can_hedge = delay is not None and len(attempts) == 1
+            timeout = max(0.0, delay - (time.perf_counter() - attempts[0].start)) if can_hedge else None
+            pending = [a.task for a in attempts if not a.task.done()]
+            if pending:
+                await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            winner = next((a for a in attempts if a.task.done() and a.task.exception() is None), None)
+            if winner is not None:
+                break
+            if all(a.task.done() for a in attempts):
+                raise attempts[-1].task.exception()
+            if can_hedge and time.perf_counter() - attempts[0].start >= delay:
+                if within_budget(node):
+                    attempts.append(launch("hedge"))
+                    record(node, "fired")
+                    logger.info(f"[{node}] LLM {phase} 超过 {delay * 1000:.0f}ms 未返回，发出对冲请求")
+                else:
+                    metrics.incr("llm_hedge", node=node, event="over_budget")
+                    delay = None
+    finally:
+        for attempt in attempts:
+            if attempt is not winner:
+                # 后台取消，不阻塞胜出请求的后续输出
+                asyncio.ensure_future(attempt.discard())
+
+    # 延迟样本始终按主请求计算：对冲胜出时主请求至少已耗时这么久 (不低于阈值)，
+    # 若记录胜出请求的耗时，对冲过的慢请求会以偏短的样本进入分位数，阈值会逐渐下移
+    metrics.observe("llm_hedge_latency_ms", (time.perf_counter() - attempts[0].start) * 1000, node=node, phase=phase)
+    if winner.tag == "hedge":
+        metrics.incr("llm_hedge", node=node, event="won")
+    return winner
+
+
+class HedgedChatModel(BaseChatModel):
+    """
+    包装任意 ChatModel (如 ChatOpenAI)：流式调用按首 token 对冲，非流式调用按完整响应对冲。
+    只把胜出请求的 token 交给回调，前端不会收到重复内容
+    """
+
+    inner: BaseChatModel
+    node: str
+
+    @property
+    def _llm_type(self) -> str:
+        return f"hedged-{self.inner._llm_type}"
+
+    def _get_ls_params(self, stop: Optional[List[str]] = None, **kwargs: Any):
+        return self.inner._get_ls_params(stop=stop, **kwargs)
+
+    def bind_tools(self, tools, **kwargs):
+        # 工具格式转换沿用内部模型的实现，绑定参数原样转发给内部模型
+        return self.bind(**self.inner.bind_tools(tools, **kwargs).kwargs)
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager=None, **kwargs: Any) -> ChatResult:
+        return self.inner._generate(messages, stop=stop, **kwargs)
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager=None, **kwargs: Any) -> ChatResult:
+        def launch(tag: str) -> _Attempt:
+            return _Attempt(tag, self.inner._agenerate(messages, stop=stop, **kwargs))
+
+        winner = await race(self.node, RESPONSE, launch)
+        return winner.task.result()
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager=None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        def launch(tag: str) -> _Attempt:
+            stream = self.inner._astream(messages, stop=stop, **kwargs)
+            return _Attempt(tag, anext(stream, None), stream=stream)
+
+        winner = await race(self.node, FIRST_TOKEN, launch)
+        first = winner.task.result()
+        try:
+            if first is None:
+                return
+            yield first
+            async for chunk in winner.stream:
+                yield chunk
+        finally:
+            await winner.close()
+
+
+def stats() -> Dict[str, Dict[str, float]]:
+    """各启用节点的对冲次数、胜出次数与当前阈值，供 /metrics 查看"""
+    report = {}
+    for node in sorted(_NODES):
+        counts = {event: metrics.get_counter("llm_hedge", node=node, event=event)
+                  for event in ("call", "fired", "won", "over_budget")}
+        report[node] = {
+            **counts,
+            "fire_rate": round(counts["fired"] / counts["call"], 3) if counts["call"] else 0.0,
+            "win_rate": round(counts["won"] / counts["fired"], 3) if counts["fired"] else 0.0,
+            "delay_ms": {phase: round(hedge_delay_ms(node, phase), 1) for phase in (FIRST_TOKEN, RESPONSE)},
+        }
+    return report
+
+
+def wrap(llm: BaseChatModel, node: str) -> BaseChatModel:
+    """节点启用了对冲时返回包装后的模型，否则原样返回"""
+    if not enabled(node):
+        return llm
+    _NODES.add(node)
+    # 回调 (如各角色的调用统计) 挂在外层，内部模型被直接调用时不会重复触发
+    return HedgedChatModel(inner=llm, node=node, callbacks=llm.callbacks)
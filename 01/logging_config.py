@@ -0,0 +1,167 @@
+'''
+Author: Yunpeng Shi
+Description: 非阻塞日志管道 - 业务线程/事件循环只把日志记录放入内存队列，由后台 QueueListener 线程负责
+             格式化与写盘；文件按大小轮转，支持 JSON 输出与高频调试日志采样，队列满时丢弃而不是阻塞
+
+配置 (环境变量):
+    LOG_LEVEL=INFO
+    LOG_FILE=agent_system.log        可包含 {pid}；WEB_CONCURRENCY>1 且未包含时自动改为 agent_system-{pid}.log，
+                                     各 worker 写各自的文件，避免多个进程轮转同一个文件互相干扰
+    LOG_MAX_BYTES=20971520           单个日志文件上限，超过后轮转
+    LOG_BACKUP_COUNT=5
+    LOG_FORMAT=json|text             文件日志格式
+    LOG_CONSOLE_FORMAT=text|json     控制台日志格式
+    LOG_QUEUE_SIZE=10000
+    LOG_DEBUG_SAMPLE_RATE=1.0        DEBUG 日志的保留比例
+'''
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+from datetime import datetime, timezone
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FILE = os.getenv("LOG_FILE", "agent_system.log")
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(20 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "5"))
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+LOG_CONSOLE_FORMAT = os.getenv("LOG_CONSOLE_FORMAT", "text")
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_DEBUG_SAMPLE_RATE = float(os.getenv("LOG_DEBUG_SAMPLE_RATE", "1.0"))
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - [%(threadName)s] - %(message)s'
+
+# LogRecord 的内置属性，其余属性视为 extra 字段输出到 JSON
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+_listener = None
+_dropped = 0
+_lock = threading.Lock()
+
+
+class JsonFormatter(logging.Formatter):
+    """每条日志一行 JSON；记录携带 payload (dict) 时直接展开，如请求追踪日志"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        doc = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "pid": record.process,
+        }
+        payload = getattr(record, "payload", None)
+        if isinstance(payload, dict):
+            doc.update(payload)
+        else:
+            doc["msg"] = record.getMessage()
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and key not in ("payload", "sample_rate") and key not in doc:
+                doc[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            doc["exc"] = record.exc_text
+        return json.dumps(doc, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    高频日志采样：DEBUG 级别按 LOG_DEBUG_SAMPLE_RATE 保留；
+    任意级别的记录可通过 extra={"sample_rate": 0.01} 单独指定保留比例。WARNING 及以上从不采样。
+    """
+
+    def __init__(self, debug_rate: float = LOG_DEBUG_SAMPLE_RATE):
+        super().__init__()
+        self.debug_rate = debug_rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = getattr(record, "sample_rate", None)
+        if rate is None:
+            rate = self.debug_rate if record.levelno <= logging.DEBUG else 1.0
+        return rate >= 1.0 or random.random() < rate
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """队列满时丢弃日志并计数，绝不阻塞调用方"""
+
+    def enqueue(self, record: logging.LogRecord):
+        global _dropped
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with _lock:
+                _dropped += 1
+
+
+def _formatter(kind: str) -> logging.Formatter:
+    return JsonFormatter() if kind == "json" else logging.Formatter(TEXT_FORMAT)
+
+
+def log_path(log_file: str, workers: int) -> str:
+    """日志文件路径：多 worker 时未包含 {pid} 的路径在扩展名前补上 -{pid}"""
+    if workers > 1 and "{pid}" not in log_file:
+        root, ext = os.path.splitext(log_file)
+        log_file = f"{root}-{{pid}}{ext}"
+    return log_file.format(pid=os.getpid())
+
+
+def setup_logging(level: str = LOG_LEVEL, log_file: str = LOG_FILE) -> logging.Logger:
+    """
+    配置根 logger：只挂一个 QueueHandler，真正的文件/控制台输出在 QueueListener 后台线程中完成。
+    重复调用是幂等的。
+    """
+    global _listener
+    root = logging.getLogger()
+    with _lock:
+        if _listener is not None:
+            return logging.getLogger("MetroAgent")
+
+        handlers = []
+        if log_file:
+            # serve.py 在导入本模块之后才设置 WEB_CONCURRENCY，这里在调用时读取
+            path = log_path(log_file, int(os.getenv("WEB_CONCURRENCY", "1")))
+            if os.path.dirname(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            file_handler = logging.handlers.RotatingFileHandler(
+                path, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding="utf-8"
+            )
+            file_handler.setFormatter(_formatter(LOG_FORMAT))
+            handlers.append(file_handler)
+        console = logging.StreamHandler(sys.stdout)
+        console.setFormatter(_formatter(LOG_CONSOLE_FORMAT))
+        handlers.append(console)
+
+        queue_handler = DroppingQueueHandler(queue.Queue(maxsize=LOG_QUEUE_SIZE))
+        queue_handler.addFilter(SamplingFilter())
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(queue_handler)
+        root.setLevel(level)
+
+        _listener = logging.handlers.QueueListener(queue_handler.queue, *handlers, respect_handler_level=True)
+        _listener.start()
+        atexit.register(shutdown_logging)
+    return logging.getLogger("MetroAgent")
+
+
+def shutdown_logging():
+    """停止后台线程并写完队列中剩余的日志"""
+    global _listener
+    with _lock:
+        listener, _listener = _listener, None
+    if listener is not None:
+        listener.stop()
+        for handler in listener.handlers:
+            handler.close()
+
+
+def dropped_count() -> int:
+    return _dropped
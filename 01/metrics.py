@@ -0,0 +1,90 @@
+'''
+Author: Yunpeng Shi
+Description: 进程内轻量指标 - 计数器与延迟分布，供 /metrics 接口查看 (每个 uvicorn worker 独立统计)
+'''
+import threading
+from collections import defaultdict, deque
+from typing import Deque, Dict, Tuple
+
+# 每个分布最多保留的样本数，用于计算分位数
+MAX_SAMPLES = 2048
+
+_LabelKey = Tuple[Tuple[str, str], ...]
+
+_lock = threading.Lock()
+_counters: Dict[str, Dict[_LabelKey, float]] = defaultdict(lambda: defaultdict(float))
+_histograms: Dict[str, Dict[_LabelKey, dict]] = defaultdict(dict)
+
+
+def _label_key(labels: dict) -> _LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _label_str(key: _LabelKey) -> str:
+    return ",".join(f"{k}={v}" for k, v in key) or "all"
+
+
+def incr(name: str, value: float = 1, **labels):
+    """累加计数器"""
+    with _lock:
+        _counters[name][_label_key(labels)] += value
+
+
+def observe(name: str, value: float, **labels):
+    """记录一个分布样本 (如延迟毫秒数、步数、批大小)"""
+    key = _label_key(labels)
+    with _lock:
+        hist = _histograms[name].get(key)
+        if hist is None:
+            hist = {"count": 0, "sum": 0.0, "samples": deque(maxlen=MAX_SAMPLES)}
+            _histograms[name][key] = hist
+        hist["count"] += 1
+        hist["sum"] += value
+        hist["samples"].append(value)
+
+
+def quantile(samples, q: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    idx = min(len(ordered) - 1, max(0, int(round(q * (len(ordered) - 1)))))
+    return ordered[idx]
+
+
+def get_counter(name: str, **labels) -> float:
+    with _lock:
+        return _counters.get(name, {}).get(_label_key(labels), 0.0)
+
+
+def get_samples(name: str, **labels) -> Deque[float]:
+    with _lock:
+        hist = _histograms.get(name, {}).get(_label_key(labels))
+        return deque(hist["samples"]) if hist else deque()
+
+
+def snapshot() -> dict:
+    """导出当前所有指标，分布类给出 count/avg/p50/p95/p99"""
+    with _lock:
+        counters = {
+            name: {_label_str(k): v for k, v in series.items()}
+            for name, series in _counters.items()
+        }
+        histograms = {}
+        for name, series in _histograms.items():
+            histograms[name] = {}
+            for key, hist in series.items():
+                samples = list(hist["samples"])
+                histograms[name][_label_str(key)] = {
+                    "count": hist["count"],
+                    "avg": round(hist["sum"] / hist["count"], 3) if hist["count"] else 0.0,
+                    "p50": quantile(samples, 0.50),
+                    "p95": quantile(samples, 0.95),
+                    "p99": quantile(samples, 0.99),
+                }
+    return {"counters": counters, "histograms": histograms}
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
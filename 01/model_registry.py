@@ -0,0 +1,195 @@
+'''
+Author: Yunpeng Shi
+Description: 按角色路由的模型注册表 - 规划 (supervisor)、Worker (workers)、汇总回复 (responder)、会话标题 (title)
+             各自配置模型、温度、最大 token 与超时，例如路由与标题用便宜的快模型、汇总用强模型；
+             每个角色的调用耗时、首 token 与 token 用量单独统计，便于验证拆分效果
+
+配置 (环境变量，<ROLE> 为 SUPERVISOR / WORKERS / RESPONDER / TITLE；角色未设置时回退到 LLM_* 全局配置):
+    LLM_MODEL=deepseek-chat           LLM_<ROLE>_MODEL
+    LLM_TEMPERATURE=0                 LLM_<ROLE>_TEMPERATURE
+    LLM_MAX_TOKENS=                   LLM_<ROLE>_MAX_TOKENS        (空表示不限制；title 默认 32)
+    LLM_TIMEOUT=60                    LLM_<ROLE>_TIMEOUT           (秒；title 默认 15)
+    LLM_MAX_RETRIES=3                 LLM_<ROLE>_MAX_RETRIES
+    DEEPSEEK_BASE_URL / DEEPSEEK_API_KEY   LLM_<ROLE>_BASE_URL / LLM_<ROLE>_API_KEY (角色可使用其他 OpenAI 兼容服务)
+'''
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+from uuid import UUID
+
+import llm_hedging
+import metrics
+import startup
+from langchain_core.callbacks import AsyncCallbackHandler
+
+logger = logging.getLogger("MetroAgent")
+
+ROLES = ("supervisor", "workers", "responder", "title")
+DEFAULT_ROLE = "default"
+
+# 节点 -> 角色；未列出的节点 (各 Worker 的 ReAct 引擎) 归入 workers
+NODE_ROLES = {
+    "supervisor_node": "supervisor",
+    "responder_agent": "responder",
+    "title": "title",
+}
+
+# 优先级：LLM_<ROLE>_<KEY> > 角色自身默认值 > LLM_<KEY> > 内置默认值
+BUILTIN_DEFAULTS: Dict[str, Any] = {
+    "model": "deepseek-chat",
+    "temperature": 0.0,
+    "max_tokens": None,
+    "timeout": 60.0,
+    "max_retries": 3,
+}
+ROLE_DEFAULTS: Dict[str, Dict[str, Any]] = {
+    "title": {"max_tokens": 32, "timeout": 15.0},
+}
+_CASTS = {"model": str, "temperature": float, "max_tokens": int, "timeout": float, "max_retries": int}
+
+
+def role_of(node: Optional[str]) -> str:
+    if node is None:
+        return DEFAULT_ROLE
+    return NODE_ROLES.get(node, "workers")
+
+
+def _setting(role: str, key: str) -> Any:
+    cast = _CASTS[key]
+    if role != DEFAULT_ROLE:
+        value = os.getenv(f"LLM_{role.upper()}_{key.upper()}")
+        if value:
+            return cast(value)
+        if key in ROLE_DEFAULTS.get(role, {}):
+            return ROLE_DEFAULTS[role][key]
+    value = os.getenv(f"LLM_{key.upper()}")
+    return cast(value) if value else BUILTIN_DEFAULTS[key]
+
+
+def role_config(role: str) -> Dict[str, Any]:
+    """在创建模型时读取环境变量 (utils 加载 .env 之后)"""
+    config = {key: _setting(role, key) for key in BUILTIN_DEFAULTS}
+    config["base_url"] = (os.getenv(f"LLM_{role.upper()}_BASE_URL") or os.getenv("DEEPSEEK_BASE_URL")
+                          or "https://api.deepseek.com")
+    config["api_key"] = os.getenv(f"LLM_{role.upper()}_API_KEY") or os.getenv("DEEPSEEK_API_KEY")
+    return config
+
+
+class RoleMetrics(AsyncCallbackHandler):
+    """按角色记录每次模型调用的耗时、首 token 耗时、token 用量与失败次数"""
+
+    def __init__(self, role: str):
+        self.role = role
+        self._runs: Dict[UUID, list] = {}
+
+    async def on_chat_model_start(self, serialized, messages, *, run_id: UUID, **kwargs):
+        self._runs[run_id] = [time.perf_counter(), None]
+
+    async def on_llm_new_token(self, token: str, *, run_id: UUID, **kwargs):
+        run = self._runs.get(run_id)
+        if run is not None and run[1] is None:
+            run[1] = time.perf_counter()
+            metrics.observe("llm_first_token_ms", (run[1] - run[0]) * 1000, role=self.role)
+
+    async def on_llm_end(self, response, *, run_id: UUID, **kwargs):
+        run = self._runs.pop(run_id, None)
+        if run is None:
+            return
+        metrics.incr("llm_calls", role=self.role)
+        metrics.observe("llm_latency_ms", (time.perf_counter() - run[0]) * 1000, role=self.role)
+        try:
+            usage = response.generations[0][0].message.usage_metadata or {}
+        except (IndexError, AttributeError):
+            usage = {}
+        if usage:
+            metrics.incr("llm_tokens", usage.get("input_tokens", 0), role=self.role, kind="input")
+            metrics.incr("llm_tokens", usage.get("output_tokens", 0), role=self.role, kind="output")
+
+    async def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs):
+        self._runs.pop(run_id, None)
+        metrics.incr("llm_errors", role=self.role)
+
+
+class ModelRegistry:
+    """每个角色一个模型实例 (首次使用时创建)；节点启用对冲时在角色模型外再包一层 (见 llm_hedging.py)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._roles: Dict[str, Any] = {}
+        self._nodes: Dict[str, Any] = {}
+
+    def for_role(self, role: str):
+        model = self._roles.get(role)
+        if model is not None:
+            return model
+        with self._lock:
+            if role not in self._roles:
+                self._roles[role] = self._create(role)
+            return self._roles[role]
+
+    def for_node(self, node: Optional[str]):
+        role = role_of(node)
+        if node is None:
+            return self.for_role(role)
+        model = self._nodes.get(node)
+        if model is None:
+            model = llm_hedging.wrap(self.for_role(role), node)
+            self._nodes[node] = model
+        return model
+
+    def _create(self, role: str):
+        config = role_config(role)
+        with startup.timed("import", "langchain_openai"):
+            from langchain_openai import ChatOpenAI
+        model = ChatOpenAI(
+            model=config["model"],
+            openai_api_key=config["api_key"],
+            openai_api_base=config["base_url"],
+            temperature=config["temperature"],
+            max_tokens=config["max_tokens"],
+            max_retries=config["max_retries"],
+            timeout=config["timeout"],
+            # 流式响应末尾附带 usage，用于统计提示词缓存命中与各角色 token 用量
+            stream_usage=True,
+            callbacks=[RoleMetrics(role)],
+        )
+        logger.info(f"LLM [{role}] 初始化成功: {config['model']} (Base: {config['base_url']}, "
+                    f"temperature={config['temperature']}, max_tokens={config['max_tokens']}, "
+                    f"timeout={config['timeout']}s)")
+        return model
+
+    def models(self) -> Dict[str, Any]:
+        """已创建的各角色模型"""
+        return dict(self._roles)
+
+    def reset(self):
+        with self._lock:
+            self._roles.clear()
+            self._nodes.clear()
+
+    def stats(self) -> Dict[str, dict]:
+        report = {}
+        for role in ROLES + (DEFAULT_ROLE,):
+            calls = metrics.get_counter("llm_calls", role=role)
+            errors = metrics.get_counter("llm_errors", role=role)
+            if role not in self._roles and not calls and not errors:
+                continue
+            latency = metrics.get_samples("llm_latency_ms", role=role)
+            first_token = metrics.get_samples("llm_first_token_ms", role=role)
+            model = self._roles.get(role)
+            report[role] = {
+                "model": getattr(model, "model_name", None),
+                "calls": calls,
+                "errors": errors,
+                "latency_ms_p50": round(metrics.quantile(latency, 0.5), 1),
+                "latency_ms_p95": round(metrics.quantile(latency, 0.95), 1),
+                "first_token_ms_p50": round(metrics.quantile(first_token, 0.5), 1),
+                "input_tokens": metrics.get_counter("llm_tokens", role=role, kind="input"),
+                "output_tokens": metrics.get_counter("llm_tokens", role=role, kind="output"),
+            }
+        return report
+
+
+registry = ModelRegistry()
@@ -0,0 +1,242 @@
+'''
+Author: Yunpeng Shi
+Description: 规章条文切分 - 识别 章/节/条/款 结构，每条一个切片并附带层级元数据，同时生成 条号 -> 条文 的直查索引；
+             policy_checker 遇到“第二十条说了什么”这类引用时直接查表，问题的其余部分仍走向量检索
+
+用法 (在 01 目录下):
+    python regulation_splitter.py data/raw_docs/杭州市地铁乘车规则.txt        # 查看切分结果
+'''
+import argparse
+import json
+import os
+import re
+import threading
+from typing import Dict, List, Optional
+
+from langchain_core.documents import Document
+
+ARTICLE_INDEX_FILE = os.getenv("ARTICLE_INDEX_FILE", "./data/article_index.json")
+# 单条超过该长度时按款拆成多个切片 (同一条号)，避免个别长条文稀释向量
+MAX_ARTICLE_CHARS = int(os.getenv("MAX_ARTICLE_CHARS", "1200"))
+# 至少识别到这么多条，才按规章结构切分
+MIN_ARTICLES = 3
+
+_NUM = r"[零〇一二两三四五六七八九十百千\d]+"
+_CHAPTER_RE = re.compile(rf"^\s*第({_NUM})章[\s　]*(.*)$")
+_SECTION_RE = re.compile(rf"^\s*第({_NUM})节[\s　]*(.*)$")
+_ARTICLE_RE = re.compile(rf"^\s*第({_NUM})条[\s　]*")
+# 查询中的条文引用，如“第二十条”“第 20 条”
+_REFERENCE_RE = re.compile(rf"第\s*({_NUM})\s*条")
+# 查询中点名的规章，如“《乘车规则》”
+_TITLE_RE = re.compile(r"《([^》]+)》")
+
+_CN_DIGITS = {"零": 0, "〇": 0, "一": 1, "二": 2, "两": 2, "三": 3, "四": 4,
+              "五": 5, "六": 6, "七": 7, "八": 8, "九": 9}
+_CN_UNITS = {"十": 10, "百": 100, "千": 1000}
+
+# 所有切片统一的元数据字段 (Milvus 按首个文档推断字段，各切片必须一致)
+EMPTY_METADATA = {"chapter": "", "section": "", "article": "", "article_no": 0, "part": 0}
+
+
+def cn_to_int(text: str) -> int:
+    """中文数字转整数：二十三 -> 23，一百零五 -> 105，十 -> 10；阿拉伯数字直接转换"""
+    text = text.strip()
+    if text.isdigit():
+        return int(text)
+    total, digit = 0, 0
+    for ch in text:
+        if ch in _CN_DIGITS:
+            digit = _CN_DIGITS[ch]
+        elif ch in _CN_UNITS:
+            total += (digit or 1) * _CN_UNITS[ch]
+            digit = 0
+        else:
+            raise ValueError(f"无法识别的数字: {text}")
+    return total + digit
+
+
+def is_regulation(text: str) -> bool:
+    return sum(1 for line in text.splitlines() if _ARTICLE_RE.match(line)) >= MIN_ARTICLES
+
+
+def _article_chunks(body_lines: List[str], header: str) -> List[str]:
+    """按款 (条内的自然段) 拆分过长的条文，每段都带上条号前缀"""
+    text = "\n".join(body_lines).strip()
+    if len(text) <= MAX_ARTICLE_CHARS:
+        return [text]
+    chunks, current = [], ""
+    for clause in body_lines:
+        if current and len(current) + len(clause) > MAX_ARTICLE_CHARS:
+            chunks.append(current.strip())
+            current = f"{header}（续）"
+        current += "\n" + clause if current else clause
+    if current.strip():
+        chunks.append(current.strip())
+    return chunks
+
+
+def split_regulation(text: str, metadata: Optional[dict] = None) -> List[Document]:
+    """
+    每条一个切片，元数据带 chapter/section/article/article_no/part；
+    第一条之前的标题、说明等内容单独作为一个切片 (article_no=0)
+    """
+    base = {**(metadata or {}), **EMPTY_METADATA}
+    docs: List[Document] = []
+    chapter = section = ""
+    preamble: List[str] = []
+    article: Optional[dict] = None
+
+    def flush():
+        if article is None:
+            return
+        header = f"第{article['label']}条"
+        for part, chunk in enumerate(_article_chunks(article["lines"], header)):
+            docs.append(Document(page_content=chunk, metadata={
+                **base, "chapter": article["chapter"], "section": article["section"],
+                "article": header, "article_no": article["no"], "part": part,
+            }))
+
+    for raw in text.splitlines():
+        line = raw.strip()
+        if not line:
+            continue
+        chapter_match = _CHAPTER_RE.match(line)
+        section_match = _SECTION_RE.match(line)
+        article_match = _ARTICLE_RE.match(line)
+        if chapter_match:
+            flush()
+            article = None
+            chapter, section = line, ""
+        elif section_match:
+            flush()
+            article = None
+            section = line
+        elif article_match:
+            flush()
+            label = article_match.group(1)
+            article = {"label": label, "no": cn_to_int(label), "chapter": chapter,
+                       "section": section, "lines": [line]}
+        elif article is not None:
+            # 条内的后续段落即为各款
+            article["lines"].append(line)
+        else:
+            preamble.append(line)
+    flush()
+
+    if preamble:
+        docs.insert(0, Document(page_content="\n".join(preamble), metadata=dict(base)))
+    return docs
+
+
+def source_of(metadata: dict) -> str:
+    return metadata.get("source_filename") or metadata.get("source", "")
+
+
+def regulation_name(source: str) -> str:
+    """来源文件 -> 规章名称：raw_docs/杭州市地铁乘车规则.txt -> 杭州市地铁乘车规则"""
+    return os.path.splitext(os.path.basename(source))[0]
+
+
+def build_article_index(docs: List[Document]) -> Dict[str, List[dict]]:
+    """条号 -> [{source, article, chapter, section, text}]，同一条被拆成多段时按顺序拼接"""
+    index: Dict[str, List[dict]] = {}
+    for doc in docs:
+        no = doc.metadata.get("article_no")
+        if not no:
+            continue
+        source = source_of(doc.metadata)
+        entries = index.setdefault(str(no), [])
+        for entry in entries:
+            if entry["source"] == source:
+                entry["text"] += "\n" + doc.page_content
+                break
+        else:
+            entries.append({"source": source, "article": doc.metadata["article"],
+                            "chapter": doc.metadata.get("chapter", ""),
+                            "section": doc.metadata.get("section", ""), "text": doc.page_content})
+    return index
+
+
+def save_article_index(index: Dict[str, List[dict]], path: str = ARTICLE_INDEX_FILE):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"articles": index}, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def find_references(query: str) -> List[int]:
+    """提取查询中引用的条号 (去重并保持顺序)"""
+    refs: List[int] = []
+    for match in _REFERENCE_RE.finditer(query):
+        try:
+            no = cn_to_int(match.group(1))
+        except ValueError:
+            continue
+        if no not in refs:
+            refs.append(no)
+    return refs
+
+
+class ArticleIndex:
+    """运行时的条文直查表：按文件修改时间自动重新加载，重建知识库后无需重启服务"""
+
+    def __init__(self, path: str = ARTICLE_INDEX_FILE):
+        self.path = path
+        self._mtime: Optional[float] = None
+        self._articles: Dict[str, List[dict]] = {}
+        self._lock = threading.Lock()
+
+    def _refresh(self):
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            self._articles, self._mtime = {}, None
+            return
+        if mtime == self._mtime:
+            return
+        with self._lock:
+            if mtime == self._mtime:
+                return
+            with open(self.path, "r", encoding="utf-8") as f:
+                self._articles = json.load(f).get("articles", {})
+            self._mtime = mtime
+
+    def lookup(self, no: int) -> List[dict]:
+        self._refresh()
+        return self._articles.get(str(no), [])
+
+    def find(self, query: str) -> List[dict]:
+        """
+        查询中引用的条文。查询点名了规章 (全称或《简称》) 时只返回该规章的条文，
+        否则返回各规章中的同号条文，由调用方标注来源
+        """
+        entries = [entry for no in find_references(query) for entry in self.lookup(no)]
+        titles = _TITLE_RE.findall(query)
+
+        def named(entry: dict) -> bool:
+            name = regulation_name(entry["source"])
+            return bool(name) and (name in query or any(title in name for title in titles))
+
+        return [entry for entry in entries if named(entry)] or entries
+
+
+article_index = ArticleIndex()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="按章/条结构切分规章文本")
+    parser.add_argument("path")
+    args = parser.parse_args()
+    with open(args.path, "r", encoding="utf-8") as f:
+        text = f.read()
+    if not is_regulation(text):
+        print("未识别到条文结构")
+        return
+    for doc in split_regulation(text, {"source_filename": os.path.basename(args.path)}):
+        meta = doc.metadata
+        print(f"[{meta['chapter']} {meta['section']} {meta['article']} #{meta['part']}] "
+              f"{len(doc.page_content)} 字: {doc.page_content[:40]}")
+
+
+if __name__ == "__main__":
+    main()
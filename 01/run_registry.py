@@ -0,0 +1,241 @@
+'''
+Author: Yunpeng Shi
+Description: 可续传的流式运行 - 每次对话运行分配 run_id，SSE 事件按序号写入有界的运行日志；
+             图在后台任务中执行，与客户端连接解耦：断线重连时携带 Last-Event-ID 回放错过的事件并继续跟随，
+             不会重新执行整张图；相同幂等键的重复提交直接附着到已有运行
+
+多 worker 部署 (serve.py 默认 4 个 uvicorn worker，无法按会话粘滞)：
+    幂等键的认领写入 Postgres 的 run_claims 表 (thread_id, 幂等键) 唯一，重试请求无论落到哪个 worker 都不会再次执行图；
+    运行日志仍保存在执行它的 worker 进程内，重试/续传落到其他 worker 时返回 409 与 run_id、运行是否结束，
+    客户端据此稍后重试或在结束后通过历史记录接口获取结果。memory 检查点后端没有共享存储，只支持单 worker
+
+配置 (环境变量):
+    RUN_LOG_MAX_EVENTS=5000     单次运行最多保留的事件数，超出后丢弃最早的事件
+    RUN_LOG_TTL_S=600           运行结束后日志保留时间
+    RUN_LOG_MAX_RUNS=500        最多保留的已结束运行数
+    RUN_CLAIM_TTL_S=86400       幂等键认领的有效期，过期后同一幂等键可重新提交
+'''
+import asyncio
+import json
+import os
+import socket
+import time
+import uuid
+from collections import OrderedDict, deque
+from typing import AsyncIterator, Callable, Deque, Dict, Optional, Tuple
+
+from utils import logger
+
+RUN_LOG_MAX_EVENTS = int(os.getenv("RUN_LOG_MAX_EVENTS", "5000"))
+RUN_LOG_TTL_S = float(os.getenv("RUN_LOG_TTL_S", "600"))
+RUN_LOG_MAX_RUNS = int(os.getenv("RUN_LOG_MAX_RUNS", "500"))
+RUN_CLAIM_TTL_S = float(os.getenv("RUN_CLAIM_TTL_S", "86400"))
+
+# 当前 worker 的标识，写入认领记录便于排查运行落在哪个进程
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+
+class Run:
+    def __init__(self, thread_id: str, idempotency_key: Optional[str] = None,
+                 max_events: int = RUN_LOG_MAX_EVENTS, run_id: Optional[str] = None):
+        self.run_id = run_id or uuid.uuid4().hex
+        self.thread_id = thread_id
+        self.idempotency_key = idempotency_key
+        # (seq, 已格式化的 SSE 事件)；seq 从 1 开始连续递增
+        self.events: Deque[Tuple[int, str]] = deque(maxlen=max_events)
+        self.next_seq = 1
+        self.done = False
+        self.finished_at: Optional[float] = None
+        self.task: Optional[asyncio.Task] = None
+        self._changed = asyncio.Event()
+
+    def _wake(self):
+        # 每次变化换一个新 Event，已在等待的订阅者被唤醒后取新的 Event 继续等待
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def append(self, payload: str):
+        self.events.append((self.next_seq, payload))
+        self.next_seq += 1
+        self._wake()
+
+    def finish(self):
+        if not self.done:
+            self.done = True
+            self.finished_at = time.monotonic()
+            self._wake()
+
+    async def follow(self, after: int = 0) -> AsyncIterator[Tuple[Optional[int], str]]:
+        """
+        依次产出序号大于 after 的事件，追上后等待新事件，直到运行结束。
+        请求的事件已被淘汰时先产出一个 (None, replay_gap 事件)
+        """
+        while True:
+            waiter = self._changed
+            while self.events and after < self.next_seq - 1:
+                # 消费者较慢时日志可能在两次产出之间淘汰旧事件，每次都重新定位
+                first_seq = self.events[0][0]
+                if after + 1 < first_seq:
+                    gap = {"run_id": self.run_id, "missed_from": after + 1, "resumed_at": first_seq}
+                    yield None, f"event: replay_gap\ndata: {json.dumps(gap)}\n\n"
+                    after = first_seq - 1
+                # seq 连续，直接按下标定位；跟随实时事件时读取的是队尾，deque 下标访问近似 O(1)
+                seq, payload = self.events[after + 1 - first_seq]
+                yield seq, payload
+                after = seq
+            if self.done:
+                return
+            await waiter.wait()
+
+    def info(self) -> dict:
+        return {"run_id": self.run_id, "thread_id": self.thread_id, "done": self.done,
+                "events": self.next_seq - 1}
+
+
+class RunRegistry:
+    def __init__(self, ttl_s: float = RUN_LOG_TTL_S, max_runs: int = RUN_LOG_MAX_RUNS):
+        self.ttl_s = ttl_s
+        self.max_runs = max_runs
+        self._runs: "OrderedDict[str, Run]" = OrderedDict()
+        self._keys: Dict[Tuple[str, str], str] = {}
+
+    def get(self, run_id: str) -> Optional[Run]:
+        return self._runs.get(run_id)
+
+    def find(self, thread_id: str, idempotency_key: Optional[str]) -> Optional[Run]:
+        if not idempotency_key:
+            return None
+        run_id = self._keys.get((thread_id, idempotency_key))
+        return self._runs.get(run_id) if run_id else None
+
+    def start(self, thread_id: str, source: Callable[[Run], AsyncIterator[str]],
+              idempotency_key: Optional[str] = None, run_id: Optional[str] = None) -> Tuple[Run, bool]:
+        """
+        启动一次运行，返回 (run, created)。相同 (thread_id, 幂等键) 的运行已存在时直接返回它，
+        source 不会再次执行；run_id 为已在 Postgres 中认领的运行 ID (见 claim)
+        """
+        existing = self.find(thread_id, idempotency_key)
+        if existing is not None:
+            return existing, False
+        self._evict()
+        run = Run(thread_id, idempotency_key, run_id=run_id)
+        self._runs[run.run_id] = run
+        if idempotency_key:
+            self._keys[(thread_id, idempotency_key)] = run.run_id
+        run.task = asyncio.create_task(self._pump(run, source(run)))
+        return run, True
+
+    async def _pump(self, run: Run, source: AsyncIterator[str]):
+        try:
+            async for payload in source:
+                run.append(payload)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"运行 {run.run_id} 异常退出: {e}")
+        finally:
+            run.finish()
+
+    def _drop(self, run_id: str):
+        run = self._runs.pop(run_id)
+        if run.idempotency_key:
+            self._keys.pop((run.thread_id, run.idempotency_key), None)
+
+    def _evict(self):
+        """清理过期的已结束运行；数量仍超限时按创建顺序淘汰最早结束的运行"""
+        now = time.monotonic()
+        finished = [r for r in self._runs.values() if r.done]
+        for run in finished:
+            if now - run.finished_at > self.ttl_s:
+                self._drop(run.run_id)
+        finished = [r for r in finished if r.run_id in self._runs]
+        for run in finished[:max(0, len(finished) - self.max_runs)]:
+            self._drop(run.run_id)
+
+    async def shutdown(self):
+        """服务停止时取消仍在执行的运行"""
+        tasks = [r.task for r in self._runs.values() if r.task is not None and not r.task.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> dict:
+        active = sum(1 for r in self._runs.values() if not r.done)
+        return {"active": active, "retained": len(self._runs) - active}
+
+
+# --- 跨 worker 的幂等键认领 (Postgres) ---
+CLAIMS_DDL = """
+CREATE TABLE IF NOT EXISTS run_claims (
+    thread_id TEXT NOT NULL,
+    idempotency_key TEXT NOT NULL,
+    run_id TEXT NOT NULL,
+    worker TEXT NOT NULL,
+    done BOOLEAN NOT NULL DEFAULT false,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY (thread_id, idempotency_key)
+)
+"""
+
+
+async def setup(conn):
+    async with conn.cursor() as cur:
+        await cur.execute(CLAIMS_DDL)
+
+
+async def claim(conn, thread_id: str, idempotency_key: str, run_id: str,
+                ttl_s: float = RUN_CLAIM_TTL_S) -> Tuple[str, str, bool]:
+    """
+    认领幂等键，返回 (run_id, worker, done)：返回的 run_id 等于传入值表示认领成功，由当前 worker 执行；
+    否则为先到请求的运行。插入依赖主键唯一约束，多个 worker 并发认领只有一个成功；过期的认领可被新请求接管
+    """
+    async with conn.cursor() as cur:
+        await cur.execute(
+            "INSERT INTO run_claims (thread_id, idempotency_key, run_id, worker) VALUES (%s, %s, %s, %s) "
+            "ON CONFLICT (thread_id, idempotency_key) DO UPDATE "
+            "SET run_id = EXCLUDED.run_id, worker = EXCLUDED.worker, done = false, created_at = now() "
+            "WHERE run_claims.created_at < now() - make_interval(secs => %s) "
+            "RETURNING run_id, worker, done",
+            (thread_id, idempotency_key, run_id, WORKER_ID, ttl_s))
+        row = await cur.fetchone()
+        if row is None:
+            await cur.execute("SELECT run_id, worker, done FROM run_claims WHERE thread_id = %s AND idempotency_key = %s",
+                              (thread_id, idempotency_key))
+            row = await cur.fetchone()
+    return row[0], row[1], row[2]
+
+
+async def lookup(conn, run_id: str) -> Optional[Tuple[str, bool]]:
+    """按 run_id 查询认领记录，返回 (worker, done)；没有幂等键的运行不会写入认领表"""
+    async with conn.cursor() as cur:
+        await cur.execute("SELECT worker, done FROM run_claims WHERE run_id = %s", (run_id,))
+        row = await cur.fetchone()
+    return (row[0], row[1]) if row else None
+
+
+async def mark_done(conn, run_id: str):
+    async with conn.cursor() as cur:
+        await cur.execute("UPDATE run_claims SET done = true WHERE run_id = %s", (run_id,))
+
+
+def parse_last_event_id(value: Optional[str]) -> Optional[Tuple[str, int]]:
+    """Last-Event-ID 格式为 <run_id>:<seq>"""
+    if not value:
+        return None
+    run_id, _, seq = value.strip().rpartition(":")
+    if not run_id or not seq.isdigit():
+        return None
+    return run_id, int(seq)
+
+
+async def sse_stream(run: Run, after: int = 0) -> AsyncIterator[str]:
+    """
+    输出给客户端的 SSE 流：先推送 run 事件告知 run_id，再回放/跟随运行日志；
+    每个事件带 id: <run_id>:<seq>，浏览器 EventSource 重连时会自动携带 Last-Event-ID
+    """
+    yield f"event: run\ndata: {json.dumps({**run.info(), 'resumed_from': after})}\n\n"
+    async for seq, payload in run.follow(after):
+        yield payload if seq is None else f"id: {run.run_id}:{seq}\n{payload}"
+
+
+registry = RunRegistry()
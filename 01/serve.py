@@ -0,0 +1,42 @@
+'''
+Author: Yunpeng Shi
+Description: 生产环境启动入口 - 多 worker 运行 uvicorn，并按 worker 数与 Postgres 连接预算分配每个 worker 的连接池大小
+
+用法 (在 01 目录下):
+    python serve.py --workers 4                      # 每个 worker 的连接池按 DB_MAX_CONNECTIONS 自动计算
+    DB_MAX_CONNECTIONS=200 python serve.py -w 8
+    python serve.py --reload                         # 本地开发：单 worker + 代码热重载
+'''
+import argparse
+import os
+
+import db_pool
+from utils import logger
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Metro Agent 服务启动入口")
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument("-w", "--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", "4")))
+    parser.add_argument("--reload", action="store_true", help="开发模式 (强制单 worker)")
+    args = parser.parse_args()
+
+    workers = 1 if args.reload else args.workers
+    # 子进程继承环境变量，各 worker 据此计算自己的连接池大小
+    os.environ["WEB_CONCURRENCY"] = str(workers)
+    min_size, max_size = db_pool.configured_sizing(workers)
+    logger.info(f">>> 启动 {workers} 个 worker，每个 worker 连接池 min={min_size} max={max_size}，"
+                f"最多占用 {workers * max_size}/{db_pool.DB_MAX_CONNECTIONS} 个数据库连接")
+    if workers * max_size > db_pool.DB_MAX_CONNECTIONS - db_pool.DB_RESERVED_CONNECTIONS:
+        logger.warning(">>> 显式配置的 DB_POOL_MAX_SIZE 超出连接预算，高峰期可能触发 too many connections")
+
+    import uvicorn
+    uvicorn.run("main:app", host=args.host, port=args.port, workers=workers, reload=args.reload,
+                # 长连接 SSE 为主，空闲 keep-alive 连接保留稍久一些
+                timeout_keep_alive=int(os.getenv("KEEP_ALIVE_TIMEOUT", "15")),
+                log_config=None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,15 @@
+#!/bin/sh
+# 容器启动脚本
+# 配置了 EMBEDDING_SIDECAR_SOCKET 时先启动共享 Embedding sidecar，4 个 uvicorn worker 复用同一份模型；
+# sidecar 未就绪或中途退出时，worker 会自动退回进程内加载模型
+if [ -n "$EMBEDDING_SIDECAR_SOCKET" ]; then
+    python embedding_sidecar.py serve --socket "$EMBEDDING_SIDECAR_SOCKET" &
+    # 等待模型加载完成 (最多 120 秒)，避免 worker 首次检索时因 sidecar 未就绪而各自加载模型
+    for _ in $(seq 1 120); do
+        python embedding_sidecar.py ping --socket "$EMBEDDING_SIDECAR_SOCKET" >/dev/null 2>&1 && break
+        sleep 1
+    done
+fi
+
+# 每个 worker 的数据库连接池按 worker 数与 DB_MAX_CONNECTIONS 分配
+exec python serve.py --workers "${WEB_CONCURRENCY:-4}"
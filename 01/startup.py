@@ -0,0 +1,105 @@
+'''
+Author: Yunpeng Shi
+Description: 启动阶段管理 - 记录各组件的导入/预热耗时，lifespan 中并行预热 Embedding、向量库与 LLM 连接，
+             并维护 /health/live 与 /health/ready 所需的就绪状态 (每个 uvicorn worker 独立)
+'''
+import asyncio
+import inspect
+import logging
+import os
+import time
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger("MetroAgent")
+
+# 是否在启动时预热；关闭后各组件仍在首次请求时懒加载
+STARTUP_WARMUP = os.getenv("STARTUP_WARMUP", "1") == "1"
+# 单个组件预热的超时时间 (秒)
+WARMUP_TIMEOUT = float(os.getenv("STARTUP_WARMUP_TIMEOUT", "120"))
+# 就绪前必须预热成功的组件，逗号分隔；其余组件失败只降级，不影响就绪
+READY_REQUIRES = [c for c in os.getenv("STARTUP_READY_REQUIRES", "").split(",") if c]
+
+_process_start = time.monotonic()
+_timings: Dict[str, Dict[str, float]] = {"import": {}, "warmup": {}}
+_components: Dict[str, dict] = {}
+_state = {"db": False, "warmup_done": False}
+
+
+@contextmanager
+def timed(phase: str, component: str):
+    """记录一段代码的耗时 (毫秒)，如 timed("import", "agents")"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = round((time.perf_counter() - start) * 1000, 1)
+        _timings.setdefault(phase, {})[component] = elapsed
+
+
+async def _warm_one(name: str, fn: Callable[[], Any]):
+    start = time.perf_counter()
+    _components[name] = {"status": "warming"}
+    try:
+        if inspect.iscoroutinefunction(fn):
+            result = await asyncio.wait_for(fn(), WARMUP_TIMEOUT)
+        else:
+            result = await asyncio.wait_for(asyncio.to_thread(fn), WARMUP_TIMEOUT)
+        # 约定：预热函数返回 False 表示组件不可用 (如向量库连接失败)
+        status = "failed" if result is False else "ready"
+        _components[name] = {"status": status}
+    except Exception as e:
+        _components[name] = {"status": "failed", "error": str(e) or type(e).__name__}
+        logger.warning(f"⚠️ 预热 {name} 失败: {e!r}")
+    finally:
+        elapsed = round((time.perf_counter() - start) * 1000, 1)
+        _timings["warmup"][name] = elapsed
+        _components[name]["ms"] = elapsed
+
+
+async def warm_up(tasks: Dict[str, Callable[[], Any]]):
+    """并行预热各组件；同步函数在线程池中执行，不阻塞事件循环"""
+    start = time.perf_counter()
+    try:
+        await asyncio.gather(*(_warm_one(name, fn) for name, fn in tasks.items()))
+    finally:
+        _state["warmup_done"] = True
+        _timings["warmup"]["total"] = round((time.perf_counter() - start) * 1000, 1)
+        summary = ", ".join(f"{n}={c['status']}({c.get('ms')}ms)" for n, c in _components.items())
+        logger.info(f">>> 预热完成: {summary}")
+
+
+def start_warm_up(tasks: Dict[str, Callable[[], Any]]) -> Optional[asyncio.Task]:
+    """在后台启动预热；未开启预热时直接视为完成"""
+    if not STARTUP_WARMUP:
+        _state["warmup_done"] = True
+        return None
+    return asyncio.create_task(warm_up(tasks), name="startup-warmup")
+
+
+def mark_db_ready(ready: bool = True):
+    _state["db"] = ready
+
+
+def mark_serving():
+    _timings["import"]["until_serving"] = round((time.monotonic() - _process_start) * 1000, 1)
+
+
+def readiness() -> Dict[str, Any]:
+    missing = [c for c in READY_REQUIRES if _components.get(c, {}).get("status") != "ready"]
+    ready = _state["db"] and _state["warmup_done"] and not missing
+    return {
+        "ready": ready,
+        "db": _state["db"],
+        "warmup_done": _state["warmup_done"],
+        "components": _components,
+        "timings_ms": _timings,
+    }
+
+
+def reset():
+    """测试用：清空启动状态"""
+    _timings.clear()
+    _timings.update({"import": {}, "warmup": {}})
+    _components.clear()
+    _state.update({"db": False, "warmup_done": False})
@@ -3,7 +3,9 @@ Author: Yunpeng Shi y.shi27@newcastle.ac.uk
 FilePath: /01/state.py
 Description: 增加 title 字段以支持对话命名
 '''
+import os
 import uuid
+from dataclasses import dataclass, fields, replace
 from typing import (Annotated, Any, Dict, List, Literal, Optional, TypedDict,
                     Union)
 
@@ -12,23 +14,106 @@ from langgraph.graph.message import add_messages
 from pydantic import BaseModel, Field
 
 
+# --- 任务看板 ---
+# 超过该长度的任务结果不放在看板记录中，按任务 ID 存入 task_results，看板本身保持很小
+TASK_RESULT_INLINE_CHARS = int(os.getenv("TASK_RESULT_INLINE_CHARS", "256"))
+
+
+@dataclass(slots=True)
+class TaskRecord:
+    """看板上的一条任务；result_ref 为 True 时结果存放在 task_results[id]"""
+    id: str
+    task_type: str
+    description: str = ""
+    input_content: str = ""
+    status: str = "pending"
+    result: Optional[str] = None
+    result_ref: bool = False
+
+    @classmethod
+    def coerce(cls, value: Union["TaskRecord", Dict[str, Any]]) -> "TaskRecord":
+        if isinstance(value, cls):
+            return value
+        return cls(**{name: value[name] for name in _RECORD_FIELDS if name in value})
+
+    def as_task(self) -> Dict[str, Any]:
+        """Worker 使用的任务字典 (Send 参数)"""
+        return {name: getattr(self, name) for name in _RECORD_FIELDS}
+
+
+_RECORD_FIELDS = tuple(f.name for f in fields(TaskRecord))
+
+TaskBoard = Dict[str, TaskRecord]
+BoardUpdate = Union[TaskRecord, Dict[str, Any], List[Union[TaskRecord, Dict[str, Any]]], str]
+
+
+def board_tasks(board: Union[TaskBoard, List[Dict[str, Any]], None]) -> List[TaskRecord]:
+    """按规划顺序返回看板上的任务；兼容旧检查点中列表形式的看板"""
+    if not board:
+        return []
+    values = board.values() if isinstance(board, dict) else board
+    return [TaskRecord.coerce(task) for task in values]
+
+
+def task_result(task: Union[TaskRecord, Dict[str, Any]], results: Optional[Dict[str, str]] = None) -> Optional[str]:
+    task = TaskRecord.coerce(task)
+    if task.result_ref:
+        return (results or {}).get(task.id)
+    return task.result
+
+
+def complete_task(task: Union[TaskRecord, Dict[str, Any]], result: Optional[str]) -> Dict[str, Any]:
+    """Worker 完成任务时返回的状态更新：短结果直接写在记录里，长结果写入 task_results 并在记录中引用"""
+    record = replace(TaskRecord.coerce(task), status="done", result=result, result_ref=False)
+    if result is not None and len(result) > TASK_RESULT_INLINE_CHARS:
+        record.result, record.result_ref = None, True
+        return {"task_board": [record], "task_results": {record.id: result}}
+    return {"task_board": [record]}
+
+
 # --- Reducer 函数 ---
-def reduce_task_board(left: List[Dict[str, Any]], right: Union[List[Dict[str, Any]], Dict[str, Any], str]) -> List[Dict[str, Any]]:
+def reduce_task_board(left: Union[TaskBoard, List[Dict[str, Any]], None], right: BoardUpdate) -> TaskBoard:
+    """
+    按任务 ID 合并，只处理本次更新涉及的任务。
+    left 可能正被异步写入的检查点引用，不能原地修改：复制一次字典 (浅拷贝)，被更新的任务替换为新记录。
+    更新可以是 TaskRecord、完整/部分的任务字典 (旧格式) 或它们的列表
+    """
     if right == "RESET":
-        return []
-    updates = [right] if isinstance(right, dict) else right
-    if not left:
-        return updates
-    new_board = left.copy()
-    id_to_index = {task["id"]: i for i, task in enumerate(new_board)}
+        return {}
+    # 空看板上的更新即新一轮规划：与列表看板一致，规划中的每个任务都保留，ID 重复时后出现的换用新 ID
+    planning = not left
+    if isinstance(left, dict):
+        board = dict(left)
+    else:
+        board = {task.id: task for task in board_tasks(left)}
+    updates = right if isinstance(right, list) else [right]
     for update in updates:
-        t_id = update.get("id")
-        if t_id and t_id in id_to_index:
-            idx = id_to_index[t_id]
-            new_board[idx] = {**new_board[idx], **update}
+        update_id = update.id if isinstance(update, TaskRecord) else update.get("id")
+        if planning and update_id in board:
+            update = replace(TaskRecord.coerce(update), id=str(uuid.uuid4()))
+        if isinstance(update, TaskRecord):
+            board[update.id] = update
+            continue
+        current = board.get(update.get("id"))
+        if current is None:
+            record = TaskRecord.coerce(update)
+            board[record.id] = record
         else:
-            new_board.append(update)
-    return new_board
+            board[current.id] = replace(TaskRecord.coerce(current),
+                                        **{k: v for k, v in update.items() if k in _RECORD_FIELDS})
+    return board
+
+
+def reduce_worker_trace(left: Optional[List[BaseMessage]], right: Union[List[BaseMessage], str]) -> List[BaseMessage]:
+    if right == "RESET":
+        return []
+    return (left or []) + right
+
+
+def reduce_task_results(left: Optional[Dict[str, str]], right: Union[Dict[str, str], str]) -> Dict[str, str]:
+    if right == "RESET":
+        return {}
+    return {**(left or {}), **right}
 
 # --- Pydantic 模型 ---
 class Task(BaseModel):
@@ -51,6 +136,10 @@ class WorkerState(TypedDict):
 class agentState(TypedDict):
     messages: Annotated[List[BaseMessage], add_messages]
     next_step: str
-    task_board: Annotated[List[Dict[str, Any]], reduce_task_board]
+    task_board: Annotated[TaskBoard, reduce_task_board]
+    # 看板任务的长结果 (按任务 ID)，与看板一起在每轮结束时清空
+    task_results: Annotated[Dict[str, str], reduce_task_results]
+    # 本轮各 Worker 的中间消息 (思考、工具调用与结果)，不进入 messages；新一轮规划时清空，见 worker_traces.py
+    worker_trace: Annotated[List[BaseMessage], reduce_worker_trace]
     # ✅ 新增：存储当前对话的标题
     title: Optional[str]
\ No newline at end of file
@@ -1,6 +1,7 @@
 import os
 
 import pytest
+import tool_cache
 
 
 @pytest.fixture(autouse=True)
@@ -21,4 +22,11 @@ def mock_env_vars():
     
     # 测试结束后恢复现场
     os.environ.clear()
-    os.environ.update(old_environ)
\ No newline at end of file
+    os.environ.update(old_environ)
+
+
+@pytest.fixture(autouse=True)
+def clear_tool_cache():
+    """工具调用缓存是进程级的，每个测试前清空，避免用例之间互相命中"""
+    tool_cache.clear_all()
+    yield
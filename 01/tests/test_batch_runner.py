@@ -0,0 +1,87 @@
+import asyncio
+
+import batch_runner
+import pytest
+import worker_traces
+from langchain_core.messages import AIMessage
+
+
+async def chunks(*parts: bytes):
+    for part in parts:
+        yield part
+
+
+class FakeGraph:
+    def __init__(self):
+        self.active = 0
+        self.peak = 0
+        self.order = []
+
+    async def ainvoke(self, state, config):
+        query = state["messages"][0].content
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        self.order.append((config["configurable"]["thread_id"], query))
+        await asyncio.sleep(0.02)
+        self.active -= 1
+        if query == "boom":
+            raise RuntimeError("worker failed")
+        return {"messages": state["messages"] + [AIMessage(content=f"答复:{query}", name="responder_agent")],
+                "worker_trace": [AIMessage(content=f"Title: 检索\nContent: {query}")]}
+
+
+@pytest.mark.asyncio
+async def test_ndjson_lines_split_across_chunks():
+    items = [item async for item in batch_runner.parse_ndjson(
+        chunks(b'{"query": "A"}\n{"qu', b'ery": "B", "id": 7}\nnot json\n{"query": "C"}'))]
+    assert [i.get("query") for i in items] == ["A", "B", None, "C"]
+    assert items[1]["id"] == 7 and "_error" in items[2]
+
+
+@pytest.mark.asyncio
+async def test_run_batch_bounded_concurrency_and_summary():
+    graph = FakeGraph()
+    body = b"".join(b'{"query": "q%d"}\n' % i for i in range(10)) + b'{"query": "boom"}\n'
+    results = [r async for r in batch_runner.run_batch(graph, batch_runner.parse_ndjson(chunks(body)), concurrency=3)]
+
+    summary = results[-1]
+    assert summary["type"] == "summary"
+    assert (summary["total"], summary["succeeded"], summary["failed"]) == (11, 10, 1)
+    assert graph.peak == 3
+    answers = {r["id"]: r["answer"] for r in results[:-1] if not r["error"]}
+    assert answers[1] == "答复:q0"
+
+
+@pytest.mark.asyncio
+async def test_same_thread_runs_in_input_order():
+    graph = FakeGraph()
+    body = b'{"query": "1", "thread_id": "t"}\n{"query": "2", "thread_id": "t"}\n{"query": "3", "thread_id": "t"}\n'
+    results = [r async for r in batch_runner.run_batch(graph, batch_runner.parse_ndjson(chunks(body)), concurrency=3)]
+    assert [q for _, q in graph.order] == ["1", "2", "3"]
+    assert graph.peak == 1
+    assert results[-1]["succeeded"] == 3
+
+
+@pytest.mark.asyncio
+async def test_persisted_batch_saves_worker_traces_per_turn():
+    graph = FakeGraph()
+    body = '{"query": "1", "thread_id": "bt"}\n{"query": "2", "thread_id": "bt"}\n{"query": "boom", "thread_id": "bt"}\n'
+
+    async def save_trace(thread_id, values):
+        await worker_traces.save_turn(None, thread_id, values)
+
+    # 按轮保存以用户消息 ID 为键，检查点会为消息补上 ID，假图在这里模拟
+    original = graph.ainvoke
+
+    async def ainvoke(state, config):
+        state["messages"][0].id = f"h{state['messages'][0].content}"
+        return await original(state, config)
+    graph.ainvoke = ainvoke
+
+    items = batch_runner.parse_ndjson(chunks(body.encode()))
+    results = [r async for r in batch_runner.run_batch(graph, items, concurrency=2, save_trace=save_trace)]
+    traces = await worker_traces.load(None, "bt")
+    await worker_traces.delete(None, "bt")
+    assert {k: [m.content for m in v] for k, v in traces.items()} == {
+        "h1": ["Title: 检索\nContent: 1"], "h2": ["Title: 检索\nContent: 2"]}
+    assert [r["error"] is None for r in results[:-1]] == [True, True, False]
@@ -0,0 +1,136 @@
+import asyncio
+import os
+from unittest.mock import AsyncMock, MagicMock
+
+import circuit_breaker
+import knowledge_domains
+import pytest
+import utils
+from agents.judge_agent import policy_checker
+from circuit_breaker import CircuitBreaker
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_opens_after_threshold_and_probes_once_when_half_open():
+    clock = FakeClock()
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=10, clock=clock)
+    breaker.record_failure("timeout")
+    assert breaker.allow()
+    breaker.record_failure("timeout")
+    assert breaker.state == circuit_breaker.OPEN and not breaker.allow()
+
+    clock.now = 10
+    assert breaker.state == circuit_breaker.HALF_OPEN
+    # 半开状态只放行一个探测
+    assert breaker.allow() and not breaker.allow()
+    breaker.record_failure("still down")
+    assert breaker.state == circuit_breaker.OPEN and breaker.snapshot()["retry_in_s"] == 10
+
+    clock.now = 20
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == circuit_breaker.CLOSED and breaker.allow()
+
+
+def test_lost_probe_is_replaced_after_reset_timeout():
+    clock = FakeClock()
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=5, clock=clock)
+    breaker.record_failure()
+    clock.now = 5
+    assert breaker.allow() and not breaker.allow()
+    clock.now = 10
+    assert breaker.allow()
+
+
+@pytest.fixture
+def breaker(monkeypatch):
+    breaker = CircuitBreaker("vector_store_test", failure_threshold=1, reset_timeout=60)
+    monkeypatch.setattr(utils, "vector_breaker", breaker)
+    monkeypatch.setattr(utils, "_cached_vector_store", None)
+    return breaker
+
+
+def test_open_breaker_skips_connection_and_uses_snapshot(breaker, monkeypatch):
+    snapshot = MagicMock()
+    connect = MagicMock(side_effect=lambda: breaker.record_failure("refused"))
+    monkeypatch.setattr(utils, "_connect_vector_store", connect)
+    monkeypatch.setattr(utils, "get_snapshot_store", lambda: snapshot)
+
+    assert utils.get_vector_store() is snapshot
+    assert utils.get_vector_store() is snapshot
+    # 熔断后不再尝试连接
+    assert connect.call_count == 1
+    assert utils.vector_store_status()["state"] == circuit_breaker.OPEN
+
+
+@pytest.mark.asyncio
+async def test_failed_search_falls_back_to_snapshot(breaker, monkeypatch):
+    milvus = MagicMock()
+    milvus.fields = ["pk", "text", "vector", "domain"]
+    milvus.as_retriever.return_value.ainvoke = AsyncMock(side_effect=ConnectionError("milvus down"))
+    snapshot = MagicMock()
+    snapshot.index_to_docstore_id = {}
+    doc = MagicMock()
+    doc.page_content = "第二十一条 乘客不得在车厢内饮食。"
+    snapshot.as_retriever.return_value.ainvoke = AsyncMock(return_value=[doc])
+    monkeypatch.setattr(utils, "get_vector_store", lambda: milvus)
+    monkeypatch.setattr(utils, "get_snapshot_store", lambda: snapshot)
+    monkeypatch.setattr(utils, "_snapshot_store", snapshot)
+
+    result = await policy_checker.ainvoke({"query": "车厢内能吃东西吗"})
+    assert "饮食" in result and utils.SNAPSHOT_NOTE in result
+    assert breaker.state == circuit_breaker.OPEN
+    # 快照按元数据过滤领域
+    assert snapshot.as_retriever.call_args.kwargs["search_kwargs"]["filter"] == {"domain": {"$in": ["regulation"]}}
+    # 降级结果不进入工具缓存
+    assert not utils.knowledge_result_cacheable(result)
+
+
+@pytest.mark.asyncio
+async def test_slow_search_times_out_and_counts_as_failure(breaker, monkeypatch):
+    monkeypatch.setattr(utils, "VECTOR_SEARCH_TIMEOUT", 0.01)
+    monkeypatch.setattr(utils, "get_snapshot_store", lambda: None)
+
+    async def hang(store):
+        await asyncio.sleep(1)
+
+    with pytest.raises(asyncio.TimeoutError):
+        await utils.search_vector_store(MagicMock(), hang)
+    assert breaker.state == circuit_breaker.OPEN
+
+
+def test_snapshot_filter_only_for_faiss_docstore():
+    store = MagicMock()
+    store.fields = ["pk", "text", "vector"]
+    assert knowledge_domains.search_kwargs(store, "policy_checker", k=2) == {"k": 2}
+    assert knowledge_domains.search_kwargs(MagicMock(), "policy_checker", k=2) == {"k": 2}
+
+
+def test_legacy_snapshot_without_domain_is_not_filtered():
+    from langchain_community.docstore.in_memory import InMemoryDocstore
+    from langchain_core.documents import Document
+
+    def snapshot(metadata):
+        store = MagicMock()
+        store.index_to_docstore_id = {0: "d0"}
+        store.docstore = InMemoryDocstore({"d0": Document(page_content="禁止饮食", metadata=metadata)})
+        return store
+
+    legacy = snapshot({"source": "data/raw_docs/杭州市地铁乘车规则.txt"})
+    assert knowledge_domains.search_kwargs(legacy, "policy_checker", k=2) == {"k": 2}
+    rebuilt = snapshot({"source": "data/raw_docs/杭州市地铁乘车规则.txt", "domain": "regulation"})
+    assert knowledge_domains.search_kwargs(rebuilt, "policy_checker", k=2)["filter"] == {"domain": {"$in": ["regulation"]}}
+
+
+@pytest.mark.skipif("VECTOR_STORE_SNAPSHOT_DIR" in os.environ, reason="使用了自定义快照目录")
+def test_default_snapshot_path_points_at_shipped_index():
+    # build_knowledge.py 按集合名保存快照，默认目录为仓库根目录的 data/vector_store
+    assert os.path.exists(os.path.join(utils.VECTOR_STORE_SNAPSHOT_DIR, "metro_knowledge.faiss"))
+    assert os.path.exists(os.path.join(utils.VECTOR_STORE_SNAPSHOT_DIR, f"{utils.VECTOR_STORE_SNAPSHOT_INDEX}.pkl"))
@@ -0,0 +1,35 @@
+import db_pool
+import pytest
+
+
+def test_pool_sizing_fits_connection_budget():
+    # 4 个 worker 平分 90 个连接，单个 worker 受上限约束
+    assert db_pool.pool_sizing(4, max_connections=100, reserved=10) == (5, 20)
+    # worker 多时按预算平分，总数不超过 max_connections - reserved
+    min_size, max_size = db_pool.pool_sizing(16, max_connections=100, reserved=10)
+    assert (min_size, max_size) == (2, 5)
+    assert 16 * max_size <= 90
+
+
+def test_pool_sizing_rejects_insufficient_budget():
+    with pytest.raises(ValueError):
+        db_pool.pool_sizing(8, max_connections=12, reserved=10)
+
+
+def test_explicit_pool_size_overrides_budget(monkeypatch):
+    monkeypatch.setattr(db_pool, "DB_POOL_MAX_SIZE", "3")
+    monkeypatch.setattr(db_pool, "DB_POOL_MIN_SIZE", "8")
+    assert db_pool.configured_sizing(2) == (3, 3)
+
+
+class _FakePool:
+    def get_stats(self):
+        return {"pool_min": 2, "pool_max": 8, "pool_size": 6, "pool_available": 2,
+                "requests_queued": 4, "requests_wait_ms": 100}
+
+
+def test_pool_stats_reports_saturation_and_wait():
+    stats = db_pool.pool_stats(_FakePool())
+    assert stats["in_use"] == 4
+    assert stats["saturation"] == 0.5
+    assert stats["avg_wait_ms"] == 25.0
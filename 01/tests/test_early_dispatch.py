@@ -0,0 +1,129 @@
+import asyncio
+import json
+
+import pytest
+from agents import early_dispatch, supervisor
+from agents.early_dispatch import TaskStreamParser
+from langchain_core.runnables.config import ensure_config
+
+
+def test_parser_emits_each_task_once_closed():
+    plan = {"tasks": [
+        {"task_type": "general_chat", "description": "闲聊", "input_content": "你好"},
+        {"task_type": "ticket_agent", "description": "查余额", "input_content": "卡号 {A1} \"引号\""},
+    ]}
+    args = json.dumps(plan, ensure_ascii=False)
+    parser = TaskStreamParser()
+
+    # 按 5 个字符一段模拟 tool-call 参数流
+    emitted = []
+    for i in range(0, len(args), 5):
+        emitted.append(parser.feed(args[i:i + 5]))
+
+    tasks = [t for batch in emitted for t in batch]
+    assert tasks == plan["tasks"]
+    # 第一个任务应在参数流结束前就被解析出来
+    first_idx = next(i for i, batch in enumerate(emitted) if batch)
+    assert first_idx < len(emitted) - 1
+
+
+def test_parser_ignores_incomplete_tail():
+    parser = TaskStreamParser()
+    assert parser.feed('{"tasks": [{"task_type": "general_chat", "input_con') == []
+    assert parser.feed('tent": "x"}') == [{"task_type": "general_chat", "input_content": "x"}]
+
+
+CONFIG = {"configurable": {"thread_id": "th-1"}, "metadata": {"langgraph_node": "supervisor_node"}}
+
+
+@pytest.fixture
+def worker(monkeypatch):
+    monkeypatch.setattr(early_dispatch, "_early_runs", {})
+    calls = []
+
+    async def ticket_agent(state):
+        calls.append(ensure_config()["metadata"])
+        await asyncio.sleep(0.01)
+        return {"task_results": {state["task"]["id"]: f"{state['task']['input_content']}: 余额 35.50 元"}}
+
+    return early_dispatch.bind_worker("ticket_agent", ticket_agent), calls
+
+
+def _task(task_id="t1"):
+    return {"id": task_id, "task_type": "ticket_agent", "input_content": "查余额", "status": "pending"}
+
+
+@pytest.mark.asyncio
+async def test_scheduled_worker_runs_once_and_node_reuses_result(worker):
+    node, calls = worker
+    assert early_dispatch.schedule(_task(), [], CONFIG)
+    # 同一任务不会重复提前启动
+    assert not early_dispatch.schedule(_task(), [], CONFIG)
+
+    result = await node({"task": _task(), "messages": []}, CONFIG)
+    assert result == {"task_results": {"t1": "查余额: 余额 35.50 元"}}
+    assert len(calls) == 1 and early_dispatch._early_runs == {}
+    # 提前执行以 Worker 自身的运行配置启动，而不是沿用 Supervisor 的
+    assert calls[0]["langgraph_node"] == "ticket_agent"
+    assert calls[0]["early_dispatch"] is True and calls[0]["task_id"] == "t1"
+
+    # 没有提前启动的任务由图节点直接执行
+    await node({"task": _task("t2"), "messages": []}, CONFIG)
+    assert len(calls) == 2
+
+
+@pytest.mark.asyncio
+async def test_stale_and_discarded_runs_are_cancelled(worker, monkeypatch):
+    early_dispatch.schedule(_task("old"), [], CONFIG)
+    old_run = early_dispatch._early_runs[("th-1", "old")][1]
+    monkeypatch.setattr(early_dispatch, "STALE_RUN_SECONDS", -1)
+    early_dispatch.schedule(_task("new"), [], CONFIG)
+    await asyncio.wait([old_run])
+    assert old_run.cancelled() and list(early_dispatch._early_runs) == [("th-1", "new")]
+
+    new_run = early_dispatch._early_runs[("th-1", "new")][1]
+    early_dispatch.discard(["new"], CONFIG)
+    await asyncio.wait([new_run])
+    assert new_run.cancelled() and early_dispatch._early_runs == {}
+
+
+class FakePlanner:
+    """按 tool-call 参数流返回固定计划；任务 ID 与真实模型一样由模型随意给出"""
+
+    def __init__(self, card):
+        self.card = card
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    async def astream(self, messages, config=None):
+        from langchain_core.messages import AIMessageChunk
+        args = json.dumps({"tasks": [{"id": "1", "task_type": "ticket_agent", "description": "查余额",
+                                      "input_content": self.card}]}, ensure_ascii=False)
+        for i in range(0, len(args), 8):
+            yield AIMessageChunk(content="", tool_call_chunks=[{"name": None, "args": args[i:i + 8], "id": None,
+                                                                "index": 0}])
+
+
+@pytest.mark.asyncio
+async def test_concurrent_requests_on_same_thread_keep_their_own_early_runs(worker, monkeypatch):
+    node, calls = worker
+    monkeypatch.setattr(supervisor, "EARLY_DISPATCH", True)
+    monkeypatch.setattr(supervisor.prompts, "record_usage", lambda *args: None)
+    # 两个未指定 thread_id 的请求共享同一个默认线程，模型给出的任务 ID 相同
+    config = {"configurable": {"thread_id": "default_thread"}}
+
+    async def plan(card):
+        monkeypatch.setattr(supervisor.utils, "get_llm", lambda node=None: FakePlanner(card))
+        return await supervisor.stream_plan([], {"messages": []}, config)
+
+    board_a = await plan("卡号 A")
+    board_b = await plan("卡号 B")
+    assert board_a[0]["id"] != "1" and board_a[0]["id"] != board_b[0]["id"]
+    assert len(early_dispatch._early_runs) == 2
+
+    result_b = await node({"task": board_b[0], "messages": []}, config)
+    result_a = await node({"task": board_a[0], "messages": []}, config)
+    assert result_a["task_results"] == {board_a[0]["id"]: "卡号 A: 余额 35.50 元"}
+    assert result_b["task_results"] == {board_b[0]["id"]: "卡号 B: 余额 35.50 元"}
+    assert len(calls) == 2
@@ -0,0 +1,110 @@
+import os
+
+import embedding_backends
+import numpy as np
+import pytest
+from embedding_backends import OnnxEmbeddings, compare_embeddings, export_onnx, onnx_model_file
+from langchain_core.embeddings import Embeddings
+
+onnx = pytest.importorskip("onnx")
+pytest.importorskip("onnxruntime")
+from onnx import TensorProto, helper, numpy_helper  # noqa: E402
+from tokenizers import Tokenizer, models, pre_tokenizers  # noqa: E402
+
+VOCAB = {"[PAD]": 0, "[UNK]": 1, "[CLS]": 2, "折叠": 3, "自行车": 4, "可以": 5, "进站": 6, "吗": 7, "饮食": 8}
+DIM = 16
+
+
+def _build_model(tmp_path, pooling="mean"):
+    """
+    手工构造的小模型：last_hidden_state = Gather(E, input_ids) @ W，
+    tokenizer.json 为按空格切词的 WordLevel 词表；返回 (模型目录, ONNX 路径, E, W)
+    """
+    rng = np.random.default_rng(0)
+    table = rng.normal(size=(len(VOCAB), DIM)).astype(np.float32)
+    weight = rng.normal(size=(DIM, DIM)).astype(np.float32)
+
+    model_dir = tmp_path / "tiny-model"
+    os.makedirs(model_dir / "1_Pooling")
+    tokenizer = Tokenizer(models.WordLevel(VOCAB, unk_token="[UNK]"))
+    tokenizer.pre_tokenizer = pre_tokenizers.WhitespaceSplit()
+    tokenizer.save(str(model_dir / "tokenizer.json"))
+    (model_dir / "1_Pooling" / "config.json").write_text(
+        '{"pooling_mode_cls_token": %s}' % ("true" if pooling == "cls" else "false"))
+
+    graph = helper.make_graph(
+        [helper.make_node("Gather", ["table", "input_ids"], ["tokens"]),
+         helper.make_node("MatMul", ["tokens", "weight"], ["last_hidden_state"])],
+        "tiny",
+        [helper.make_tensor_value_info("input_ids", TensorProto.INT64, ["batch", "sequence"]),
+         helper.make_tensor_value_info("attention_mask", TensorProto.INT64, ["batch", "sequence"])],
+        [helper.make_tensor_value_info("last_hidden_state", TensorProto.FLOAT, ["batch", "sequence", DIM])],
+        initializer=[numpy_helper.from_array(table, "table"), numpy_helper.from_array(weight, "weight")],
+    )
+    onnx_dir = tmp_path / "onnx"
+    os.makedirs(onnx_dir)
+    onnx_path = onnx_model_file(str(onnx_dir), quantize=False)
+    # 新版 onnx 默认的 IR 版本可能超出 onnxruntime 的支持范围，显式指定
+    onnx.save(helper.make_model(graph, opset_imports=[helper.make_opsetid("", 17)], ir_version=8), onnx_path)
+    return str(model_dir), onnx_path, table, weight
+
+
+class ReferenceEmbeddings(Embeddings):
+    """numpy 实现的同一模型 (对应 PyTorch 参考输出)：逐条计算，不做 padding"""
+
+    def __init__(self, table, weight, pooling):
+        self.table, self.weight, self.pooling = table, weight, pooling
+
+    def embed_documents(self, texts):
+        vectors = []
+        for text in texts:
+            hidden = self.table[[VOCAB.get(w, 1) for w in text.split()]] @ self.weight
+            vector = hidden[0] if self.pooling == "cls" else hidden.mean(axis=0)
+            vectors.append((vector / np.linalg.norm(vector)).tolist())
+        return vectors
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+TEXTS = ["[CLS] 折叠 自行车 可以 进站 吗", "[CLS] 饮食", "[CLS] 自行车 未登录词"]
+
+
+@pytest.mark.parametrize("pooling", ["mean", "cls"])
+def test_onnx_pooling_and_normalisation_match_reference(tmp_path, pooling):
+    model_dir, onnx_path, table, weight = _build_model(tmp_path, pooling)
+    embeddings = OnnxEmbeddings(model_dir, onnx_path, batch_size=2)
+    assert embeddings.pooling == pooling
+
+    # 批内长短不一：mean 池化必须按 attention_mask 排除 padding
+    vectors = np.asarray(embeddings.embed_documents(TEXTS))
+    assert np.allclose(np.linalg.norm(vectors, axis=1), 1.0, atol=1e-5)
+    result = compare_embeddings(embeddings, ReferenceEmbeddings(table, weight, pooling), TEXTS)
+    assert result["min_cosine"] >= embedding_backends.DEFAULT_MIN_COSINE
+    assert result["max_abs_diff"] < 1e-4
+    assert embeddings.embed_query(TEXTS[1]) == pytest.approx(vectors[1].tolist(), abs=1e-6)
+
+
+def test_quantized_export_is_atomic_and_within_tolerance(tmp_path, monkeypatch):
+    model_dir, fp32_path, table, weight = _build_model(tmp_path)
+    onnx_dir = os.path.dirname(fp32_path)
+    int8_path = onnx_model_file(onnx_dir, quantize=True)
+
+    # 量化中途失败：不能留下会被 os.path.exists 当作可用模型的半截文件
+    def crash(fp32, staging, **kwargs):
+        with open(staging, "wb") as f:
+            f.write(b"partial")
+        raise RuntimeError("量化进程被中断")
+
+    import onnxruntime.quantization
+    real_quantize = onnxruntime.quantization.quantize_dynamic
+    monkeypatch.setattr(onnxruntime.quantization, "quantize_dynamic", crash)
+    with pytest.raises(RuntimeError):
+        export_onnx(model_dir, onnx_dir, quantize=True)
+    assert not os.path.exists(int8_path)
+    assert sorted(os.listdir(onnx_dir)) == [".export.lock", "model.onnx"]
+
+    monkeypatch.setattr(onnxruntime.quantization, "quantize_dynamic", real_quantize)
+    assert export_onnx(model_dir, onnx_dir, quantize=True) == int8_path
+    result = compare_embeddings(OnnxEmbeddings(model_dir, int8_path), ReferenceEmbeddings(table, weight, "mean"), TEXTS)
+    assert result["min_cosine"] >= embedding_backends.QUANTIZED_MIN_COSINE
@@ -0,0 +1,89 @@
+import asyncio
+import threading
+
+import metrics
+import pytest
+from embedding_service import BatchingEmbeddings
+from langchain_core.embeddings import Embeddings
+
+
+class RecordingEmbeddings(Embeddings):
+    """假模型：记录每次批量推理的输入及执行线程"""
+
+    def __init__(self, fail=False):
+        self.batches = []
+        self.threads = set()
+        self.fail = fail
+
+    def embed_documents(self, texts):
+        if self.fail:
+            raise RuntimeError("模型推理失败")
+        self.batches.append(list(texts))
+        self.threads.add(threading.current_thread().name)
+        return [[float(len(t))] for t in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+@pytest.mark.asyncio
+async def test_concurrent_queries_are_batched():
+    base = RecordingEmbeddings()
+    service = BatchingEmbeddings(base, max_batch_size=8, max_wait_ms=20)
+    texts = [f"问题{'x' * i}" for i in range(5)]
+
+    vectors = await asyncio.gather(*(service.aembed_query(t) for t in texts))
+    service.close()
+
+    assert vectors == [[float(len(t))] for t in texts]
+    assert base.batches == [texts]
+    # 推理发生在专用线程上，而不是事件循环所在线程
+    assert all(name.startswith("embedding") for name in base.threads)
+    assert max(metrics.get_samples("embedding_batch_size")) >= 5
+
+
+@pytest.mark.asyncio
+async def test_batch_size_limit_and_errors():
+    base = RecordingEmbeddings()
+    service = BatchingEmbeddings(base, max_batch_size=2, max_wait_ms=20)
+    await asyncio.gather(*(service.aembed_query(str(i)) for i in range(5)))
+    service.close()
+    assert all(len(batch) <= 2 for batch in base.batches)
+    assert sum(len(batch) for batch in base.batches) == 5
+
+    failing = BatchingEmbeddings(RecordingEmbeddings(fail=True), max_wait_ms=1)
+    with pytest.raises(RuntimeError):
+        await failing.aembed_query("第二十条")
+    failing.close()
+
+
+def test_process_mode_loads_model_only_in_spawned_workers(monkeypatch):
+    import embedding_backends
+    import embedding_service
+
+    def load_in_parent(*args, **kwargs):
+        raise AssertionError("进程池模式下父进程不应加载模型")
+
+    monkeypatch.setattr(embedding_service, "EXECUTOR_KIND", "process")
+    monkeypatch.setattr(embedding_service, "EMBEDDING_BATCHING", True)
+    monkeypatch.setattr(embedding_backends, "create_embeddings", load_in_parent)
+    service = embedding_service.load_embeddings("/models/bge", "onnx")
+    try:
+        assert service.base is None
+        assert service.executor._mp_context.get_start_method() == "spawn"
+        assert service.executor._initargs == ("/models/bge", "onnx")
+    finally:
+        service.close()
+
+
+def test_sync_calls_go_through_executor_without_local_model():
+    from concurrent.futures import ThreadPoolExecutor
+
+    base = RecordingEmbeddings()
+    service = BatchingEmbeddings(None, executor=ThreadPoolExecutor(max_workers=1), embed_fn=base.embed_documents)
+    try:
+        assert service.embed_documents(["ab", "c"]) == [[2.0], [1.0]]
+        assert service.embed_query("xyz") == [3.0]
+    finally:
+        service.close()
+    assert base.batches == [["ab", "c"], ["xyz"]]
@@ -0,0 +1,67 @@
+import asyncio
+import os
+
+import pytest
+from embedding_sidecar import SidecarEmbeddings, SidecarServer, ping
+from langchain_core.embeddings import Embeddings
+
+
+class FakeEmbeddings(Embeddings):
+    def __init__(self):
+        self.calls = 0
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        return [[float(len(t)), 1.0, -1.0] for t in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+@pytest.mark.asyncio
+async def test_sidecar_roundtrip_sync_and_async(tmp_path):
+    socket_path = str(tmp_path / "embedding.sock")
+    stop = asyncio.Event()
+    server = asyncio.create_task(SidecarServer(FakeEmbeddings(), socket_path).serve(stop))
+    while not os.path.exists(socket_path):
+        await asyncio.sleep(0.01)
+
+    fallback = FakeEmbeddings()
+    client = SidecarEmbeddings(socket_path, fallback_factory=lambda: fallback)
+    try:
+        assert await asyncio.to_thread(ping, socket_path)
+        # 同步接口在线程中调用，避免阻塞同一事件循环上的服务端
+        docs = await asyncio.to_thread(client.embed_documents, ["第二十条", "禁止饮食" * 50])
+        assert docs == [[4.0, 1.0, -1.0], [200.0, 1.0, -1.0]]
+        queries = await asyncio.gather(*(client.aembed_query("x" * i) for i in range(1, 6)))
+        assert [q[0] for q in queries] == [1.0, 2.0, 3.0, 4.0, 5.0]
+        assert fallback.calls == 0
+    finally:
+        stop.set()
+        await server
+    assert not os.path.exists(socket_path)
+
+
+@pytest.mark.asyncio
+async def test_falls_back_when_sidecar_down(tmp_path):
+    fallback = FakeEmbeddings()
+    client = SidecarEmbeddings(str(tmp_path / "missing.sock"), fallback_factory=lambda: fallback,
+                               retry_interval=60)
+
+    assert await client.aembed_query("余额") == [2.0, 1.0, -1.0]
+    assert client.embed_query("余额") == [2.0, 1.0, -1.0]
+    assert fallback.calls == 2
+    assert not client._available()
+
+
+@pytest.mark.asyncio
+async def test_runtime_error_before_connection_is_not_masked(tmp_path, monkeypatch):
+    client = SidecarEmbeddings(str(tmp_path / "embedding.sock"), fallback_factory=FakeEmbeddings)
+
+    async def acquire():
+        raise RuntimeError("事件循环已关闭")
+
+    monkeypatch.setattr(client, "_acquire", acquire)
+    with pytest.raises(RuntimeError, match="事件循环已关闭"):
+        await client._request_async(["余额"])
+    assert client._pool == []
@@ -0,0 +1,48 @@
+from typing import List
+
+import numpy as np
+from embedding_store import CachedEmbeddings, EmbeddingStore, model_id, text_key
+from langchain_core.embeddings import Embeddings
+
+
+class CountingEmbeddings(Embeddings):
+    def __init__(self):
+        self.embedded: List[str] = []
+
+    def embed_documents(self, texts):
+        self.embedded.extend(texts)
+        return [[float(len(t)), float(sum(map(ord, t)) % 97), 1.0] for t in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+def test_reindex_only_embeds_new_texts(tmp_path):
+    base = CountingEmbeddings()
+    first = CachedEmbeddings(base, EmbeddingStore("m", root=str(tmp_path)))
+    vectors = first.embed_documents(["第一条", "第二条", "第一条"])
+    assert base.embedded == ["第一条", "第二条"]
+
+    # 重新打开 (模拟下一次建库)：只有新文本需要计算，旧向量从磁盘读取
+    base.embedded.clear()
+    second = CachedEmbeddings(base, EmbeddingStore("m", root=str(tmp_path)))
+    again = second.embed_documents(["第二条", "第三条", "第一条"])
+    assert base.embedded == ["第三条"]
+    assert again[0] == vectors[1] and again[2] == vectors[0]
+    assert second.stats() == {"hits": 2, "misses": 1, "cached": 3}
+
+
+def test_compact_keeps_only_current_texts(tmp_path):
+    store = EmbeddingStore("m", root=str(tmp_path))
+    for i in range(4):
+        store.put_many([text_key(f"t{i}")], np.full((1, 3), i, dtype=np.float32))
+    store.compact(keep=[text_key("t1"), text_key("t3")])
+
+    reopened = EmbeddingStore("m", root=str(tmp_path))
+    assert len(reopened) == 2
+    assert len(list(tmp_path.joinpath("m").glob("seg-*.keys.npy"))) == 1
+    np.testing.assert_array_equal(reopened.get_many([text_key("t3")]), [[3, 3, 3]])
+
+
+def test_model_id_separates_backends():
+    assert model_id("./models/bge-small-zh-v1.5", "torch") != model_id("./models/bge-small-zh-v1.5", "onnx")
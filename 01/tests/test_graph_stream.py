@@ -0,0 +1,104 @@
+import graph_stream
+import pytest
+import tracing
+from agents.responder_agent import stream_bypass
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.tools import tool
+from langgraph.graph import END, START, MessagesState, StateGraph
+
+
+def test_thought_parser_handles_split_title_and_content():
+    parser = graph_stream.ThoughtParser()
+    events = []
+    for piece in ["Tit", "le: 查询条文\nCon", "tent: 第二十五条", " 禁止携带宠物", "Title: 结论\n", "Content: 不可以"]:
+        events += parser.feed(piece)
+    assert [d["title"] for t, d in events if t == "step"] == ["查询条文", "结论"]
+    thoughts = "".join(d["content"] for t, d in events if t == "thought")
+    assert "第二十五条 禁止携带宠物" in thoughts and "不可以" in thoughts
+    assert "Title:" not in thoughts
+
+
+def test_thought_parser_flushes_untitled_output():
+    parser = graph_stream.ThoughtParser()
+    assert parser.feed("短文本") == []
+    events = parser.feed("x" * graph_stream.THOUGHT_FLUSH_CHARS)
+    assert events == [("thought", {"content": "短文本" + "x" * graph_stream.THOUGHT_FLUSH_CHARS})]
+
+
+@tool
+async def lookup() -> str:
+    """查询条文"""
+    return "第二十五条"
+
+
+def build_app():
+    """主图 supervisor -> judge_agent (内含 ReAct 式子图) -> responder_agent (直出)"""
+    llm = GenericFakeChatModel(messages=iter([AIMessage(content="Title: 查询条文\nContent: 第二十五条 禁止携带宠物")]))
+
+    def model(state):
+        return {"messages": [AIMessage(content="", tool_calls=[{"name": "lookup", "args": {}, "id": "c1"}])]}
+
+    async def answer(state):
+        return {"messages": [await llm.ainvoke(state["messages"])]}
+
+    async def tools(state):
+        call = state["messages"][-1].tool_calls[0]
+        return {"messages": [await lookup.ainvoke({**call, "type": "tool_call"})]}
+
+    inner = StateGraph(MessagesState)
+    inner.add_node("model", model)
+    inner.add_node("tools", tools)
+    inner.add_node("answer", answer)
+    inner.add_edge(START, "model")
+    inner.add_edge("model", "tools")
+    inner.add_edge("tools", "answer")
+    inner.add_edge("answer", END)
+    react = inner.compile()
+
+    async def judge_agent(state):
+        result = await react.ainvoke({"messages": state["messages"]})
+        return {"messages": [result["messages"][-1]]}
+
+    async def responder_agent(state):
+        await stream_bypass("不可以携带宠物")
+        return {}
+
+    outer = StateGraph(MessagesState)
+    outer.add_node("supervisor_node", lambda state: {})
+    outer.add_node("judge_agent", judge_agent)
+    outer.add_node("responder_agent", responder_agent)
+    outer.add_edge(START, "supervisor_node")
+    outer.add_edge("supervisor_node", "judge_agent")
+    outer.add_edge("judge_agent", "responder_agent")
+    outer.add_edge("responder_agent", END)
+    return outer.compile()
+
+
+async def collect(mode):
+    trace = tracing.RequestTrace("t")
+    events = [e async for e in graph_stream.stream_graph(
+        build_app(), {"messages": [HumanMessage(content="能带宠物吗")]}, {}, trace, mode)]
+    return events, trace
+
+
+@pytest.mark.asyncio
+async def test_light_mode_matches_events_mode():
+    events, _ = await collect("events")
+    light, trace = await collect("light")
+
+    assert light == events
+    steps = [d["title"] for t, d in light if t == "step"]
+    assert steps == ["总控调度中...", "总控调度中 完成", "正在查询规章制度...", "正在调用工具: lookup...",
+                     "工具 lookup 调用完成", "查询条文", "查询规章制度 完成"]
+    assert "".join(d["content"] for t, d in light if t == "message") == "不可以携带宠物"
+    assert "第二十五条" in "".join(d["content"] for t, d in light if t == "thought")
+    # tasks 流构建的节点 span
+    assert set(trace.summary()["nodes_ms"]) == {"supervisor_node", "judge_agent", "responder_agent"}
+    assert trace.marks.get("first_token") is not None
+
+
+@pytest.mark.asyncio
+async def test_unknown_mode_rejected():
+    with pytest.raises(ValueError):
+        await collect("verbose")
@@ -0,0 +1,42 @@
+import os
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import knowledge_domains
+import pytest
+from agents.judge_agent import policy_checker
+
+
+def test_classify_by_directory_then_filename():
+    root = os.path.join("data", "raw_docs")
+    assert knowledge_domains.classify(os.path.join(root, "staff", "说明.txt"), root) == "staff"
+    assert knowledge_domains.classify(os.path.join(root, "杭州市地铁乘车规则.txt"), root) == "regulation"
+    assert knowledge_domains.classify(os.path.join(root, "车站应急处置手册.txt"), root) == "operations"
+    assert knowledge_domains.classify(os.path.join(root, "其他.txt"), root) == "general"
+
+
+def test_filter_only_applies_to_collections_with_domain_field():
+    store = MagicMock()
+    store.fields = ["pk", "text", "vector", "domain"]
+    kwargs = knowledge_domains.search_kwargs(store, "policy_checker", k=2)
+    assert kwargs == {"k": 2, "expr": 'domain in ["regulation"]'}
+
+    # 旧集合 (未按领域重建) 不加过滤
+    store.fields = ["pk", "text", "vector"]
+    assert knowledge_domains.search_kwargs(store, "policy_checker", k=2) == {"k": 2}
+
+
+@pytest.mark.asyncio
+@patch("utils.get_vector_store")
+async def test_policy_checker_searches_regulation_partition(mock_get_store):
+    store = MagicMock()
+    store.fields = ["pk", "text", "vector", "domain"]
+    retriever = AsyncMock()
+    doc = MagicMock()
+    doc.page_content = "第二十一条 乘客不得在车厢内饮食。"
+    retriever.ainvoke.return_value = [doc]
+    store.as_retriever.return_value = retriever
+    mock_get_store.return_value = store
+
+    result = await policy_checker.ainvoke({"query": "车厢内能吃东西吗"})
+    assert "饮食" in result
+    assert store.as_retriever.call_args.kwargs["search_kwargs"]["expr"] == 'domain in ["regulation"]'
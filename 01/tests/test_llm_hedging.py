@@ -0,0 +1,153 @@
+import asyncio
+from typing import Any, List
+
+import llm_hedging
+import metrics
+import pytest
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+
+class DelayedModel(BaseChatModel):
+    """第 i 次调用在 delays[i] 秒后开始输出；记录被取消的调用与收到的参数"""
+
+    delays: List[float]
+    calls: int = 0
+    cancelled: List[int] = []
+    kwargs_seen: List[dict] = []
+
+    @property
+    def _llm_type(self) -> str:
+        return "delayed"
+
+    def bind_tools(self, tools, **kwargs):
+        return self.bind(tools=[t.__name__ for t in tools], **kwargs)
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        raise NotImplementedError
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs: Any):
+        call = self.calls
+        self.calls += 1
+        try:
+            await asyncio.sleep(self.delays[call])
+        except asyncio.CancelledError:
+            self.cancelled.append(call)
+            raise
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=f"回复{call}"))])
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs: Any):
+        call = self.calls
+        self.calls += 1
+        self.kwargs_seen.append(kwargs)
+        try:
+            await asyncio.sleep(self.delays[call])
+            for piece in ("不可以", "携带"):
+                yield ChatGenerationChunk(message=AIMessageChunk(content=piece))
+        except (asyncio.CancelledError, GeneratorExit):
+            self.cancelled.append(call)
+            raise
+
+
+@pytest.fixture(autouse=True)
+def hedge_config(monkeypatch):
+    metrics.reset()
+    llm_hedging.reset()
+    monkeypatch.setattr(llm_hedging, "LLM_HEDGE_DEFAULT_DELAY_MS", 50)
+    monkeypatch.setattr(llm_hedging, "LLM_HEDGE_BUDGET", 1.0)
+    yield
+    metrics.reset()
+    llm_hedging.reset()
+
+
+def _counter(event):
+    return metrics.get_counter("llm_hedge", node="responder_agent", event=event)
+
+
+@pytest.mark.asyncio
+async def test_slow_stream_is_hedged_and_loser_cancelled():
+    inner = DelayedModel(delays=[1.0, 0.0], cancelled=[], kwargs_seen=[])
+    model = llm_hedging.HedgedChatModel(inner=inner, node="responder_agent")
+
+    chunks = [c.content async for c in model.astream([HumanMessage(content="能带宠物吗")])]
+    assert "".join(chunks) == "不可以携带"
+    await asyncio.sleep(0.01)
+    assert inner.calls == 2 and inner.cancelled == [0]
+    assert _counter("fired") == 1 and _counter("won") == 1
+    # 延迟样本记录主请求已等待的时间，而不是胜出的对冲请求的耗时
+    samples = metrics.get_samples("llm_hedge_latency_ms", node="responder_agent", phase=llm_hedging.FIRST_TOKEN)
+    assert len(samples) == 1 and samples[0] >= 50
+
+
+@pytest.mark.asyncio
+async def test_fast_response_is_not_hedged():
+    inner = DelayedModel(delays=[0.0], cancelled=[], kwargs_seen=[])
+    model = llm_hedging.HedgedChatModel(inner=inner, node="responder_agent")
+
+    assert (await model.ainvoke("你好")).content == "回复0"
+    assert inner.calls == 1 and _counter("fired") == 0
+
+
+@pytest.mark.asyncio
+async def test_non_streaming_hedge_and_budget(monkeypatch):
+    inner = DelayedModel(delays=[1.0, 0.0], cancelled=[], kwargs_seen=[])
+    model = llm_hedging.HedgedChatModel(inner=inner, node="responder_agent")
+    assert (await model.ainvoke("你好")).content == "回复1"
+
+    # 超出预算后不再对冲，等待主请求
+    monkeypatch.setattr(llm_hedging, "LLM_HEDGE_BUDGET", 0.0)
+    inner = DelayedModel(delays=[0.1], cancelled=[], kwargs_seen=[])
+    model = llm_hedging.HedgedChatModel(inner=inner, node="responder_agent")
+    assert (await model.ainvoke("你好")).content == "回复0"
+    assert inner.calls == 1 and _counter("over_budget") == 1
+
+
+@pytest.mark.asyncio
+async def test_bound_tools_reach_inner_model():
+    inner = DelayedModel(delays=[0.0], cancelled=[], kwargs_seen=[])
+    model = llm_hedging.HedgedChatModel(inner=inner, node="supervisor_node")
+
+    def PlanningResponse():
+        pass
+
+    planner = model.bind_tools([PlanningResponse], tool_choice="PlanningResponse")
+    async for _ in planner.astream("规划"):
+        pass
+    assert inner.kwargs_seen[0]["tools"] == ["PlanningResponse"]
+    assert inner.kwargs_seen[0]["tool_choice"] == "PlanningResponse"
+
+
+def test_delay_follows_latency_percentile(monkeypatch):
+    monkeypatch.setattr(llm_hedging, "LLM_HEDGE_MIN_SAMPLES", 10)
+    assert llm_hedging.hedge_delay_ms("judge_agent", llm_hedging.FIRST_TOKEN) == 50
+    for ms in range(100, 1100, 10):
+        metrics.observe("llm_hedge_latency_ms", ms, node="judge_agent", phase=llm_hedging.FIRST_TOKEN)
+    assert 1030 <= llm_hedging.hedge_delay_ms("judge_agent", llm_hedging.FIRST_TOKEN) <= 1050
+
+
+def test_wrap_is_opt_in(monkeypatch):
+    base = DelayedModel(delays=[], cancelled=[], kwargs_seen=[])
+    monkeypatch.setattr(llm_hedging, "LLM_HEDGE_NODES", {"responder_agent"})
+    assert llm_hedging.wrap(base, "supervisor_node") is base
+    assert isinstance(llm_hedging.wrap(base, "responder_agent"), llm_hedging.HedgedChatModel)
+
+
+def test_budget_does_not_accumulate_over_quiet_periods(monkeypatch):
+    monkeypatch.setattr(llm_hedging, "LLM_HEDGE_BUDGET", 0.1)
+    monkeypatch.setattr(llm_hedging, "LLM_HEDGE_BUDGET_WINDOW_S", 60)
+    now = [1000.0]
+    monkeypatch.setattr(llm_hedging.time, "monotonic", lambda: now[0])
+    # 很久以前的 1000 次调用都没有对冲；按累计计数会留下 100 次对冲额度
+    for _ in range(1000):
+        llm_hedging.record("judge_agent", "call")
+    now[0] += 3600
+
+    # 下游整体变慢：每次调用都想对冲，但窗口内的对冲数不超过近期调用数的 10%
+    fired = 0
+    for _ in range(50):
+        llm_hedging.record("judge_agent", "call")
+        if llm_hedging.within_budget("judge_agent"):
+            llm_hedging.record("judge_agent", "fired")
+            fired += 1
+    assert fired <= 5
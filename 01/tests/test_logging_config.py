@@ -0,0 +1,46 @@
+import json
+import logging
+import os
+import queue
+
+from logging_config import DroppingQueueHandler, JsonFormatter, SamplingFilter, log_path
+
+
+def make_record(level=logging.INFO, msg="任务完成", **extra):
+    record = logging.LogRecord("MetroAgent", level, __file__, 1, msg, None, None)
+    for key, value in extra.items():
+        setattr(record, key, value)
+    return record
+
+
+def test_json_formatter_expands_payload_and_extras():
+    line = JsonFormatter().format(make_record(task_id="t1"))
+    doc = json.loads(line)
+    assert doc["msg"] == "任务完成" and doc["task_id"] == "t1" and doc["level"] == "INFO"
+
+    doc = json.loads(JsonFormatter().format(make_record(payload={"type": "request_trace", "total_ms": 12.5})))
+    assert doc["type"] == "request_trace" and "msg" not in doc
+
+
+def test_sampling_filter():
+    sampler = SamplingFilter(debug_rate=0.0)
+    assert not sampler.filter(make_record(logging.DEBUG))
+    assert sampler.filter(make_record(logging.INFO))
+    assert not sampler.filter(make_record(logging.INFO, sample_rate=0.0))
+    # 告警及以上从不采样
+    assert sampler.filter(make_record(logging.ERROR, sample_rate=0.0))
+
+
+def test_full_queue_drops_instead_of_blocking():
+    handler = DroppingQueueHandler(queue.Queue(maxsize=1))
+    handler.handle(make_record())
+    handler.handle(make_record())
+    assert handler.queue.qsize() == 1
+
+
+def test_log_path_is_per_process_with_multiple_workers():
+    pid = os.getpid()
+    assert log_path("agent_system.log", 1) == "agent_system.log"
+    assert log_path("agent_system.log", 4) == f"agent_system-{pid}.log"
+    assert log_path("logs/app-{pid}.log", 4) == f"logs/app-{pid}.log"
+    assert log_path("logs/app", 2) == f"logs/app-{pid}"
@@ -0,0 +1,69 @@
+import llm_hedging
+import metrics
+import model_registry
+import pytest
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage
+from model_registry import ModelRegistry, RoleMetrics
+
+
+def test_nodes_map_to_roles():
+    assert model_registry.role_of("supervisor_node") == "supervisor"
+    assert model_registry.role_of("responder_agent") == "responder"
+    assert model_registry.role_of("title") == "title"
+    assert model_registry.role_of("judge_agent") == "workers"
+    assert model_registry.role_of(None) == model_registry.DEFAULT_ROLE
+
+
+def test_role_config_precedence(monkeypatch):
+    monkeypatch.setenv("LLM_MODEL", "deepseek-chat")
+    monkeypatch.setenv("LLM_TIMEOUT", "30")
+    monkeypatch.setenv("LLM_SUPERVISOR_MODEL", "qwen-turbo")
+    monkeypatch.setenv("LLM_SUPERVISOR_BASE_URL", "https://dashscope.example/v1")
+    monkeypatch.setenv("LLM_RESPONDER_TEMPERATURE", "0.3")
+
+    supervisor = model_registry.role_config("supervisor")
+    assert supervisor["model"] == "qwen-turbo" and supervisor["base_url"] == "https://dashscope.example/v1"
+    assert supervisor["timeout"] == 30 and supervisor["max_tokens"] is None
+
+    responder = model_registry.role_config("responder")
+    assert responder["model"] == "deepseek-chat" and responder["temperature"] == 0.3
+    assert responder["base_url"] == "https://api.test.com"
+
+    # 角色自身的默认值优先于全局配置，环境变量再覆盖角色默认值
+    title = model_registry.role_config("title")
+    assert title["max_tokens"] == 32 and title["timeout"] == 15
+    monkeypatch.setenv("LLM_TITLE_TIMEOUT", "5")
+    assert model_registry.role_config("title")["timeout"] == 5
+
+
+def test_registry_builds_one_model_per_role(monkeypatch):
+    monkeypatch.setenv("LLM_TITLE_MODEL", "deepseek-lite")
+    monkeypatch.setattr(llm_hedging, "LLM_HEDGE_NODES", {"responder_agent"})
+    registry = ModelRegistry()
+
+    title = registry.for_node("title")
+    assert title.model_name == "deepseek-lite" and title.max_tokens == 32
+    assert registry.for_node("judge_agent") is registry.for_node("ticket_agent") is registry.for_role("workers")
+
+    responder = registry.for_node("responder_agent")
+    assert isinstance(responder, llm_hedging.HedgedChatModel)
+    assert responder.inner is registry.for_role("responder")
+    # 对冲包装沿用角色统计回调
+    assert responder.callbacks == registry.for_role("responder").callbacks
+
+
+@pytest.mark.asyncio
+async def test_role_metrics_record_latency_and_tokens():
+    metrics.reset()
+    reply = AIMessage(content="地铁票务咨询", usage_metadata={"input_tokens": 40, "output_tokens": 6,
+                                                          "total_tokens": 46})
+    model = GenericFakeChatModel(messages=iter([reply]), callbacks=[RoleMetrics("title")])
+
+    await model.ainvoke("生成标题")
+    assert metrics.get_counter("llm_calls", role="title") == 1
+    assert metrics.get_counter("llm_tokens", role="title", kind="input") == 40
+    assert metrics.get_counter("llm_tokens", role="title", kind="output") == 6
+    assert len(metrics.get_samples("llm_latency_ms", role="title")) == 1
+    assert ModelRegistry().stats()["title"]["calls"] == 1
+    metrics.reset()
@@ -0,0 +1,80 @@
+import asyncio
+
+import metrics
+import pytest
+from agents.react_engine import ReactEngine
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.tools import tool
+
+
+class ScriptedLLM:
+    """假模型：绑定工具后每次都要求调用工具，未绑定时直接回答"""
+
+    def __init__(self, tool_calls_per_turn, parent=None):
+        self.tool_calls_per_turn = tool_calls_per_turn
+        self.parent = parent
+        self.calls = 0
+
+    def bind_tools(self, tools):
+        return ScriptedLLM(self.tool_calls_per_turn, parent=self)
+
+    async def ainvoke(self, messages):
+        counter = self.parent or self
+        counter.calls += 1
+        tool_calls = self.tool_calls_per_turn if self.parent else []
+        return AIMessage(content=f"第{counter.calls}次回答", tool_calls=tool_calls)
+
+
+@tool
+async def slow_lookup(query: str) -> str:
+    """慢查询"""
+    await asyncio.sleep(0.3)
+    return f"慢结果 {query}"
+
+
+@tool
+async def fast_lookup(query: str) -> str:
+    """快查询"""
+    return f"快结果 {query}"
+
+
+@pytest.mark.asyncio
+async def test_step_budget_forces_final_answer():
+    calls = [{"name": "fast_lookup", "args": {"query": "余额"}, "id": "c1"}]
+    llm = ScriptedLLM(calls)
+    engine = ReactEngine("test_agent", [fast_lookup], max_steps=2, llm=llm)
+
+    result = await engine.ainvoke({"messages": [HumanMessage(content="查一下")]})
+
+    # 2 次带工具调用 + 1 次强制收尾
+    assert llm.calls == 3
+    assert result["steps"] == 2
+    # 收尾时撤回了悬空的工具调用消息，历史中每个 tool_call 都有对应 ToolMessage
+    ai_with_calls = [m for m in result["messages"] if isinstance(m, AIMessage) and m.tool_calls]
+    assert len(ai_with_calls) == 1
+    assert metrics.get_counter("react_budget_exhausted", agent="test_agent") >= 1
+
+
+@pytest.mark.asyncio
+async def test_caller_config_cannot_lower_recursion_limit():
+    calls = [{"name": "fast_lookup", "args": {"query": "余额"}, "id": "c1"}]
+    engine = ReactEngine("test_agent", [fast_lookup], max_steps=3, llm=ScriptedLLM(calls))
+
+    # 父图的配置 (recursion_limit 远小于步数预算所需) 不会让 ReAct 循环提前报错
+    config = {"recursion_limit": 3, "run_name": "ticket_agent", "tags": ["worker"]}
+    result = await engine.ainvoke({"messages": [HumanMessage(content="查一下")]}, config=config)
+    assert result["steps"] == 3
+
+
+@pytest.mark.asyncio
+async def test_tools_run_concurrently_with_timeout():
+    calls = [
+        {"name": "slow_lookup", "args": {"query": "a"}, "id": "c1"},
+        {"name": "fast_lookup", "args": {"query": "b"}, "id": "c2"},
+    ]
+    engine = ReactEngine("test_agent", [slow_lookup, fast_lookup], max_steps=1,
+                         tool_timeouts={"slow_lookup": 0.05}, llm=ScriptedLLM(calls))
+    tool_messages = (await engine._call_tools({"messages": [AIMessage(content="", tool_calls=calls)]}))["messages"]
+
+    assert "超时" in tool_messages[0].content
+    assert tool_messages[1].content == "快结果 b"
@@ -0,0 +1,113 @@
+import json
+
+import pytest
+import regulation_splitter
+from agents.judge_agent import policy_checker
+from regulation_splitter import ArticleIndex, build_article_index, cn_to_int, find_references, split_regulation
+
+SAMPLE = """杭州市地铁乘车规则
+
+第一章　总则
+第一条　为了规范城市轨道交通乘车行为，制定本规则。
+第二条　本规则适用于本市城市轨道交通的乘客。
+第二章　乘车规定
+第二十条　乘客应当遵守乘车秩序。
+有下列情形之一的，不得进站乘车：
+（一）醉酒者；
+（二）精神病患者。
+第二十一条　乘客不得在车厢内饮食，婴儿、病人除外。
+"""
+
+
+def test_cn_to_int():
+    assert [cn_to_int(s) for s in ("十", "二十", "二十三", "一百零五", "两百", "42")] == [10, 20, 23, 105, 200, 42]
+
+
+def test_one_chunk_per_article_with_hierarchy():
+    docs = split_regulation(SAMPLE, {"source_filename": "rules.txt"})
+    # 标题单独一个切片，其余每条一个
+    assert [d.metadata["article_no"] for d in docs] == [0, 1, 2, 20, 21]
+    article = docs[3]
+    assert article.metadata["chapter"] == "第二章　乘车规定"
+    assert article.metadata["article"] == "第二十条"
+    assert "（二）精神病患者" in article.page_content and "饮食" not in article.page_content
+    # 所有切片的元数据字段一致
+    assert len({tuple(sorted(d.metadata)) for d in docs}) == 1
+
+
+def test_long_article_is_split_by_clause(monkeypatch):
+    monkeypatch.setattr(regulation_splitter, "MAX_ARTICLE_CHARS", 30)
+    docs = split_regulation(SAMPLE)
+    parts = [d for d in docs if d.metadata["article_no"] == 20]
+    assert len(parts) > 1
+    assert parts[1].page_content.startswith("第二十条（续）")
+    # 直查表中拼回完整条文
+    entry = build_article_index(docs)["20"][0]
+    assert "醉酒者" in entry["text"] and "精神病患者" in entry["text"]
+
+
+def test_find_references():
+    assert find_references("第二十条和第 21 条说了什么？第二十条") == [20, 21]
+    assert find_references("车厢内可以吃东西吗") == []
+
+
+def _install_index(tmp_path, monkeypatch, *sources):
+    docs = [doc for source, text in sources for doc in split_regulation(text, {"source_filename": source})]
+    path = tmp_path / "article_index.json"
+    path.write_text(json.dumps({"articles": build_article_index(docs)}), encoding="utf-8")
+    monkeypatch.setattr(regulation_splitter, "article_index", ArticleIndex(str(path)))
+
+
+OTHER = """杭州市轨道交通运营管理办法
+第一条　为了加强城市轨道交通运营管理，制定本办法。
+第二条　本办法适用于本市轨道交通的运营。
+第二十一条　运营单位应当定期检查设施设备。
+"""
+
+
+@pytest.mark.asyncio
+async def test_policy_checker_answers_article_reference_from_index(tmp_path, monkeypatch):
+    _install_index(tmp_path, monkeypatch, ("杭州市地铁乘车规则.txt", SAMPLE))
+    monkeypatch.setattr("utils.get_vector_store", lambda: None)
+
+    # 向量库不可用时仍能从直查表回答
+    result = await policy_checker.ainvoke({"query": "第二十一条说了什么"})
+    assert "不得在车厢内饮食" in result and "第二章" in result
+    assert "《杭州市地铁乘车规则》" in result
+
+
+def test_article_lookup_filters_by_named_regulation(tmp_path, monkeypatch):
+    _install_index(tmp_path, monkeypatch, ("杭州市地铁乘车规则.txt", SAMPLE), ("杭州市轨道交通运营管理办法.txt", OTHER))
+    index = regulation_splitter.article_index
+
+    assert {e["source"] for e in index.find("第二十一条说了什么")} == {"杭州市地铁乘车规则.txt",
+                                                                    "杭州市轨道交通运营管理办法.txt"}
+    assert [e["source"] for e in index.find("杭州市轨道交通运营管理办法第二十一条")] == ["杭州市轨道交通运营管理办法.txt"]
+    assert [e["source"] for e in index.find("《乘车规则》第 21 条")] == ["杭州市地铁乘车规则.txt"]
+
+
+@pytest.mark.asyncio
+async def test_policy_checker_labels_sources_and_still_searches_rest_of_question(tmp_path, monkeypatch):
+    from langchain_core.documents import Document
+    from unittest.mock import AsyncMock, MagicMock
+
+    _install_index(tmp_path, monkeypatch, ("杭州市地铁乘车规则.txt", SAMPLE), ("杭州市轨道交通运营管理办法.txt", OTHER))
+    store = MagicMock()
+    store.fields = ["pk", "text", "vector"]
+    retriever = AsyncMock()
+    retriever.ainvoke.return_value = [
+        # 与直查结果重复的条文不再出现
+        Document(page_content="第二十一条　乘客不得在车厢内饮食", metadata={"source_filename": "杭州市地铁乘车规则.txt",
+                                                                   "article": "第二十一条"}),
+        Document(page_content="第三十条　携带折叠自行车应当折叠后进站", metadata={"source_filename": "杭州市地铁乘车规则.txt",
+                                                                     "article": "第三十条"}),
+    ]
+    store.as_retriever.return_value = retriever
+    monkeypatch.setattr("utils.get_vector_store", lambda: store)
+
+    query = "第二十一条说了什么？另外折叠自行车能进站吗"
+    result = await policy_checker.ainvoke({"query": query})
+    assert "《杭州市地铁乘车规则》" in result and "《杭州市轨道交通运营管理办法》" in result
+    assert "折叠自行车" in result
+    assert result.count("不得在车厢内饮食") == 1
+    assert retriever.ainvoke.call_args.args[0] == query
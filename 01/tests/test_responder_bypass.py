@@ -0,0 +1,28 @@
+from agents.responder_agent import bypass_decision, user_answer
+
+
+def _task(result, task_type="general_chat", status="done"):
+    return {"id": "t1", "task_type": task_type, "status": status, "result": result}
+
+
+def test_single_clean_result_bypasses():
+    assert bypass_decision([_task("您的卡内余额为 35.50 元。")]) == (True, "single_task")
+
+
+def test_multi_task_and_failed_results_are_synthesized():
+    assert bypass_decision([_task("a"), _task("b")])[1] == "multi_task"
+    assert bypass_decision([_task("系统错误：知识库检索失败")])[1] == "failed_task"
+    assert bypass_decision([_task(None, status="pending")])[1] == "failed_task"
+    assert bypass_decision([_task("Title: 分析\nContent: ...")])[1] == "not_user_ready"
+
+
+def test_worker_final_answer_section_bypasses():
+    result = (
+        "Title: 分析票务需求\nContent: 用户想查询卡内余额，需要调用 `query_ticket_balance`。\n\n"
+        "Title: 整理交易详情\nContent: 工具返回余额 35.50 元，最近一次充值为 2 月 3 日。\n"
+        "Answer: 您的交通卡 A1234567 当前余额为 35.50 元，最近一次充值时间为 2026-02-03。"
+    )
+    assert bypass_decision([_task(result, task_type="ticket_agent")]) == (True, "single_task")
+    assert user_answer(result) == "您的交通卡 A1234567 当前余额为 35.50 元，最近一次充值时间为 2026-02-03。"
+    # 只有思考块、没有最终答复段落时仍交给 LLM 汇总
+    assert bypass_decision([_task(result.rpartition("Answer:")[0])])[1] == "not_user_ready"
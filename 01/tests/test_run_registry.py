@@ -0,0 +1,142 @@
+import asyncio
+
+import pytest
+import run_registry
+from run_registry import Run, RunRegistry
+
+
+def make_source(count: int, started: list, delay: float = 0.01):
+    async def source(run):
+        started.append(run.run_id)
+        for i in range(count):
+            await asyncio.sleep(delay)
+            yield f"event: message\ndata: {i}\n\n"
+    return source
+
+
+@pytest.mark.asyncio
+async def test_reconnect_replays_missed_events_and_follows_live_run():
+    registry = RunRegistry()
+    run, created = registry.start("t1", make_source(6, []))
+    assert created
+
+    # 第一个连接读到 seq=2 后断开
+    first = []
+    async for seq, payload in run.follow():
+        first.append(seq)
+        if seq == 2:
+            break
+
+    # 重连：从 seq=3 开始回放，并继续跟随到运行结束
+    resumed = [seq async for seq, _ in run.follow(after=2)]
+    assert first == [1, 2]
+    assert resumed == [3, 4, 5, 6]
+    assert run.done
+
+
+@pytest.mark.asyncio
+async def test_idempotency_key_runs_graph_once():
+    registry = RunRegistry()
+    started = []
+    run_a, created_a = registry.start("t1", make_source(3, started), idempotency_key="k1")
+    run_b, created_b = registry.start("t1", make_source(3, started), idempotency_key="k1")
+    await run_a.task
+    assert run_a is run_b and created_a and not created_b
+    assert started == [run_a.run_id]
+    # 不同会话的同名幂等键互不影响
+    _, created_c = registry.start("t2", make_source(1, started), idempotency_key="k1")
+    assert created_c
+
+
+@pytest.mark.asyncio
+async def test_bounded_log_reports_replay_gap():
+    run = Run("t1", max_events=3)
+    for i in range(5):
+        run.append(f"event: message\ndata: {i}\n\n")
+    run.finish()
+
+    items = [item async for item in run.follow(after=0)]
+    assert items[0][0] is None and "replay_gap" in items[0][1]
+    assert [seq for seq, _ in items[1:]] == [3, 4, 5]
+
+
+@pytest.mark.asyncio
+async def test_sse_stream_tags_events_with_run_and_seq():
+    registry = RunRegistry()
+    run, _ = registry.start("t1", make_source(2, []))
+    chunks = [chunk async for chunk in run_registry.sse_stream(run)]
+    assert chunks[0].startswith("event: run\n")
+    assert chunks[1].startswith(f"id: {run.run_id}:1\n")
+    assert run_registry.parse_last_event_id(f"{run.run_id}:2") == (run.run_id, 2)
+    assert run_registry.parse_last_event_id("garbage") is None
+
+
+@pytest.mark.asyncio
+async def test_finished_runs_are_evicted():
+    registry = RunRegistry(ttl_s=0, max_runs=10)
+    run, _ = registry.start("t1", make_source(1, []), idempotency_key="k")
+    await run.task
+    registry.start("t2", make_source(1, []))
+    assert registry.get(run.run_id) is None
+    assert registry.find("t1", "k") is None
+
+
+class FakeClaimsConn:
+    """模拟 run_claims 表的主键唯一约束 (多个 worker 共享同一张表)"""
+
+    def __init__(self):
+        self.rows = {}
+        self.result = None
+
+    def cursor(self):
+        return self
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def execute(self, sql, params):
+        if sql.startswith("INSERT"):
+            thread_id, key, run_id, worker, _ttl = params
+            if (thread_id, key) in self.rows:
+                self.result = None
+            else:
+                self.rows[(thread_id, key)] = [run_id, worker, False]
+                self.result = tuple(self.rows[(thread_id, key)])
+        elif sql.startswith("SELECT run_id"):
+            self.result = tuple(self.rows.get(params, ())) or None
+        elif sql.startswith("SELECT worker"):
+            row = next((r for r in self.rows.values() if r[0] == params[0]), None)
+            self.result = (row[1], row[2]) if row else None
+        elif sql.startswith("UPDATE"):
+            for row in self.rows.values():
+                if row[0] == params[0]:
+                    row[2] = True
+
+    async def fetchone(self):
+        return self.result
+
+
+@pytest.mark.asyncio
+async def test_idempotency_claim_is_shared_across_workers():
+    conn = FakeClaimsConn()
+    # 首次提交认领成功，由当前 worker 执行
+    assert (await run_registry.claim(conn, "t1", "k1", "run-a"))[0] == "run-a"
+    # 重试落到另一个 worker：拿到先到请求的 run_id，不会再次执行
+    run_id, worker, done = await run_registry.claim(conn, "t1", "k1", "run-b")
+    assert run_id == "run-a" and worker == run_registry.WORKER_ID and not done
+    assert (await run_registry.claim(conn, "t2", "k1", "run-c"))[0] == "run-c"
+
+    await run_registry.mark_done(conn, "run-a")
+    assert await run_registry.lookup(conn, "run-a") == (run_registry.WORKER_ID, True)
+    assert await run_registry.lookup(conn, "missing") is None
+
+
+@pytest.mark.asyncio
+async def test_claimed_run_id_is_used_for_the_local_run():
+    registry = RunRegistry()
+    run, created = registry.start("t1", make_source(1, []), idempotency_key="k1", run_id="run-a")
+    await run.task
+    assert created and run.run_id == "run-a" and registry.get("run-a") is run
@@ -0,0 +1,52 @@
+import asyncio
+import time
+
+import pytest
+import startup
+
+
+@pytest.fixture(autouse=True)
+def reset_startup():
+    startup.reset()
+    yield
+    startup.reset()
+
+
+@pytest.mark.asyncio
+async def test_warm_up_runs_components_in_parallel():
+    def slow_sync():
+        time.sleep(0.2)
+
+    async def slow_async():
+        await asyncio.sleep(0.2)
+
+    def broken():
+        raise ConnectionError("milvus down")
+
+    startup.mark_db_ready()
+    assert not startup.readiness()["ready"]
+
+    start = time.perf_counter()
+    await startup.warm_up({"embeddings": slow_sync, "llm": slow_async,
+                           "vector_store": broken, "prompts": lambda: False})
+    assert time.perf_counter() - start < 0.35
+
+    report = startup.readiness()
+    # 非必需组件失败只降级，不影响就绪
+    assert report["ready"]
+    assert report["components"]["embeddings"]["status"] == "ready"
+    assert report["components"]["vector_store"]["status"] == "failed"
+    assert report["components"]["prompts"]["status"] == "failed"
+    assert report["timings_ms"]["warmup"]["llm"] >= 150
+
+
+@pytest.mark.asyncio
+async def test_required_component_blocks_readiness(monkeypatch):
+    monkeypatch.setattr(startup, "READY_REQUIRES", ["vector_store"])
+    startup.mark_db_ready()
+
+    def broken():
+        raise ConnectionError("milvus down")
+
+    await startup.warm_up({"vector_store": broken})
+    assert not startup.readiness()["ready"]
@@ -0,0 +1,60 @@
+import state
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+from state import TaskRecord, board_tasks, complete_task, reduce_task_board, reduce_task_results, task_result
+
+
+def _planned(n):
+    return [{"id": f"t{i}", "task_type": "judge_agent", "description": f"任务 {i}", "input_content": "问题",
+             "status": "pending"} for i in range(n)]
+
+
+def test_merge_is_keyed_and_does_not_mutate_left():
+    board = reduce_task_board({}, _planned(3))
+    assert list(board) == ["t0", "t1", "t2"]
+
+    update = complete_task(board["t1"].as_task(), "可以携带")
+    merged = reduce_task_board(board, update["task_board"])
+    assert merged["t1"].status == "done" and merged["t1"].result == "可以携带"
+    # 原看板可能正被检查点引用，合并不能原地修改
+    assert board["t1"].status == "pending"
+    assert merged["t0"] is board["t0"]
+    assert [t.id for t in board_tasks(merged)] == ["t0", "t1", "t2"]
+    assert reduce_task_board(merged, "RESET") == {}
+
+
+def test_long_results_are_stored_by_reference(monkeypatch):
+    monkeypatch.setattr(state, "TASK_RESULT_INLINE_CHARS", 10)
+    task = _planned(1)[0]
+    update = complete_task(task, "第二十五条 乘客不得携带宠物进站乘车")
+    record = update["task_board"][0]
+    assert record.result is None and record.result_ref
+    results = reduce_task_results({}, update["task_results"])
+    assert task_result(record, results) == "第二十五条 乘客不得携带宠物进站乘车"
+    assert task_result(complete_task(task, "短结果")["task_board"][0]) == "短结果"
+    assert reduce_task_results(results, "RESET") == {}
+
+
+def test_legacy_list_board_and_dict_updates():
+    legacy = [{"id": "a", "task_type": "general_chat", "input_content": "你好", "status": "pending"}]
+    merged = reduce_task_board(legacy, {"id": "a", "status": "done", "result": "你好！"})
+    assert merged == {"a": TaskRecord(id="a", task_type="general_chat", input_content="你好",
+                                      status="done", result="你好！")}
+    assert [t.status for t in board_tasks(legacy)] == ["pending"]
+
+
+def test_board_round_trips_through_checkpoint_serializer():
+    serde = JsonPlusSerializer()
+    board = reduce_task_board({}, _planned(2))
+    assert serde.loads_typed(serde.dumps_typed(board)) == board
+
+
+def test_planned_tasks_with_duplicate_ids_are_all_kept():
+    plan = [{"id": "1", "task_type": "ticket_agent", "description": "查余额", "input_content": "卡号 A1"},
+            {"id": "1", "task_type": "judge_agent", "description": "能否带宠物", "input_content": "宠物"}]
+    board = reduce_task_board({}, plan)
+    assert [t.task_type for t in board_tasks(board)] == ["ticket_agent", "judge_agent"]
+    assert len(set(board)) == 2 and board["1"].task_type == "ticket_agent"
+
+    # 已有看板上同 ID 的更新仍是合并
+    merged = reduce_task_board(board, {"id": "1", "status": "done", "result": "35.50 元"})
+    assert len(merged) == 2 and merged["1"].status == "done"
@@ -0,0 +1,66 @@
+import asyncio
+
+import pytest
+from tool_cache import ToolCallCache
+
+
+@pytest.mark.asyncio
+async def test_concurrent_identical_calls_are_coalesced():
+    cache = ToolCallCache("test_tool", ttl=60)
+    calls = 0
+
+    async def backend():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        return "余额 35.50 元"
+
+    results = await asyncio.gather(*(cache.call("A1", backend) for _ in range(5)))
+    assert results == ["余额 35.50 元"] * 5
+    assert calls == 1
+
+    # 之后的调用直接命中缓存
+    assert await cache.call("A1", backend) == "余额 35.50 元"
+    assert calls == 1
+    assert cache.stats()["coalesced"] == 4
+
+
+@pytest.mark.asyncio
+async def test_version_change_and_uncacheable_results():
+    version = {"v": 1}
+    cache = ToolCallCache("test_kb", ttl=None, version_fn=lambda: version["v"],
+                          cache_if=lambda r: "系统错误" not in r)
+    answers = iter(["系统错误：检索失败", "条文A", "条文B"])
+
+    async def backend():
+        return next(answers)
+
+    assert await cache.call("q", backend) == "系统错误：检索失败"
+    assert await cache.call("q", backend) == "条文A"
+    assert await cache.call("q", backend) == "条文A"
+    # 知识库重建后版本号变化，缓存失效
+    version["v"] = 2
+    assert await cache.call("q", backend) == "条文B"
+
+
+@pytest.mark.asyncio
+async def test_cancelled_leader_does_not_cancel_coalesced_followers():
+    cache = ToolCallCache("test_slow_tool", ttl=60)
+    calls = 0
+
+    async def backend():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.1)
+        return "第二十五条"
+
+    # 发起方因单工具超时被取消，合并进来的其他请求仍应拿到结果
+    leader = asyncio.ensure_future(asyncio.wait_for(cache.call("q", backend), timeout=0.02))
+    await asyncio.sleep(0)
+    follower = asyncio.ensure_future(cache.call("q", backend))
+    results = await asyncio.gather(leader, follower, return_exceptions=True)
+
+    assert isinstance(results[0], asyncio.TimeoutError)
+    assert results[1] == "第二十五条"
+    assert calls == 1
+    assert await cache.call("q", backend) == "第二十五条" and calls == 1
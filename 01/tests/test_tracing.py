@@ -0,0 +1,62 @@
+import asyncio
+
+import pytest
+import tracing
+from langchain_core.messages import AIMessage
+
+
+def event(kind, name, run_id, parents=(), node=None, output=None):
+    return {"event": kind, "name": name, "run_id": run_id, "parent_ids": list(parents),
+            "metadata": {"langgraph_node": node} if node else {}, "data": {"output": output}}
+
+
+def test_span_tree_from_events():
+    trace = tracing.RequestTrace("t1")
+    trace.on_event(event("on_chain_start", "LangGraph", "root"))
+    trace.on_event(event("on_chain_start", "general_chat", "n1", ["root"], node="general_chat"))
+    trace.on_event(event("on_chat_model_start", "ChatOpenAI", "m1", ["root", "n1"], node="general_chat"))
+    trace.on_event(event("on_chat_model_stream", "ChatOpenAI", "m1", ["root", "n1"]))
+    output = AIMessage(content="ok", usage_metadata={"input_tokens": 10, "output_tokens": 2, "total_tokens": 12})
+    trace.on_event(event("on_chat_model_end", "ChatOpenAI", "m1", ["root", "n1"], output=output))
+    trace.on_event(event("on_tool_start", "search_knowledge", "t1", ["root", "n1"]))
+    trace.on_event(event("on_tool_end", "search_knowledge", "t1", ["root", "n1"]))
+    trace.on_event(event("on_chain_start", "workflow_router", "r1", ["root"], node="supervisor_node"))
+    trace.on_event(event("on_chain_end", "general_chat", "n1", ["root"], node="general_chat"))
+    with trace.span("final_state", "db"):
+        pass
+
+    summary = trace.summary()
+    assert set(summary["nodes_ms"]) == {"general_chat"}
+    assert set(summary["kinds_ms"]) == {"llm", "tool", "db"}
+    assert summary["llm_calls"] == 1 and summary["tool_calls"] == 1
+
+    tree = trace.tree()
+    node = next(s for s in tree if s["name"] == "general_chat")
+    llm = node["children"][0]
+    assert llm["kind"] == "llm" and llm["input_tokens"] == 10 and "first_token_ms" in llm
+    assert [c["name"] for c in node["children"]] == ["ChatOpenAI", "search_knowledge"]
+
+
+class FakeSaver:
+    async def aput(self, *args):
+        await asyncio.sleep(0.01)
+        return "ok"
+
+
+@pytest.mark.asyncio
+async def test_checkpointer_hook_uses_current_trace():
+    saver = tracing.instrument_checkpointer(FakeSaver())
+    # 没有当前 trace 时不记录
+    assert await saver.aput() == "ok"
+
+    trace = tracing.RequestTrace("t1")
+    token = tracing.current_trace.set(trace)
+    try:
+        await asyncio.create_task(saver.aput())
+        tracing.note("tool_cache", tool="search_knowledge", result="hit")
+    finally:
+        tracing.current_trace.reset(token)
+
+    assert [s["name"] for s in trace.spans.values()] == ["checkpoint.aput"]
+    assert trace.summary()["kinds_ms"]["db"] >= 5
+    assert trace.notes[0]["result"] == "hit"
@@ -0,0 +1,24 @@
+import numpy as np
+import vector_index
+
+
+def test_index_and_search_params_per_type(monkeypatch):
+    hnsw = vector_index.index_params("HNSW", overrides={"M": 32})
+    assert hnsw == {"metric_type": "L2", "index_type": "HNSW", "params": {"M": 32, "efConstruction": 200}}
+    # IVF 的 nlist 按数据量估算
+    assert vector_index.index_params("IVF_FLAT", overrides={}, num_vectors=10000)["params"] == {"nlist": 400}
+
+    monkeypatch.setattr(vector_index, "VECTOR_SEARCH_PARAMS", '{"ef": 128}')
+    assert vector_index.search_params("HNSW") == {"metric_type": "L2", "params": {"ef": 128}}
+
+
+def test_recall_against_exact_search():
+    rng = np.random.default_rng(0)
+    corpus = rng.normal(size=(200, 16)).astype(np.float32)
+    queries = corpus[:10] + 0.01
+    truth = vector_index.exact_top_k(corpus, queries, k=3)
+    assert truth[:, 0].tolist() == list(range(10))
+
+    assert vector_index.recall_at_k(truth.tolist(), truth, k=3) == 1.0
+    half = [[row[0], -1, -2] for row in truth.tolist()]
+    assert abs(vector_index.recall_at_k(half, truth, k=3) - 1 / 3) < 1e-9
@@ -0,0 +1,51 @@
+import pytest
+import worker_traces
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from state import reduce_worker_trace
+
+
+def _turns():
+    q1, a1 = HumanMessage(content="能带宠物吗", id="h1"), AIMessage(content="不可以", id="a1")
+    q2, a2 = HumanMessage(content="自行车呢", id="h2"), AIMessage(content="折叠自行车可以", id="a2")
+    return [q1, a1, q2, a2]
+
+
+def test_turn_key_is_last_human_message():
+    assert worker_traces.turn_key(_turns()) == "h2"
+    assert worker_traces.turn_key([AIMessage(content="你好")]) is None
+
+
+def test_merge_inserts_traces_after_their_turn():
+    trace = [AIMessage(content="Title: 查询条文", tool_calls=[{"name": "search", "args": {}, "id": "c1"}]),
+             ToolMessage(content="第二十五条", tool_call_id="c1")]
+    merged = worker_traces.merge(_turns(), {"h1": trace})
+    assert [m.id or m.content for m in merged] == ["h1", trace[0].content, "第二十五条", "a1", "h2", "a2"]
+    assert worker_traces.merge(_turns(), {}) == _turns()
+
+
+@pytest.mark.asyncio
+async def test_memory_backend_save_load_delete():
+    trace = [AIMessage(content="Title: 结论\nContent: 不可以")]
+    await worker_traces.save(None, "t-mem", "h1", trace)
+    assert await worker_traces.load(None, "t-mem") == {"h1": trace}
+    await worker_traces.delete(None, "t-mem")
+    assert await worker_traces.load(None, "t-mem") == {}
+
+
+@pytest.mark.asyncio
+async def test_memory_backend_evicts_least_recently_written_threads(monkeypatch):
+    monkeypatch.setattr(worker_traces, "_memory", type(worker_traces._memory)())
+    monkeypatch.setattr(worker_traces, "TRACE_MEMORY_MAX_THREADS", 2)
+    trace = [AIMessage(content="Title: 结论")]
+    for thread_id in ("t1", "t2", "t1", "t3"):
+        await worker_traces.save(None, thread_id, "h1", trace)
+    assert list(worker_traces._memory) == ["t1", "t3"]
+    assert await worker_traces.load(None, "t2") == {}
+
+
+def test_worker_trace_reducer_appends_and_resets():
+    a, b = AIMessage(content="a"), AIMessage(content="b")
+    left = [a]
+    assert reduce_worker_trace(left, [b]) == [a, b]
+    assert left == [a]
+    assert reduce_worker_trace([a, b], "RESET") == []
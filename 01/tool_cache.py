@@ -0,0 +1,151 @@
+'''
+Author: Yunpeng Shi
+Description: 工具调用中间件 - 相同参数的并发调用合并为一次执行 (single-flight)，结果按工具配置的 TTL 短期缓存
+'''
+import asyncio
+import functools
+import inspect
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import metrics
+import tracing
+
+TOOL_CACHE_ENABLED = os.getenv("TOOL_CACHE_ENABLED", "1") == "1"
+MAX_ENTRIES = int(os.getenv("TOOL_CACHE_MAX_ENTRIES", "1024"))
+
+
+class ToolCallCache:
+    """
+    单个工具的缓存：
+    - ttl 为 None 表示不过期，只在 version_fn 返回值变化时失效 (如知识库重建)
+    - cache_if 返回 False 的结果（如错误提示）不缓存，但仍会分享给合并的并发调用
+    """
+
+    def __init__(self, name: str, ttl: Optional[float], version_fn: Optional[Callable[[], Any]] = None,
+                 cache_if: Optional[Callable[[Any], bool]] = None, max_entries: int = MAX_ENTRIES):
+        self.name = name
+        self.ttl = ttl
+        self.version_fn = version_fn
+        self.cache_if = cache_if or (lambda value: True)
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    def _lookup(self, key: str, version: Any):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, entry_version, value = entry
+        if entry_version != version or (expires_at is not None and expires_at < time.monotonic()):
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _store(self, key: str, version: Any, value: Any):
+        expires_at = None if self.ttl is None else time.monotonic() + self.ttl
+        self._entries[key] = (expires_at, version, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def call(self, key: str, factory: Callable[[], Awaitable[Any]]) -> Any:
+        if not TOOL_CACHE_ENABLED or self.ttl == 0:
+            return await factory()
+
+        version = self.version_fn() if self.version_fn else None
+        entry = self._lookup(key, version)
+        if entry is not None:
+            metrics.incr("tool_cache", tool=self.name, result="hit")
+            tracing.note("tool_cache", tool=self.name, result="hit")
+            return entry[2]
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            metrics.incr("tool_cache", tool=self.name, result="coalesced")
+            tracing.note("tool_cache", tool=self.name, result="coalesced")
+            return await asyncio.shield(inflight)
+
+        metrics.incr("tool_cache", tool=self.name, result="miss")
+        tracing.note("tool_cache", tool=self.name, result="miss")
+        # 实际调用在独立的 task 中执行，所有等待方 (包括发起方) 都通过 shield 等待：
+        # 任何一个等待方被取消 (如 ReactEngine 的单工具超时) 都不会取消这次调用，其他合并方照常拿到结果
+        task = asyncio.ensure_future(self._run(key, version, factory))
+        task.add_done_callback(_consume_exception)
+        self._inflight[key] = task
+        return await asyncio.shield(task)
+
+    async def _run(self, key: str, version: Any, factory: Callable[[], Awaitable[Any]]) -> Any:
+        try:
+            value = await factory()
+            if self.cache_if(value):
+                self._store(key, version, value)
+            return value
+        finally:
+            self._inflight.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            result: metrics.get_counter("tool_cache", tool=self.name, result=result)
+            for result in ("hit", "coalesced", "miss")
+        } | {"entries": len(self._entries)}
+
+
+CACHES: Dict[str, ToolCallCache] = {}
+
+
+def _consume_exception(task: asyncio.Task):
+    """等待方都已取消时避免 "exception was never retrieved" 警告"""
+    if not task.cancelled():
+        task.exception()
+
+
+def _ttl_from_env(name: str, default: Optional[float]) -> Optional[float]:
+    """TOOL_CACHE_TTL_<TOOL_NAME> 可覆盖单个工具的 TTL (秒)"""
+    raw = os.getenv(f"TOOL_CACHE_TTL_{name.upper()}")
+    if raw is None:
+        return default
+    return float(raw)
+
+
+def cached_tool(name: str, ttl: Optional[float], version_fn: Optional[Callable[[], Any]] = None,
+                cache_if: Optional[Callable[[Any], bool]] = None):
+    """
+    工具函数装饰器，放在 @tool 之下使用。
+    同步函数会被包装为异步函数，在线程池中执行。
+    """
+    cache = ToolCallCache(name, _ttl_from_env(name, ttl), version_fn=version_fn, cache_if=cache_if)
+    CACHES[name] = cache
+
+    def decorator(fn):
+        signature = inspect.signature(fn)
+        is_async = inspect.iscoroutinefunction(fn)
+
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            key = json.dumps(bound.arguments, sort_keys=True, ensure_ascii=False, default=str)
+            if is_async:
+                return await cache.call(key, lambda: fn(*args, **kwargs))
+            return await cache.call(key, lambda: asyncio.to_thread(fn, *args, **kwargs))
+
+        return wrapper
+
+    return decorator
+
+
+def stats() -> Dict[str, Dict[str, float]]:
+    return {name: cache.stats() for name, cache in CACHES.items()}
+
+
+def clear_all():
+    for cache in CACHES.values():
+        cache.clear()
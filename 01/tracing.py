@@ -0,0 +1,229 @@
+'''
+Author: Yunpeng Shi
+Description: 单次请求的耗时追踪 - 由 astream_events 事件流 (轻量流式模式下为 tasks 流) 构建 span 树 (节点 / 模型调用 / 工具 / 检索)，
+             再加上检查点读写与工具缓存的钩子；请求结束时输出分项汇总 (SSE timing 事件) 与结构化 JSON 日志
+'''
+import json
+import logging
+import os
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+
+# 默认是否向前端推送 timing 事件 (请求体中的 timing 字段可覆盖)
+TRACE_SSE_DEFAULT = os.getenv("TRACE_SSE", "0") == "1"
+# 是否输出 span 树日志；只记录总耗时超过阈值的请求 (0 表示全部记录)
+TRACE_LOG = os.getenv("TRACE_LOG", "1") == "1"
+TRACE_LOG_SLOW_MS = float(os.getenv("TRACE_LOG_SLOW_MS", "0"))
+
+trace_logger = logging.getLogger("MetroAgent.trace")
+
+# 当前请求的 trace，图内部创建的子任务会自动继承
+current_trace: ContextVar[Optional["RequestTrace"]] = ContextVar("current_trace", default=None)
+
+# 事件类型 -> span 类别
+_EVENT_KINDS = {
+    "chat_model": "llm",
+    "tool": "tool",
+    "retriever": "retrieval",
+}
+# 不单独成 span 的链 (路由函数等)
+_SKIP_CHAINS = {"LangGraph", "workflow_router", "_route"}
+
+
+class RequestTrace:
+    def __init__(self, thread_id: str, request_id: Optional[str] = None):
+        self.thread_id = thread_id
+        self.request_id = request_id or uuid.uuid4().hex[:12]
+        self._t0 = time.perf_counter()
+        self.spans: Dict[str, dict] = {}
+        self.marks: Dict[str, float] = {}
+        self.notes: List[dict] = []
+        self.total_ms: Optional[float] = None
+
+    def now_ms(self) -> float:
+        return round((time.perf_counter() - self._t0) * 1000, 1)
+
+    # --- 通用 span ---
+    def start_span(self, span_id: str, name: str, kind: str, parent_id: Optional[str] = None, **attrs):
+        self.spans[span_id] = {"id": span_id, "name": name, "kind": kind, "parent": parent_id,
+                               "start_ms": self.now_ms(), "end_ms": None, **attrs}
+
+    def end_span(self, span_id: str, **attrs):
+        span = self.spans.get(span_id)
+        if span is not None and span["end_ms"] is None:
+            span["end_ms"] = self.now_ms()
+            span.update(attrs)
+
+    @contextmanager
+    def span(self, name: str, kind: str, **attrs):
+        span_id = uuid.uuid4().hex
+        self.start_span(span_id, name, kind, **attrs)
+        try:
+            yield
+        finally:
+            self.end_span(span_id)
+
+    def mark(self, name: str):
+        """记录一次性的时间点，如首个回复 token"""
+        self.marks.setdefault(name, self.now_ms())
+
+    def note(self, name: str, **attrs):
+        self.notes.append({"name": name, "at_ms": self.now_ms(), **attrs})
+
+    # --- 从 astream_events (v2) 构建 span ---
+    def _parent_of(self, event: dict) -> Optional[str]:
+        for parent_id in reversed(event.get("parent_ids") or []):
+            if parent_id in self.spans:
+                return parent_id
+        return None
+
+    def on_event(self, event: dict):
+        kind, _, phase = event["event"][3:].rpartition("_")
+        if phase not in ("start", "end", "stream"):
+            return
+        run_id = event.get("run_id")
+        name = event.get("name", "")
+
+        if kind == "chain":
+            node = (event.get("metadata") or {}).get("langgraph_node")
+            if name in _SKIP_CHAINS or (name != node and not name.endswith(".react")):
+                return
+            span_kind = "node" if name == node else "agent"
+        elif kind in _EVENT_KINDS:
+            span_kind = _EVENT_KINDS[kind]
+        else:
+            return
+
+        if phase == "start":
+            parent_id = self._parent_of(event)
+            # 只有主图的节点算 node，ReAct 子图内部的 model/tools 记为 step
+            if span_kind == "node" and parent_id is not None:
+                span_kind = "step"
+            attrs = {}
+            if span_kind == "llm":
+                attrs["node"] = (event.get("metadata") or {}).get("langgraph_node")
+            self.start_span(run_id, name, span_kind, parent_id, **attrs)
+        elif phase == "stream":
+            span = self.spans.get(run_id)
+            if span is not None and span["kind"] == "llm" and "first_token_ms" not in span:
+                span["first_token_ms"] = round(self.now_ms() - span["start_ms"], 1)
+        else:
+            attrs = {}
+            output = (event.get("data") or {}).get("output")
+            usage = getattr(output, "usage_metadata", None)
+            if usage:
+                attrs["input_tokens"] = usage.get("input_tokens")
+                attrs["output_tokens"] = usage.get("output_tokens")
+            self.end_span(run_id, **attrs)
+
+    # --- 从 astream 的 tasks 流构建 span (轻量流式模式，没有模型/工具粒度的回调事件) ---
+    def on_task(self, namespace: tuple, payload: dict):
+        if "result" in payload:
+            attrs = {"error": str(payload["error"])} if payload.get("error") else {}
+            self.end_span(payload["id"], **attrs)
+            return
+        # 命名空间形如 ("supervisor_node:<task_id>", ...)，最后一级即父任务
+        parent_id = namespace[-1].rpartition(":")[2] if namespace else None
+        self.start_span(payload["id"], payload["name"], "step" if namespace else "node",
+                        parent_id if parent_id in self.spans else None)
+
+    # --- 汇总 ---
+    def finish(self):
+        if self.total_ms is None:
+            self.total_ms = self.now_ms()
+            # 中途异常退出时，补齐未结束的 span
+            for span in self.spans.values():
+                if span["end_ms"] is None:
+                    span["end_ms"] = self.total_ms
+                    span["unfinished"] = True
+
+    @staticmethod
+    def _duration(span: dict) -> float:
+        return round((span["end_ms"] or 0) - span["start_ms"], 1)
+
+    def summary(self) -> Dict[str, Any]:
+        """前端 timing 事件：按节点与类别汇总耗时 (同类并发 span 的耗时会叠加)"""
+        self.finish()
+        by_kind: Dict[str, float] = {}
+        nodes: Dict[str, float] = {}
+        for span in self.spans.values():
+            duration = self._duration(span)
+            if span["kind"] == "node":
+                nodes[span["name"]] = round(nodes.get(span["name"], 0) + duration, 1)
+            elif span["kind"] not in ("step", "agent"):
+                by_kind[span["kind"]] = round(by_kind.get(span["kind"], 0) + duration, 1)
+        return {
+            "request_id": self.request_id,
+            "total_ms": self.total_ms,
+            "ttft_ms": self.marks.get("first_token"),
+            "nodes_ms": nodes,
+            "kinds_ms": by_kind,
+            "llm_calls": sum(1 for s in self.spans.values() if s["kind"] == "llm"),
+            "tool_calls": sum(1 for s in self.spans.values() if s["kind"] == "tool"),
+        }
+
+    def tree(self) -> List[dict]:
+        """嵌套 span 树，用于离线分析慢请求"""
+        self.finish()
+        children: Dict[Optional[str], List[dict]] = {}
+        for span in sorted(self.spans.values(), key=lambda s: s["start_ms"]):
+            children.setdefault(span["parent"], []).append(span)
+
+        def build(span: dict) -> dict:
+            node = {k: v for k, v in span.items() if k not in ("id", "parent") and v is not None}
+            node["duration_ms"] = self._duration(span)
+            kids = [build(c) for c in children.get(span["id"], [])]
+            if kids:
+                node["children"] = kids
+            return node
+
+        return [build(span) for span in children.get(None, [])]
+
+    def emit_log(self):
+        self.finish()
+        if not TRACE_LOG or self.total_ms < TRACE_LOG_SLOW_MS:
+            return
+        record = {"type": "request_trace", "thread_id": self.thread_id, **self.summary(),
+                  "marks": self.marks, "notes": self.notes, "spans": self.tree()}
+        # JSON 格式的日志处理器直接展开 payload；文本格式下整条记录序列化为消息
+        trace_logger.info(json.dumps(record, ensure_ascii=False, default=str), extra={"payload": record})
+
+
+def note(name: str, **attrs):
+    """在当前请求的 trace 上记录一个事件 (没有 trace 时忽略)"""
+    trace = current_trace.get()
+    if trace is not None:
+        trace.note(name, **attrs)
+
+
+@contextmanager
+def span(name: str, kind: str, **attrs):
+    trace = current_trace.get()
+    if trace is None:
+        yield
+        return
+    with trace.span(name, kind, **attrs):
+        yield
+
+
+def instrument_checkpointer(saver):
+    """为检查点读写计时：包装实例上的异步方法，只在有当前 trace 时记录"""
+    if getattr(saver, "_traced", False):
+        return saver
+    for method in ("aget_tuple", "aput", "aput_writes"):
+        original = getattr(saver, method, None)
+        if original is None:
+            continue
+
+        def wrap(fn, method_name):
+            async def traced(*args, **kwargs):
+                with span(f"checkpoint.{method_name}", "db"):
+                    return await fn(*args, **kwargs)
+            return traced
+
+        setattr(saver, method, wrap(original, method))
+    saver._traced = True
+    return saver
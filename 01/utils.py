@@ -2,16 +2,26 @@
 Author: Yunpeng Shi
 Description: 工具类 - 包含 LLM 初始化、向量库连接及通用常量 (修复 RAG 卡顿版)
 '''
+import asyncio
 import logging
 import os
 import sys
+import threading
 from functools import lru_cache
 
+import circuit_breaker
+import embedding_backends
+import embedding_service
+import embedding_sidecar
+import logging_config
+import metrics
+import model_registry
+import startup
+import vector_index
 from dotenv import find_dotenv, load_dotenv
-# 新增：引入 HuggingFace 和 Milvus 依赖
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_milvus import Milvus
-from langchain_openai import ChatOpenAI
+from state import complete_task
+
+# 注意：langchain_openai / langchain_milvus 导入较慢，均在首次使用时才导入 (见 get_llm / get_vector_store)
 
 # --- 1. 环境变量加载 ---
 env_path = find_dotenv()
@@ -30,15 +40,8 @@ if not api_base:
     api_base = "https://api.deepseek.com"
 
 # --- 2. 日志配置 ---
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - [%(threadName)s] - %(message)s',
-    handlers=[
-        logging.FileHandler("agent_system.log"),
-        logging.StreamHandler()
-    ]
-)
-logger = logging.getLogger("MetroAgent")
+# 日志经内存队列交给后台线程写盘 (按大小轮转)，业务代码与事件循环不再直接做文件 I/O
+logger = logging_config.setup_logging()
 
 # --- 3. 常量定义 ---
 WORKERS_INFO = {
@@ -47,64 +50,182 @@ WORKERS_INFO = {
     "general_chat": "负责处理通用问答、规章制度查询、RAG检索等任务。",
 }
 
-# --- 4. LLM 初始化 ---
-try:
-    llm = ChatOpenAI(
-        model="deepseek-chat",
-        openai_api_key=api_key,
-        openai_api_base=api_base,
-        temperature=0,
-        max_retries=3,
-        timeout=60,
-    )
-    logger.info(f"LLM 初始化成功 (Base: {api_base})")
-except Exception as e:
-    logger.error(f"LLM 初始化失败: {e}")
-    raise e
+# --- 4. LLM 初始化 (延迟创建) ---
+def get_llm(node=None):
+    """
+    按节点所属角色 (supervisor / workers / responder / title) 返回模型，配置见 model_registry.py；
+    首次访问时才导入 langchain_openai 并创建模型，缩短 import utils 的耗时。
+    节点若在 LLM_HEDGE_NODES 中则返回带对冲请求的包装模型 (见 llm_hedging.py)
+    """
+    try:
+        return model_registry.registry.for_node(node)
+    except Exception as e:
+        logger.error(f"LLM 初始化失败: {e}")
+        raise e
+
+def __getattr__(name):
+    # 兼容原有的 utils.llm 访问方式
+    if name == "llm":
+        return get_llm()
+    raise AttributeError(f"module 'utils' has no attribute {name!r}")
 
 # --- 5. 辅助函数 ---
 
 # 【核心修复 1】使用全局变量或 lru_cache 缓存 Embedding 模型
 # 防止每次请求都重新加载模型导致卡顿
 _cached_embeddings = None
+_embeddings_lock = threading.Lock()
+
+def load_local_embeddings():
+    """在当前进程内加载 Embedding 模型 (也是 sidecar 不可用时的兜底)"""
+    # 优先尝试本地模型路径
+    # 注意：确保 download_bge.py 下载的路径与此一致
+    model_path, backend = embedding_backends.resolve_model()
+
+    logger.info(f"正在加载 Embedding 模型: {model_path} (后端: {backend}) ...")
+    # 并发查询在专用执行器中合并成批推理，不阻塞事件循环
+    embeddings = embedding_service.load_embeddings(model_path, backend)
+    logger.info("✅ Embedding 模型加载完成")
+    return embeddings
 
 def get_embeddings():
     global _cached_embeddings
     if _cached_embeddings:
         return _cached_embeddings
-    
-    # 优先尝试本地模型路径
-    # 注意：确保 download_bge.py 下载的路径与此一致
-    model_path = "./models/bge-small-zh-v1.5"
-    
-    if not os.path.exists(model_path):
-        logger.warning(f"⚠️ 本地模型未找到: {model_path}，尝试使用默认 all-MiniLM-L6-v2 (可能需要下载)")
-        model_path = "sentence-transformers/all-MiniLM-L6-v2"
-    
-    logger.info(f"正在加载 Embedding 模型: {model_path} ...")
-    try:
-        _cached_embeddings = HuggingFaceEmbeddings(
-            model_name=model_path,
-            model_kwargs={'device': 'cpu'}, # Docker 内通常用 CPU
-            encode_kwargs={'normalize_embeddings': True}
-        )
-        logger.info("✅ Embedding 模型加载完成")
-        return _cached_embeddings
-    except Exception as e:
-        logger.error(f"❌ 模型加载失败: {e}")
-        return None
+
+    # 启动预热与首个请求可能同时触发加载，加锁保证只加载一次
+    with _embeddings_lock:
+        if _cached_embeddings:
+            return _cached_embeddings
+        try:
+            if embedding_sidecar.SIDECAR_SOCKET:
+                # 多个 uvicorn worker 共用 sidecar 进程中的同一份模型，本进程只在 sidecar 不可用时才加载
+                logger.info(f"Embedding 使用共享 sidecar: {embedding_sidecar.SIDECAR_SOCKET}")
+                _cached_embeddings = embedding_sidecar.SidecarEmbeddings(
+                    embedding_sidecar.SIDECAR_SOCKET, fallback_factory=load_local_embeddings
+                )
+            else:
+                _cached_embeddings = load_local_embeddings()
+            return _cached_embeddings
+        except Exception as e:
+            logger.error(f"❌ 模型加载失败: {e}")
+            return None
 
 def update_task_result(task, result):
-    """更新任务状态的辅助函数"""
-    task['status'] = 'done'
-    task['result'] = result
+    """标记任务完成，返回 Worker 需要写回的状态更新 (task_board，长结果另有 task_results)"""
     logger.info(f"任务完成: ID={task.get('id')} 类型={task.get('task_type')}")
-    return task
+    return complete_task(task, result)
+
+# 知识库构建日志，build_knowledge.py 每次重建后都会重写该文件
+KNOWLEDGE_INDEX_LOG = "./data/indexed_files.json"
+
+def knowledge_index_version():
+    """以构建日志的修改时间作为知识库版本号，重建索引后检索缓存自动失效"""
+    try:
+        return os.path.getmtime(KNOWLEDGE_INDEX_LOG)
+    except OSError:
+        return None
+
+def knowledge_result_cacheable(result: str) -> bool:
+    """知识库不可用、检索异常时返回的提示不进入缓存"""
+    return not any(marker in result for marker in ("系统提示", "系统错误", "查询异常"))
+
+_cached_vector_store = None
+_vector_store_lock = threading.Lock()
+
+# Milvus 不可用时的熔断器：熔断期间不再尝试连接/检索，直接使用本地快照或返回“暂时不可用”
+vector_breaker = circuit_breaker.get("vector_store")
+# 单次向量检索的超时 (秒)，超时计为一次失败
+VECTOR_SEARCH_TIMEOUT = float(os.getenv("VECTOR_SEARCH_TIMEOUT", "5"))
+# 本地 FAISS 快照 (build_knowledge.py 建库时生成)：<目录>/<索引名>.faiss + .pkl，目录置空则不降级。
+# 默认指向仓库根目录的 data/vector_store (与服务的启动目录无关)，索引名与 Milvus 集合名一致
+VECTOR_STORE_SNAPSHOT_DIR = os.getenv(
+    "VECTOR_STORE_SNAPSHOT_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "vector_store"),
+)
+VECTOR_STORE_SNAPSHOT_INDEX = os.getenv("VECTOR_STORE_SNAPSHOT_INDEX", "metro_knowledge")
+# 降级到快照时附在检索结果后的提示；含“系统提示”，不会进入工具缓存
+SNAPSHOT_NOTE = "系统提示：主知识库暂时不可用，以上结果来自本地快照，可能不是最新版本。"
+
+_snapshot_store = None
+_snapshot_loaded = False
 
 def get_vector_store():
     """
     获取 Milvus 向量数据库实例 (Docker 适配版)
+    连接成功后缓存实例，启动预热建立的连接可被后续请求复用；连接失败不缓存，下次请求重试
+    熔断期间不再尝试连接，直接返回本地快照 (没有快照时返回 None)
     """
+    global _cached_vector_store
+    if not vector_breaker.allow():
+        return get_snapshot_store()
+    if _cached_vector_store is not None:
+        return _cached_vector_store
+
+    with _vector_store_lock:
+        if _cached_vector_store is not None:
+            return _cached_vector_store
+        vector_db = _connect_vector_store()
+    return vector_db if vector_db is not None else get_snapshot_store()
+
+def get_snapshot_store():
+    """首次使用时加载本地 FAISS 快照并缓存；未安装 faiss 或快照不存在时返回 None"""
+    global _snapshot_store, _snapshot_loaded
+    if _snapshot_loaded:
+        return _snapshot_store
+    with _vector_store_lock:
+        if _snapshot_loaded:
+            return _snapshot_store
+        _snapshot_loaded = True
+        index_file = os.path.join(VECTOR_STORE_SNAPSHOT_DIR, f"{VECTOR_STORE_SNAPSHOT_INDEX}.faiss")
+        if not VECTOR_STORE_SNAPSHOT_DIR or not os.path.exists(index_file):
+            return None
+        embeddings = get_embeddings()
+        if not embeddings:
+            return None
+        try:
+            with startup.timed("import", "faiss"):
+                from langchain_community.vectorstores import FAISS
+            # 快照由本项目的 build_knowledge.py 生成，docstore 为 pickle 格式
+            _snapshot_store = FAISS.load_local(VECTOR_STORE_SNAPSHOT_DIR, embeddings,
+                                               index_name=VECTOR_STORE_SNAPSHOT_INDEX,
+                                               allow_dangerous_deserialization=True)
+            logger.info(f"已加载本地向量库快照: {index_file}")
+        except Exception as e:
+            logger.error(f"❌ 本地向量库快照加载失败: {e}")
+        return _snapshot_store
+
+def vector_store_status() -> dict:
+    """熔断器状态与本地快照情况，供 /health 展示"""
+    return {**vector_breaker.snapshot(), "snapshot_dir": VECTOR_STORE_SNAPSHOT_DIR or None,
+            "snapshot_loaded": _snapshot_store is not None}
+
+def is_snapshot_store(store) -> bool:
+    return store is not None and store is _snapshot_store
+
+async def search_vector_store(store, search):
+    """
+    在 store 上执行 search(store)，返回 (结果, 是否来自本地快照)。
+    Milvus 上的检索结果反馈给熔断器并受 VECTOR_SEARCH_TIMEOUT 限制；失败时若有本地快照则改在快照上重试
+    """
+    if is_snapshot_store(store):
+        metrics.incr("vector_store_fallback")
+        return await search(store), True
+    try:
+        result = await asyncio.wait_for(search(store), VECTOR_SEARCH_TIMEOUT)
+    except Exception as e:
+        vector_breaker.record_failure(e)
+        snapshot = get_snapshot_store()
+        if snapshot is None:
+            raise
+        logger.warning(f"向量检索失败，改用本地快照: {e!r}")
+        metrics.incr("vector_store_fallback")
+        return await search(snapshot), True
+    vector_breaker.record_success()
+    return result, False
+
+def _connect_vector_store():
+    global _cached_vector_store
     embeddings = get_embeddings()
     if not embeddings:
         return None
@@ -125,14 +246,22 @@ def get_vector_store():
     collection_name = "metro_knowledge"
     
     try:
+        with startup.timed("import", "langchain_milvus"):
+            from langchain_milvus import Milvus
         # 尝试连接
         vector_db = Milvus(
             embedding_function=embeddings,
             collection_name=collection_name,
             connection_args=connection_args,
-            auto_id=True
+            auto_id=True,
+            # 检索参数 (ef / nprobe 等) 与建库时的索引类型保持一致，见 vector_index.py
+            index_params=vector_index.index_params(),
+            search_params=vector_index.search_params(),
         )
+        _cached_vector_store = vector_db
+        vector_breaker.record_success()
         return vector_db
     except Exception as e:
         logger.error(f"❌ 向量库连接失败 (Host: {milvus_host}:{milvus_port}): {e}")
+        vector_breaker.record_failure(e)
         return None
\ No newline at end of file
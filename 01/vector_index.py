@@ -0,0 +1,101 @@
+'''
+Author: Yunpeng Shi
+Description: 向量索引与检索参数 - 建库 (build_knowledge.py) 与查询 (utils.get_vector_store) 共用同一份配置，
+             可选 HNSW / IVF 系列 / FLAT / AUTOINDEX，并调节 ef、nprobe 等参数；
+             benchmarks/tune_index.py 基于这里的工具函数扫描参数，给出 recall@k 与延迟的取舍
+
+配置 (环境变量):
+    VECTOR_INDEX_TYPE=AUTOINDEX          HNSW | IVF_FLAT | IVF_SQ8 | IVF_PQ | FLAT | AUTOINDEX
+    VECTOR_METRIC=L2                     bge 输出已归一化，L2 与余弦排序一致
+    VECTOR_INDEX_PARAMS='{"M": 16}'      覆盖建索引参数 (JSON)
+    VECTOR_SEARCH_PARAMS='{"ef": 64}'    覆盖检索参数 (JSON)
+'''
+import json
+import math
+import os
+from typing import Dict, List, Optional
+
+import numpy as np
+
+VECTOR_INDEX_TYPE = os.getenv("VECTOR_INDEX_TYPE", "AUTOINDEX").upper()
+VECTOR_METRIC = os.getenv("VECTOR_METRIC", "L2").upper()
+VECTOR_INDEX_PARAMS = os.getenv("VECTOR_INDEX_PARAMS", "")
+VECTOR_SEARCH_PARAMS = os.getenv("VECTOR_SEARCH_PARAMS", "")
+
+# 各索引类型的默认建索引参数；IVF 的 nlist 未指定时按数据量估算
+DEFAULT_INDEX_PARAMS: Dict[str, dict] = {
+    "HNSW": {"M": 16, "efConstruction": 200},
+    "IVF_FLAT": {},
+    "IVF_SQ8": {},
+    "IVF_PQ": {"m": 16, "nbits": 8},
+    "FLAT": {},
+    "AUTOINDEX": {},
+}
+# 各索引类型的默认检索参数
+DEFAULT_SEARCH_PARAMS: Dict[str, dict] = {
+    "HNSW": {"ef": 64},
+    "IVF_FLAT": {"nprobe": 16},
+    "IVF_SQ8": {"nprobe": 16},
+    "IVF_PQ": {"nprobe": 16},
+    "FLAT": {},
+    "AUTOINDEX": {},
+}
+# 调参工具默认扫描的检索参数
+DEFAULT_SWEEPS: Dict[str, Dict[str, List[int]]] = {
+    "HNSW": {"ef": [16, 32, 64, 128, 256]},
+    "IVF_FLAT": {"nprobe": [1, 4, 8, 16, 32, 64]},
+    "IVF_SQ8": {"nprobe": [1, 4, 8, 16, 32, 64]},
+    "IVF_PQ": {"nprobe": [1, 4, 8, 16, 32, 64]},
+}
+
+
+def _json_env(value: str) -> dict:
+    return json.loads(value) if value else {}
+
+
+def suggested_nlist(num_vectors: Optional[int]) -> int:
+    """IVF 经验值：nlist ≈ 4·√n，限制在 [16, 65536]"""
+    if not num_vectors:
+        return 1024
+    return int(min(65536, max(16, 4 * math.sqrt(num_vectors))))
+
+
+def index_params(index_type: Optional[str] = None, overrides: Optional[dict] = None,
+                 num_vectors: Optional[int] = None, metric: str = VECTOR_METRIC) -> dict:
+    index_type = (index_type or VECTOR_INDEX_TYPE).upper()
+    if index_type not in DEFAULT_INDEX_PARAMS:
+        raise ValueError(f"不支持的索引类型: {index_type}")
+    params = dict(DEFAULT_INDEX_PARAMS[index_type])
+    if index_type.startswith("IVF"):
+        params["nlist"] = suggested_nlist(num_vectors)
+    params.update(_json_env(VECTOR_INDEX_PARAMS) if overrides is None else overrides)
+    return {"metric_type": metric, "index_type": index_type, "params": params}
+
+
+def search_params(index_type: Optional[str] = None, overrides: Optional[dict] = None,
+                  metric: str = VECTOR_METRIC) -> dict:
+    index_type = (index_type or VECTOR_INDEX_TYPE).upper()
+    params = dict(DEFAULT_SEARCH_PARAMS.get(index_type, {}))
+    params.update(_json_env(VECTOR_SEARCH_PARAMS) if overrides is None else overrides)
+    return {"metric_type": metric, "params": params}
+
+
+# --- 调参评估 ---
+def exact_top_k(corpus: np.ndarray, queries: np.ndarray, k: int, metric: str = VECTOR_METRIC) -> np.ndarray:
+    """暴力检索的真实 top-k (行号)，作为召回率基准"""
+    if metric == "L2":
+        scores = -((queries ** 2).sum(1)[:, None] - 2 * queries @ corpus.T + (corpus ** 2).sum(1)[None, :])
+    else:  # IP / COSINE (向量已归一化)
+        scores = queries @ corpus.T
+    k = min(k, corpus.shape[0])
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.take_along_axis(scores, top, axis=1).argsort(axis=1)[:, ::-1]
+    return np.take_along_axis(top, order, axis=1)
+
+
+def recall_at_k(results: List[List[int]], truth: np.ndarray, k: int) -> float:
+    """近似检索结果与真实 top-k 的平均重合比例"""
+    if not results:
+        return 0.0
+    hits = sum(len(set(found[:k]) & set(expected[:k].tolist())) for found, expected in zip(results, truth))
+    return hits / (len(results) * min(k, truth.shape[1]))
@@ -0,0 +1,94 @@
+'''
+Author: Yunpeng Shi
+Description: Worker 中间过程 (Title/Content 思考、工具调用与工具结果) 的旁路存储 -
+             Worker 不再把这些消息写入全局 messages，而是写入本轮的 worker_trace 通道；一轮结束后按该轮用户消息的 ID
+             存入 thread_traces 表 (memory 检查点后端存于进程内)，历史接口读取后插回对应位置展示。
+             messages 只保留用户输入与 Responder 的最终回复，检查点与后续各次 LLM 调用都不再携带中间消息
+'''
+import os
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from langchain_core.messages import BaseMessage, HumanMessage, messages_from_dict, messages_to_dict
+from psycopg.types.json import Jsonb
+
+TABLE_DDL = """
+CREATE TABLE IF NOT EXISTS thread_traces (
+    thread_id TEXT NOT NULL,
+    message_id TEXT NOT NULL,
+    messages JSONB NOT NULL,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY (thread_id, message_id)
+)
+"""
+
+# memory 后端最多保留的会话数，超出后淘汰最久未写入的会话 (批量问答每个问题都是一个新会话)
+TRACE_MEMORY_MAX_THREADS = int(os.getenv("TRACE_MEMORY_MAX_THREADS", "1000"))
+
+# memory 检查点后端：thread_id -> {用户消息 ID -> 中间消息}，按最近写入排序
+_memory: "OrderedDict[str, Dict[str, List[BaseMessage]]]" = OrderedDict()
+
+
+def turn_key(messages: List[BaseMessage]) -> Optional[str]:
+    """本轮的键：最后一条用户消息的 ID"""
+    for message in reversed(messages):
+        if isinstance(message, HumanMessage):
+            return message.id
+    return None
+
+
+async def setup(conn):
+    async with conn.cursor() as cur:
+        await cur.execute(TABLE_DDL)
+
+
+async def save(conn, thread_id: str, message_id: str, trace: List[BaseMessage]):
+    """conn 为 None 时 (memory 后端) 保存在进程内"""
+    if conn is None:
+        _memory.setdefault(thread_id, {})[message_id] = list(trace)
+        _memory.move_to_end(thread_id)
+        while len(_memory) > max(1, TRACE_MEMORY_MAX_THREADS):
+            _memory.popitem(last=False)
+        return
+    async with conn.cursor() as cur:
+        await cur.execute(
+            "INSERT INTO thread_traces (thread_id, message_id, messages) VALUES (%s, %s, %s) "
+            "ON CONFLICT (thread_id, message_id) DO UPDATE SET messages = EXCLUDED.messages",
+            (thread_id, message_id, Jsonb(messages_to_dict(trace))))
+
+
+async def save_turn(conn, thread_id: str, values: Dict[str, Any]):
+    """保存一轮结束时状态中的 worker_trace (下一轮开始时该通道会被 RESET)；没有中间消息时不写入"""
+    trace = values.get("worker_trace") or []
+    turn = turn_key(values.get("messages", []))
+    if trace and turn:
+        await save(conn, thread_id, turn, trace)
+
+
+async def load(conn, thread_id: str) -> Dict[str, List[BaseMessage]]:
+    if conn is None:
+        return dict(_memory.get(thread_id, {}))
+    async with conn.cursor() as cur:
+        await cur.execute("SELECT message_id, messages FROM thread_traces WHERE thread_id = %s", (thread_id,))
+        rows = await cur.fetchall()
+    return {message_id: messages_from_dict(data) for message_id, data in rows}
+
+
+async def delete(conn, thread_id: str):
+    if conn is None:
+        _memory.pop(thread_id, None)
+        return
+    async with conn.cursor() as cur:
+        await cur.execute("DELETE FROM thread_traces WHERE thread_id = %s", (thread_id,))
+
+
+def merge(messages: List[BaseMessage], traces: Dict[str, List[BaseMessage]]) -> List[BaseMessage]:
+    """把各轮的中间消息插回对应用户消息之后 (最终回复之前)，还原成旧版 messages 的排列"""
+    if not traces:
+        return list(messages)
+    merged: List[BaseMessage] = []
+    for message in messages:
+        merged.append(message)
+        if isinstance(message, HumanMessage) and message.id in traces:
+            merged.extend(traces[message.id])
+    return merged